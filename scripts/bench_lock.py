@@ -0,0 +1,102 @@
+"""Time lock settling and scan throughput of LaserControl against a simulated Solstis.
+
+A SimulatedSolstis runs in real time with a fixed seed and publishes to a SoftPV that the reader watches in
+monitor mode. Every step locks to the current wavenumber plus the step size and reports how long it takes to get
+within --tolerance and stay there for --hold seconds. A short scan then reports how much of every scan step is
+spent within tolerance of its target.
+
+    python scripts/bench_lock.py
+    python scripts/bench_lock.py --steps 0.001 0.01 0.05 --latency 0.1 --mode-hop-rate 0.01
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from control.sim_laser import SimulatedSolstis
+from control.server_reader import EMAServerReader
+from control.st_laser_control import LaserControl
+
+
+def settle(control, target, tolerance, hold, timeout):
+    """Wait until the wavenumber has stayed within tolerance of target for hold seconds
+
+    Return:
+        float: Time in seconds until it entered the band for good, None on timeout
+    """
+    start = time.monotonic()
+    entered = None
+    count = control.reader.sample_count
+    while time.monotonic() - start < timeout:
+        new_count = control.reader.wait_for_update(count, timeout=0.5)
+        if new_count is None:
+            continue
+        count = new_count
+        now = time.monotonic()
+        if abs(control.reader.get_latest_sample()[1] - target) <= tolerance:
+            entered = now if entered is None else entered
+            if now - entered >= hold:
+                return entered - start
+        else:
+            entered = None
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=float, nargs="+", default=[0.001, 0.01, -0.01], help="Lock steps in cm^-1")
+    parser.add_argument("--tolerance", type=float, default=2e-5, help="Settling band in cm^-1")
+    parser.add_argument("--hold", type=float, default=1., help="Time to stay in the band in seconds")
+    parser.add_argument("--timeout", type=float, default=30., help="Give up settling after this many seconds")
+    parser.add_argument("--scan-points", type=int, default=10, help="Points of the scan, 0 to skip it")
+    parser.add_argument("--scan-span", type=float, default=0.01, help="Scan range in cm^-1")
+    parser.add_argument("--time-per-point", type=float, default=2., help="Seconds per scan point")
+    parser.add_argument("--latency", type=float, default=0.05, help="Actuation dead time of the simulator in seconds")
+    parser.add_argument("--conversion", type=float, default=60., help="True tuner percent per cm^-1 of the simulator")
+    parser.add_argument("--mode-hop-rate", type=float, default=0., help="Mode hops per second of the simulator")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sim = SimulatedSolstis(latency=args.latency, conversion=args.conversion, mode_hop_rate=args.mode_hop_rate,
+                           seed=args.seed)
+    sim.start()
+    reader = EMAServerReader(sim.pv.pvname, acquisition_mode="monitor", source=sim.pv, time_source="local")
+    control = LaserControl(None, None, sim.pv.pvname, verbose=False, reader=reader, laser=sim)
+    try:
+        reader.wait_for_update(0, timeout=1.)
+        for step in args.steps:
+            target = reader.get_latest_sample()[1] + step
+            control.lock(target)
+            elapsed = settle(control, target, args.tolerance, args.hold, args.timeout)
+            result = f"{elapsed:.2f} s" if elapsed is not None else f"not within {args.timeout} s"
+            print(f"Step {step:+.5f} cm^-1: settled in {result}")
+            control.unlock()
+
+        if args.scan_points > 0:
+            start = reader.get_latest_sample()[1]
+            control.start_scan(start, start + args.scan_span, args.scan_points, args.time_per_point, 1)
+            t0 = time.monotonic()
+            in_band, total, count = 0, 0, reader.sample_count
+            while control.scan == 1:
+                new_count = reader.wait_for_update(count, timeout=0.5)
+                if new_count is None:
+                    continue
+                count = new_count
+                total += 1
+                in_band += abs(reader.get_latest_sample()[1] - control.target) <= args.tolerance
+            duration = time.monotonic() - t0
+            control.stop_tweaking()
+            print(f"Scan of {args.scan_points} points over {args.scan_span} cm^-1: {duration:.1f} s, "
+                  f"{args.scan_points / duration:.2f} points/s, {in_band / max(total, 1):.0%} of samples within tolerance")
+        estimate = control.get_conversion_estimate()
+        print(f"Conversion estimate: {estimate['conversion']:.2f} ({estimate['lower']:.2f} to {estimate['upper']:.2f}) "
+              f"after {estimate['updates']} updates, simulated {args.conversion}")
+        print(f"Simulated mode hops: {sim.mode_hops}")
+    finally:
+        control.stop()
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare four independent EMAServerReaders with one EMAMultiReader watching the same four PVs.
+
+Reports threads used, read requests made (one per PV and period for both), round trips (one per request for
+independent readers, one per batch of all PVs for a multi reader batching its CA gets), samples recorded and CPU
+time. Runs offline against SoftPVs unless --epics is given; SoftPVs are read with plain get() calls, so CA batching
+(batch_epics) is only exercised with --epics and offline the two differ in threads and CPU time only.
+
+    python scripts/bench_multi_reader.py --duration 10
+    python scripts/bench_multi_reader.py --epics --duration 30
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from control.server_reader import EMAServerReader
+from control.multi_reader import EMAMultiReader
+from control.soft_pv import SoftPV
+
+PV_NAMES = [f"LaserLab:wavenumber_{i}" for i in range(1, 5)]
+
+
+class CountingPV(SoftPV):
+    """SoftPV that counts get() calls and drifts a little on every call"""
+    def __init__(self, pvname, value):
+        super().__init__(pvname, value)
+        self.gets = 0
+
+    def get(self, *args, **kwargs):
+        self.gets += 1
+        self.value += 1e-5
+        return self.value
+
+
+def make_sources(epics):
+    if epics:
+        return None
+    return {name: CountingPV(name, 12000. + i) for i, name in enumerate(PV_NAMES)}
+
+
+def run(start, stop, duration):
+    threads_before = threading.active_count()
+    cpu, wall = time.process_time(), time.time()
+    start()
+    time.sleep(0.5)
+    threads = threading.active_count() - threads_before
+    time.sleep(duration - 0.5)
+    stop()
+    return threads, time.process_time() - cpu, time.time() - wall
+
+
+def bench_independent(args):
+    sources = make_sources(args.epics) or {}
+    readers = [EMAServerReader(name, reading_frequency=args.rate, source=sources.get(name), time_source="local")
+               for name in PV_NAMES]
+    threads, cpu, wall = run(lambda: [r.start_reading() for r in readers], lambda: [r.stop_reading() for r in readers],
+                             args.duration)
+    samples = sum(r.sample_count for r in readers)
+    requests = sum(pv.gets for pv in sources.values()) if sources else samples
+    return threads, requests, requests, samples, cpu, wall
+
+
+def bench_multi(args):
+    sources = make_sources(args.epics)
+    multi = EMAMultiReader(PV_NAMES, reading_frequency=args.rate, sources=sources, time_source="local")
+    threads, cpu, wall = run(multi.start_reading, multi.stop_reading, args.duration)
+    samples = sum(r.sample_count for r in multi.readers.values())
+    requests = sum(pv.gets for pv in sources.values()) if sources else multi.batches * len(PV_NAMES)
+    round_trips = multi.batches if multi.batch_epics else requests
+    return threads, requests, round_trips, samples, cpu, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10., help="Seconds to run each configuration")
+    parser.add_argument("--rate", type=float, default=0.1, help="Reading period in seconds")
+    parser.add_argument("--epics", action="store_true", help="Read the real LaserLab PVs instead of SoftPVs")
+    args = parser.parse_args()
+
+    if not args.epics:
+        print("Offline: SoftPVs are read one get() at a time, CA batching is not exercised")
+    print(f"{'':<22}{'threads':>8}{'requests':>10}{'round trips':>13}{'samples':>9}{'cpu (s)':>9}"
+          f"{'cpu/sample (us)':>17}")
+    for label, bench in (("4 x EMAServerReader", bench_independent), ("1 x EMAMultiReader", bench_multi)):
+        threads, requests, round_trips, samples, cpu, wall = bench(args)
+        print(f"{label:<22}{threads:>8}{requests:>10}{round_trips:>13}{samples:>9}{cpu:>9.3f}"
+              f"{cpu / max(samples, 1) * 1e6:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
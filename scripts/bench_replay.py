@@ -0,0 +1,81 @@
+"""Replay a recorded session through the real reader pipeline and time plotting, saving and statistics.
+
+The recording is streamed by a ReplaySource into an EMAServerReader in monitor mode that keeps the recorded time
+stamps, records to an Arrow session and is queried for plot history and rolling statistics while it runs.
+Without a file, a synthetic recording of --rows samples is generated first so it runs offline.
+
+    python scripts/bench_replay.py backup_20240101_000000_000.arrows
+    python scripts/bench_replay.py --rows 2000000 --speed 0
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from control.server_reader import EMAServerReader
+from control.replay_source import ReplaySource
+from control.session_recorder import SessionRecorder
+
+
+def make_recording(directory, rows):
+    """Write a synthetic 10 Hz recording of a locked laser with slow drift and noise"""
+    rng = np.random.default_rng(0)
+    times = 1.7e9 + 0.1 * np.arange(rows)
+    wnums = np.round(12000.12345 + 1e-5 * np.cumsum(rng.normal(0, 0.05, rows)) + rng.normal(0, 1e-5, rows), 5)
+    recorder = SessionRecorder(directory, "synthetic", fmt="arrow")
+    for start in range(0, rows, 100000):
+        recorder.write({"Time": times[start:start + 100000], "Wavenumber": wnums[start:start + 100000]})
+    recorder.close()
+    return recorder.files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="Recorded .arrows/.parquet/.csv files of one session")
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows of the synthetic recording")
+    parser.add_argument("--speed", type=float, default=0, help="Playback speed, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.paths or make_recording(directory, args.rows)
+        t0 = time.perf_counter()
+        source = ReplaySource(paths, speed=args.speed or None)
+        load = time.perf_counter() - t0
+        span = source.times[-1] - source.times[0] if len(source) else 0.
+        print(f"Loaded {len(source)} samples covering {span / 3600:.1f} h in {load:.2f} s")
+
+        reader = EMAServerReader(source.pvname, acquisition_mode="monitor", source=source, time_source="local",
+                                 timestamps="source", plot_limit=300)
+        reader.start_reading()
+        recorder = SessionRecorder(directory, "replayed", fmt="arrow")
+        reader.start_saving(os.path.join(directory, "replayed.arrows"), sink=recorder)
+
+        queries, query_time = 0, 0.
+        t0 = time.perf_counter()
+        source.start()
+        while not source.wait_done(0.1):
+            q0 = time.perf_counter()
+            reader.get_plot_history(86400, 2000)
+            reader.get_stats()
+            query_time += time.perf_counter() - q0
+            queries += 1
+        while reader.sample_count < len(source):
+            time.sleep(0.01)
+        replay = time.perf_counter() - t0
+        reader.stop_reading()
+        t0 = time.perf_counter()
+        stats = reader.get_saving_stats()
+        reader.stop_saving()
+        flush = time.perf_counter() - t0
+
+        print(f"Replayed in {replay:.2f} s: {len(source) / replay:,.0f} samples/s, {span / replay:,.0f}x real time")
+        print(f"Saving: {stats}, final flush {flush:.2f} s, {len(recorder.files)} file(s)")
+        print(f"Plot/stats queries during replay: {queries}, {query_time / max(queries, 1) * 1e3:.2f} ms each")
+        print(f"Rolling statistics at the end: {reader.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Search PID gains for the reference cavity loop on a model of the laser and optionally store the chosen ones.
+
+The model takes the conversion, dead time and noise stored for the laser (calibration and latency measurement)
+unless they are given. Every gain combination is simulated on a process pool over a few lock steps and noise
+seeds and scored on settling time, overshoot, RMS error and time inside the lock window. The Pareto set is printed
+and the gains picked from it are written to the laser's settings with --write, where LaserControl takes them from.
+
+    python scripts/tune_pid.py --tag wavenumber_1
+    python scripts/tune_pid.py --tag wavenumber_1 --dead-time 0.15 --kp 5 10 20 40 --write
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from control.config import load_laser_config
+from control.pid_tuner import CavityModel, search, pareto_front, choose, save_gains
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tag", default=None, help="Laser tag to take the model from and write the gains to")
+    parser.add_argument("--conversion", type=float, default=None, help="Tuner percent per cm^-1")
+    parser.add_argument("--dead-time", type=float, default=None, help="Actuation dead time in seconds")
+    parser.add_argument("--response-time", type=float, default=None, help="Tuner response time constant in seconds")
+    parser.add_argument("--period", type=float, default=None, help="Loop period in seconds")
+    parser.add_argument("--noise", type=float, default=None, help="Wavemeter noise in cm^-1")
+    parser.add_argument("--conversion-error", type=float, default=None, help="Relative error of the conversion")
+    parser.add_argument("--kp", type=float, nargs="+", default=[5., 10., 20., 30., 40., 60., 80.])
+    parser.add_argument("--ki", type=float, nargs="+", default=[0., 0.4, 0.8, 2., 5., 10.])
+    parser.add_argument("--kd", type=float, nargs="+", default=[0., 0.5, 2.])
+    parser.add_argument("--steps", type=float, nargs="+", default=[0.001, 0.01, -0.01], help="Lock steps in cm^-1")
+    parser.add_argument("--seeds", type=int, default=3, help="Noise seeds per step")
+    parser.add_argument("--duration", type=float, default=20., help="Simulated seconds per lock")
+    parser.add_argument("--workers", type=int, default=None, help="Processes; the number of CPUs by default")
+    parser.add_argument("--write", action="store_true", help="Store the chosen gains for --tag")
+    args = parser.parse_args()
+    if args.write and args.tag is None:
+        parser.error("--write needs --tag")
+
+    overrides = {name: value for name, value in [("conversion", args.conversion), ("dead_time", args.dead_time),
+                                                 ("response_time", args.response_time), ("period", args.period),
+                                                 ("noise", args.noise), ("conversion_error", args.conversion_error)]
+                 if value is not None}
+    config = load_laser_config(args.tag) if args.tag else {}
+    model = CavityModel.from_config(config, **overrides)
+    print("Model: " + ", ".join(f"{k}={v:g}" for k, v in model.to_dict().items()))
+
+    start = time.perf_counter()
+    results = search(model, args.kp, args.ki, args.kd, args.steps, args.seeds, args.duration, args.workers)
+    print(f"{len(results)} gain sets in {time.perf_counter() - start:.1f} s")
+    front = pareto_front(results)
+    chosen = choose(front)
+    print(f"{'kp':>8}{'ki':>8}{'kd':>8}{'settle s':>10}{'overshoot':>12}{'rms':>12}{'in window':>11}")
+    for r in front:
+        mark = " *" if r is chosen else ""
+        print(f"{r['kp']:8g}{r['ki']:8g}{r['kd']:8g}{r['settling_time']:10.2f}{r['overshoot']:12.2e}"
+              f"{r['rms']:12.2e}{r['in_window']:11.3f}{mark}")
+    if args.write and chosen is not None:
+        save_gains(args.tag, chosen, model)
+        print(f"Stored kp={chosen['kp']:g} ki={chosen['ki']:g} kd={chosen['kd']:g} for {args.tag}")
+
+
+if __name__ == "__main__":
+    main()
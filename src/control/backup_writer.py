@@ -0,0 +1,235 @@
+import pyarrow as pa
+import pyarrow.csv as pc
+import csv
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+
+class CsvSink:
+    """Sink that appends batches of samples to a CSV file, writing the header only if the file is new. A file whose
+    header has other columns is not appended to; the samples go to the next free numbered file next to it instead"""
+    def __init__(self, path: str, columns):
+        """Constructor function that opens the file for appending
+
+        Args:
+            path(str): Path of the CSV file
+            columns(list): Column names, in the order of the values passed to BackupWriter.put
+        """
+        self.columns = list(columns)
+        base, ext = os.path.splitext(path)
+        index = 0
+        while read_csv_header(path) not in (None, self.columns):
+            index += 1
+            path = f"{base}_{index}{ext}"
+        if index:
+            print(f"{base}{ext} has other columns than {self.columns}, saving to {path}")
+        self.path = path
+        self.file = open(path, 'ab')
+        self.include_header = self.file.tell() == 0
+
+    def write(self, data):
+        """Append one batch to the file
+
+        Arg:
+            data(dict): Column name to np.ndarray of values
+
+        Return:
+            int: Number of bytes written
+        """
+        table = pa.table({name: data[name] for name in self.columns})
+        start = self.file.tell()
+        pc.write_csv(table, self.file, write_options=pc.WriteOptions(include_header=self.include_header))
+        self.file.flush()
+        self.include_header = False
+        return self.file.tell() - start
+
+    def sync(self):
+        """Force the written data to the disk"""
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        """Close the file"""
+        self.file.close()
+
+
+def read_csv_header(path: str):
+    """Arg:
+        path(str): Path of a CSV file
+
+    Return:
+        list: Column names in the first line of the file, None if the file does not exist or is empty
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, newline='') as f:
+        return next(csv.reader(f), None)
+
+
+class BackupWriter:
+    """Writer stage that takes samples from the reader through a bounded queue and writes them to a sink on its own thread.
+
+    The reader only calls put(), which never blocks and never touches the filesystem. If the queue is full the sample
+    is dropped and counted. Batches are flushed when batch_size samples are waiting or flush_interval seconds have passed.
+    While the sink fails, the samples are kept and retried every flush_interval seconds, up to max_retained of them;
+    newer ones are dropped and counted."""
+    def __init__(self, sink, columns=("Time", "Wavenumber"), max_queue: int = 100000, batch_size: int = 1000,
+                 flush_interval: float = 30., fsync_policy: str = "interval", fsync_interval: float = 60.,
+                 max_delay: float = None, max_retained: int = None, verbose: bool = False):
+        """Constructor function that initializes the writer
+
+        Args:
+            sink: Object with write(data), sync() and close(), e.g. CsvSink
+            columns(list): Column names, in the order of the values passed to put
+            max_queue(int): Capacity of the queue between the reader and the writer
+            batch_size(int): Number of samples that triggers a flush
+            flush_interval(float): Maximum time in seconds between flushes
+            fsync_policy(str): "always" to fsync after every flush, "interval" to fsync every fsync_interval seconds, "never" to leave it to the OS
+            fsync_interval(float): Time in seconds between fsyncs for the "interval" policy
+            max_delay(float): A sample written later than this many seconds after put is counted as delayed; twice flush_interval if None
+            max_retained(int): Number of unwritten samples kept while the sink fails; max_queue if None
+            verbose(bool): Specifies whether to print message on the back end
+        """
+        if fsync_policy not in ("always", "interval", "never"):
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        self.sink = sink
+        self.columns = list(columns)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.max_delay = 2 * flush_interval if max_delay is None else max_delay
+        self.max_retained = max_queue if max_retained is None else max_retained
+        self.verbose = verbose
+        self.rows = []
+        self.enqueued_at = []
+        self.written = 0
+        self.dropped = 0  # counted by put() on the caller's thread and by the writing thread
+        self.dropped_lock = threading.Lock()
+        self.delayed = 0
+        self.errors = 0
+        self.failing = False  # the last flush failed; retry by time only
+        self.max_latency = 0.
+        self.bytes_written = 0
+        self.last_flush = time.monotonic()
+        self.last_sync = time.monotonic()
+        self.writing_thread = None
+        self.is_writing = False
+
+    def put(self, *row):
+        """Queue one sample for writing without blocking
+
+        Arg:
+            row(float): One value per column
+
+        Return:
+            bool: False if the queue was full and the sample was dropped
+        """
+        try:
+            self.queue.put_nowait((time.monotonic(), row))
+            return True
+        except queue.Full:
+            self._count_dropped(1)
+            return False
+
+    def start(self):
+        """Start the writing thread"""
+        if self.is_writing:
+            return
+        self.is_writing = True
+        self.writing_thread = threading.Thread(target=self._writing_loop, daemon=True)
+        self.writing_thread.start()
+
+    def stop(self):
+        """Write everything still queued, close the sink and catch the writing thread"""
+        self.is_writing = False
+        if self.writing_thread:
+            self.writing_thread.join()
+            self.writing_thread = None
+        self.sink.close()
+
+    def _writing_loop(self):
+        """Loop to collect queued samples and flush them by size or time"""
+        while self.is_writing or not self.queue.empty():
+            timeout = max(0., self.flush_interval - (time.monotonic() - self.last_flush))
+            try:
+                enqueued, row = self.queue.get(timeout=min(timeout, 0.5))
+                if len(self.rows) < self.max_retained:
+                    self.rows.append(row)
+                    self.enqueued_at.append(enqueued)
+                else:
+                    self._count_dropped(1)
+            except queue.Empty:
+                pass
+            full = len(self.rows) >= self.batch_size and not self.failing
+            if full or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+        self.flush()
+        self.sync()
+        # What the sink did not take by now is lost
+        self._count_dropped(len(self.rows))
+        self.rows, self.enqueued_at = [], []
+
+    def _count_dropped(self, count: int):
+        """Arg:
+            count(int): Number of samples lost
+        """
+        with self.dropped_lock:
+            self.dropped += count
+
+    def flush(self):
+        """Write the collected samples to the sink. On failure they are kept, up to max_retained, and retried at the
+        next flush"""
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        values = np.array(self.rows, dtype=np.float64).reshape(len(self.rows), len(self.columns))
+        data = {name: values[:, i] for i, name in enumerate(self.columns)}
+        try:
+            self.bytes_written += self.sink.write(data)
+        except Exception as e:
+            self.errors += 1
+            self.failing = True
+            if self.verbose:
+                print(f"Error writing backup data: {e}")
+            return
+        self.failing = False
+        now = time.monotonic()
+        latencies = now - np.array(self.enqueued_at)
+        self.delayed += int(np.count_nonzero(latencies > self.max_delay))
+        self.max_latency = max(self.max_latency, float(latencies.max()))
+        self.written += len(self.rows)
+        self.rows, self.enqueued_at = [], []
+        if self.fsync_policy == "always" or (self.fsync_policy == "interval" and now - self.last_sync >= self.fsync_interval):
+            self.sync()
+        if self.verbose:
+            print(f"Data being saved by {type(self.sink).__name__}")
+
+    def sync(self):
+        """Force the written data to the disk unless the policy is "never" """
+        if self.fsync_policy == "never":
+            return
+        try:
+            self.sink.sync()
+        except Exception as e:
+            self.errors += 1
+            if self.verbose:
+                print(f"Error syncing backup data: {e}")
+        self.last_sync = time.monotonic()
+
+    def get_stats(self):
+        """Get the state of the writer
+
+        Return:
+            dict: queue depth, numbers of written, dropped and delayed samples, write errors, worst latency in seconds and bytes written
+        """
+        return {"queue_depth": self.queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "delayed": self.delayed,
+                "errors": self.errors,
+                "max_latency": self.max_latency,
+                "bytes_written": self.bytes_written}
@@ -20,3 +20,70 @@ class ControlLoop(ABC):
     @abstractmethod
     def stop(self):
         pass
+
+
+class WavenumberSource(ABC):
+    """Interface of a wavenumber source for EMAServerReader. epics.PV fits it as is; SoftPV and ReplaySource
+    implement it to run the reader without the lab network.
+
+    Monitor callbacks are called with the keywords pvname, value and timestamp, like pyepics does."""
+    pvname = None
+    timestamp = None
+    connected = True
+
+    @abstractmethod
+    def get(self):
+        pass
+
+    @abstractmethod
+    def add_callback(self, callback):
+        pass
+
+    @abstractmethod
+    def remove_callback(self, index):
+        pass
+
+    def wait_for_connection(self, timeout=None):
+        return self.connected
+
+
+class LaserBackend(ABC):
+    """Interface of the laser operations LaserControl uses. SolstisBackend talks to a real M2 Solstis through
+    pylablib; SimulatedSolstis models one to run the control loop, scans and the UI offline.
+
+    Tuner values are in percent, lock statuses are the strings pylablib reports ("on", "off", ...)."""
+    @abstractmethod
+    def lock_etalon(self):
+        pass
+
+    @abstractmethod
+    def unlock_etalon(self):
+        pass
+
+    @abstractmethod
+    def lock_reference_cavity(self):
+        pass
+
+    @abstractmethod
+    def unlock_reference_cavity(self):
+        pass
+
+    @abstractmethod
+    def tune_reference_cavity(self, value, sync=True):
+        pass
+
+    @abstractmethod
+    def tune_etalon(self, value, sync=True):
+        pass
+
+    @abstractmethod
+    def get_full_web_status(self):
+        pass
+
+    @abstractmethod
+    def get_etalon_lock_status(self):
+        pass
+
+    @abstractmethod
+    def get_reference_cavity_lock_status(self):
+        pass
@@ -0,0 +1,169 @@
+import threading
+import time
+import numpy as np
+
+
+def sweep_points(center: float, span: float, points: int, cycles: int = 1):
+    """Tuner values of an up/down sweep
+
+    Args:
+        center(float): Center of the sweep in tuner percent
+        span(float): Full width of the sweep in tuner percent
+        points(int): Points per direction
+        cycles(int): Number of up/down cycles
+
+    Returns:
+        np.ndarray: Tuner values in sweep order
+        np.ndarray: Direction of the move that reached every point from the one before (the first from the
+            center), +1 up and -1 down; a turning point repeated without a move stays on the branch it was reached on
+    """
+    up = np.linspace(center - span / 2, center + span / 2, points)
+    tuners = np.tile(np.concatenate([up, up[::-1]]), cycles)
+    moves = np.sign(np.diff(tuners, prepend=center))
+    directions = np.empty(len(tuners))
+    direction = -1.
+    for i, move in enumerate(moves):
+        if move != 0:
+            direction = move
+        directions[i] = direction
+    return tuners, directions
+
+
+def fit_calibration(tuners, wnums, directions, center: float = None):
+    """Fit wavenumber = offset + gain * (tuner - center) + direction * hysteresis / 2 by least squares
+
+    Args:
+        tuners(np.ndarray): Tuner values in percent
+        wnums(np.ndarray): Settled wavenumbers in cm^-1
+        directions(np.ndarray): +1 for points reached tuning up, -1 tuning down
+        center(float): Tuner value the offset refers to; the mean tuner value if None
+
+    Return:
+        dict: gain (cm^-1 per percent), offset (cm^-1 at center), hysteresis (cm^-1 between the up and down
+        branches), conversion (percent per cm^-1, -1 / gain), center, residual_std and standard errors
+    """
+    tuners = np.asarray(tuners, dtype=np.float64)
+    wnums = np.asarray(wnums, dtype=np.float64)
+    directions = np.asarray(directions, dtype=np.float64)
+    if center is None:
+        center = float(tuners.mean())
+    # Wavenumbers relative to their mean keep the fit precise around 1e4 cm^-1
+    ref = wnums.mean()
+    design = np.column_stack([np.ones_like(tuners), tuners - center, directions / 2])
+    coef, _, rank, _ = np.linalg.lstsq(design, wnums - ref, rcond=None)
+    if rank < 3:
+        raise ValueError("Calibration sweep does not determine gain, offset and hysteresis")
+    residuals = wnums - ref - design @ coef
+    dof = max(len(wnums) - 3, 1)
+    residual_std = float(np.sqrt(residuals @ residuals / dof))
+    errors = residual_std * np.sqrt(np.diag(np.linalg.inv(design.T @ design)))
+    offset, gain, hysteresis = coef
+    return {"gain": float(gain),
+            "offset": float(offset + ref),
+            "hysteresis": float(hysteresis),
+            "conversion": float(-1. / gain) if gain != 0 else float("inf"),
+            "center": float(center),
+            "residual_std": residual_std,
+            "gain_error": float(errors[1]),
+            "offset_error": float(errors[0]),
+            "hysteresis_error": float(errors[2]),
+            "points": int(len(wnums))}
+
+
+class CavityCalibration:
+    """Up/down sweep of the reference cavity tuner that fits gain, offset and hysteresis.
+
+    At every point the tuner is set and the response is awaited on the wavemeter update cadence: the first
+    discard updates after the command are dropped and the next average updates are averaged. Every wait has a
+    timeout, so the sweep takes at most max_duration seconds, and the ETA is refined from the measured pace."""
+    def __init__(self, tune, reader, center: float, span: float = 1., points: int = 11, cycles: int = 1,
+                 discard: int = 2, average: int = 3, update_timeout: float = 1., verbose: bool = False):
+        """Constructor function
+
+        Args:
+            tune(callable): Sets the reference cavity tuner and returns once the laser acknowledged it
+            reader(EMAServerReader): Reader of the wavemeter
+            center(float): Center of the sweep in tuner percent
+            span(float): Full width of the sweep in tuner percent
+            points(int): Points per direction
+            cycles(int): Number of up/down cycles
+            discard(int): Updates to drop after every tune while the laser responds
+            average(int): Updates to average at every point
+            update_timeout(float): Maximum time in seconds to wait for one update
+            verbose(bool): whether to print messages on the terminal
+        """
+        if points < 2 or discard < 0 or average < 1:
+            raise ValueError("Calibration needs at least 2 points and 1 averaged update")
+        self.tune = tune
+        self.reader = reader
+        self.center = center
+        self.tuners, self.directions = sweep_points(center, span, points, cycles)
+        self.discard = discard
+        self.average = average
+        self.update_timeout = update_timeout
+        self.verbose = verbose
+        self.wnums = np.full(len(self.tuners), np.nan)
+        self.done_points = 0
+        self.start_time = None
+        self.result = None
+        self.stop_event = threading.Event()
+
+    def get_max_duration(self):
+        """Return:
+            float: Upper bound of the sweep time in seconds, given the update timeout (tune time not included)
+        """
+        return len(self.tuners) * (self.discard + self.average) * self.update_timeout
+
+    def get_progress(self):
+        """Get the progress of the sweep
+
+        Return:
+            dict: done and total points, elapsed seconds and the ETA in seconds (None before the first point)
+        """
+        total = len(self.tuners)
+        elapsed = time.monotonic() - self.start_time if self.start_time is not None else 0.
+        eta = None
+        if self.done_points:
+            eta = elapsed / self.done_points * (total - self.done_points)
+        return {"done": self.done_points, "total": total, "elapsed": elapsed, "eta": eta}
+
+    def _settled_value(self):
+        """Wait for discard + average wavemeter updates and return the mean of the last average ones, NaN if the
+        updates do not come. Only real updates count, not polls that repeat the value from before the tune"""
+        values = []
+        count = self.reader.update_count
+        for i in range(self.discard + self.average):
+            new_count = self.reader.wait_for_new_value(count, timeout=self.update_timeout)
+            if new_count is None or self.stop_event.is_set():
+                break
+            count = new_count
+            if i >= self.discard:
+                values.append(self.reader.get_latest_update()[1])
+        return float(np.mean(values)) if values else np.nan
+
+    def run(self):
+        """Run the sweep and fit it; the tuner is set back to the center at the end
+
+        Return:
+            dict: Fit result, see fit_calibration, plus duration in seconds; None if stopped
+        """
+        self.start_time = time.monotonic()
+        try:
+            for i, tuner in enumerate(self.tuners):
+                if self.stop_event.is_set():
+                    return None
+                self.tune(float(tuner))
+                self.wnums[i] = self._settled_value()
+                self.done_points = i + 1
+                if self.verbose:
+                    print(f"Calibration point {i + 1}/{len(self.tuners)}: {tuner:.4f} % -> {self.wnums[i]:.5f} cm^-1")
+        finally:
+            self.tune(float(self.center))
+        valid = ~np.isnan(self.wnums)
+        self.result = fit_calibration(self.tuners[valid], self.wnums[valid], self.directions[valid], self.center)
+        self.result["duration"] = time.monotonic() - self.start_time
+        return self.result
+
+    def stop(self):
+        """Stop the sweep after the current point"""
+        self.stop_event.set()
@@ -0,0 +1,136 @@
+import math
+import numpy as np
+
+
+class ChangeFilter:
+    """Run-length filter that passes only samples whose value differs from the previous one.
+
+    Repeats of the same value (the server publishing slower than it is polled) are counted instead of stored. A run
+    is closed when a different value arrives and is then returned as (time of first sample, value, count), which is
+    enough to rebuild the original timeline with expand_runs."""
+    def __init__(self):
+        """Constructor function that starts without a run"""
+        self.reset()
+
+    def reset(self):
+        """Forget the current run, so the next sample starts a new one"""
+        self.run_time = None
+        self.run_value = None
+        self.run_count = 0
+
+    def add(self, t: float, value: float):
+        """Feed one sample
+
+        Args:
+            t(float): time stamp
+            value(float): sample value
+
+        Returns:
+            bool: True if the value differs from the previous sample
+            tuple: The run closed by this sample as (time, value, count), None if no run was closed
+        """
+        if value == self.run_value and self.run_value is not None:
+            if not self.run_count:
+                # The run was split, this repeat starts the next one
+                self.run_time = t
+            self.run_count += 1
+            return False, None
+        closed = self.current()
+        self.run_time, self.run_value, self.run_count = t, value, 1
+        return True, closed
+
+    def split(self):
+        """Close the current run without a new value, e.g. when the samples after it are labeled differently. The
+        next repeat of the value starts a new run, but is still not a new value
+
+        Return:
+            tuple: The closed run as (time, value, count), None if there was none
+        """
+        closed = self.current()
+        self.run_count = 0
+        return closed
+
+    def current(self):
+        """Get the run still open
+
+        Return:
+            tuple: (time, value, count) of the open run, None if there is none
+        """
+        if not self.run_count:
+            return None
+        return self.run_time, self.run_value, self.run_count
+
+
+def expand_runs(times, values, counts, interval: float):
+    """Rebuild the sampled timeline from run-length records
+
+    Args:
+        times(np.ndarray): Time of the first sample of every run
+        values(np.ndarray): Value of every run
+        counts(np.ndarray): Number of samples in every run
+        interval(float): Sampling interval in seconds the runs were recorded with
+
+    Returns:
+        np.ndarray: time stamps of all samples
+        np.ndarray: values of all samples
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    steps = np.arange(counts.sum()) - starts
+    return np.repeat(np.asarray(times, dtype=np.float64), counts) + steps * interval, np.repeat(values, counts)
+
+
+class PublishRateEstimator:
+    """Online estimate of the interval between real updates of a source and of its jitter.
+
+    Uses exponentially weighted mean and variance of the time between updates. Gaps longer than gap_factor times
+    the current estimate (e.g. a disconnection) are ignored once the estimate has warmed up."""
+    def __init__(self, smoothing: float = 0.05, warmup: int = 10, gap_factor: float = 10.):
+        """Constructor function
+
+        Args:
+            smoothing(float): Weight of a new interval in the estimate, between 0 and 1
+            warmup(int): Number of intervals averaged plainly before smoothing starts
+            gap_factor(float): Intervals longer than this many times the estimate are ignored
+        """
+        self.smoothing = smoothing
+        self.warmup = warmup
+        self.gap_factor = gap_factor
+        self.reset()
+
+    def reset(self):
+        """Forget all updates"""
+        self.last_time = None
+        self.count = 0
+        self.mean = 0.
+        self.var = 0.
+
+    def update(self, t: float):
+        """Feed the time of one real update
+
+        Arg:
+            t(float): time stamp of the update
+        """
+        last, self.last_time = self.last_time, t
+        if last is None:
+            return
+        dt = t - last
+        if dt <= 0 or (self.count >= self.warmup and dt > self.gap_factor * self.mean):
+            return
+        self.count += 1
+        # Plain running mean during warm-up, exponential smoothing afterwards
+        alpha = 1. / self.count if self.count <= self.warmup else self.smoothing
+        diff = dt - self.mean
+        self.mean += alpha * diff
+        self.var = (1 - alpha) * (self.var + alpha * diff * diff)
+
+    def get(self):
+        """Get the estimate
+
+        Returns:
+            float: Mean interval between updates in seconds, None before two updates
+            float: Standard deviation of the interval (jitter) in seconds, None before two updates
+        """
+        if self.count == 0:
+            return None, None
+        return self.mean, math.sqrt(self.var)
@@ -0,0 +1,197 @@
+import threading
+import time
+
+try:
+    import ntplib
+except ImportError:
+    ntplib = None
+
+
+class LocalOffsetSource:
+    """Offset source that trusts the local clock, or applies a fixed offset. Works without any network"""
+    def __init__(self, offset: float = 0.):
+        """Constructor function
+
+        Arg:
+            offset(float): Offset in seconds to report
+        """
+        self.offset = offset
+
+    def get_offset(self):
+        """Return:
+            float: Offset between reference time and local time in seconds
+        """
+        return self.offset
+
+
+class NTPOffsetSource:
+    """Offset source that asks an NTP server"""
+    def __init__(self, server: str = 'pool.ntp.org', timeout: float = 2.):
+        """Constructor function
+
+        Args:
+            server(str): NTP server
+            timeout(float): Request timeout in seconds
+        """
+        if ntplib is None:
+            raise ImportError("NTP offsets require the ntplib package")
+        self.server = server
+        self.timeout = timeout
+        self.client = ntplib.NTPClient()
+
+    def get_offset(self):
+        """Return:
+            float: Offset between NTP time and local time in seconds
+        """
+        return self.client.request(self.server, timeout=self.timeout).offset
+
+
+class PVOffsetSource:
+    """Offset source that compares the time stamp of the latest EPICS update with the local time it arrived"""
+    def __init__(self, pv):
+        """Constructor function
+
+        Arg:
+            pv: epics.PV or PV-like object with get() and a timestamp attribute
+        """
+        self.pv = pv
+
+    def get_offset(self):
+        """Return:
+            float: Offset between server time and local time in seconds
+        """
+        self.pv.get()
+        return self.pv.timestamp - time.time()
+
+
+def make_offset_source(time_source: str, pv=None):
+    """Make the offset source for a clock
+
+    Args:
+        time_source(str): "ntp", "epics" or "local"
+        pv: PV whose update time stamps are used for "epics"
+
+    Return:
+        Object with get_offset() for ClockService
+    """
+    if time_source == "ntp":
+        return NTPOffsetSource()
+    elif time_source == "epics":
+        return PVOffsetSource(pv)
+    elif time_source == "local":
+        return LocalOffsetSource()
+    raise ValueError(f"Unknown time source: {time_source}")
+
+
+class ClockService:
+    """Clock that gives time stamps as a monotonic base plus a smoothed offset to a reference time.
+
+    A background thread measures the offset from the source every sync_interval seconds and smooths it. now() only
+    does arithmetic: the offset it applies moves towards the smoothed target at no more than max_slew seconds per
+    second, so time stamps never jump or run backwards. Only the first measurement is stepped to."""
+    def __init__(self, source=None, sync_interval: float = 60., smoothing: float = 0.3, max_slew: float = 0.0005,
+                 verbose: bool = False):
+        """Constructor function that anchors the clock to the current local time
+
+        Args:
+            source: Object with get_offset(), e.g. NTPOffsetSource, PVOffsetSource or LocalOffsetSource; local time if None
+            sync_interval(float): Time in seconds between offset measurements
+            smoothing(float): Weight of a new measurement in the smoothed offset, between 0 and 1
+            max_slew(float): Maximum rate at which the applied offset changes, in seconds per second
+            verbose(bool): Specifies whether to print message on the back end
+        """
+        self.source = source if source is not None else LocalOffsetSource()
+        self.sync_interval = sync_interval
+        self.smoothing = smoothing
+        self.max_slew = max_slew
+        self.verbose = verbose
+        self.base_wall = time.time()
+        self.base_mono = time.monotonic()
+        # (anchor_offset, anchor_mono, target_offset): the applied offset is anchor_offset at anchor_mono and slews
+        # towards target_offset from there. Replaced as a whole so now() never needs a lock
+        self.state = (0., self.base_mono, 0.)
+        self.synced = False
+        self.last_sync_time = None
+        self.sync_errors = 0
+        self.clock_thread = None
+        self.is_syncing = False
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def _applied_offset(self, mono, state=None):
+        """Offset applied at monotonic time mono"""
+        anchor_offset, anchor_mono, target_offset = self.state if state is None else state
+        step = target_offset - anchor_offset
+        limit = self.max_slew * (mono - anchor_mono)
+        if step > limit:
+            step = limit
+        elif step < -limit:
+            step = -limit
+        return anchor_offset + step
+
+    def now(self):
+        """Get the current time stamp
+
+        Return:
+            float: Reference time in seconds since the epoch
+        """
+        mono = time.monotonic()
+        return self.base_wall + (mono - self.base_mono) + self._applied_offset(mono)
+
+    def get_offset(self):
+        """Return:
+            float: Offset currently applied to the local time in seconds
+        """
+        return self._applied_offset(time.monotonic())
+
+    def sync(self):
+        """Measure the offset once and slew towards it. Blocks for as long as the source takes
+
+        Return:
+            bool: True if the measurement succeeded
+        """
+        try:
+            # Measure against the monotonic base, so a change of the wall clock shows up as offset
+            measured = self.source.get_offset() + time.time() - (self.base_wall + time.monotonic() - self.base_mono)
+        except Exception as e:
+            self.sync_errors += 1
+            if self.verbose:
+                print(f"Error syncing time: {e}")
+            return False
+        with self._lock:
+            mono = time.monotonic()
+            state = self.state
+            if not self.synced:
+                target = measured
+                self.state = (measured, mono, measured)
+                self.synced = True
+            else:
+                target = state[2] + self.smoothing * (measured - state[2])
+                self.state = (self._applied_offset(mono, state), mono, target)
+            self.last_sync_time = mono
+        if self.verbose:
+            print(f"Time synchronized. Offset: {target} seconds")
+        return True
+
+    def start(self):
+        """Start the thread that keeps the offset up to date"""
+        if self.is_syncing:
+            return
+        self.is_syncing = True
+        self.stop_event.clear()
+        self.clock_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self.clock_thread.start()
+
+    def _sync_loop(self):
+        """Loop to measure the offset every sync_interval seconds"""
+        while self.is_syncing:
+            self.sync()
+            self.stop_event.wait(self.sync_interval)
+
+    def stop(self):
+        """Catch the clock thread"""
+        self.is_syncing = False
+        self.stop_event.set()
+        if self.clock_thread:
+            self.clock_thread.join()
+            self.clock_thread = None
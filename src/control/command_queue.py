@@ -0,0 +1,224 @@
+import threading
+import time
+from collections import deque
+from .rolling_stats import RollingStats
+
+
+class CommandTicket:
+    """Handle of one queued laser command, completed by the executor thread.
+
+    status goes from "pending" to "sent" and then "done" or "failed"; a tune that a newer one replaced before it
+    was sent ends as "superseded"."""
+    def __init__(self, name: str, args: tuple, kwargs: dict):
+        """Constructor function
+
+        Args:
+            name(str): Name of the laser method
+            args(tuple): Positional arguments of the call
+            kwargs(dict): Keyword arguments of the call
+        """
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.sent = None
+        self.finished = None
+        self.superseded_by = None
+        self._event = threading.Event()
+
+    def _finish(self, status: str, result=None, error=None):
+        """Set the outcome and wake the waiters"""
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished = time.monotonic()
+        self._event.set()
+
+    def done(self):
+        """Return:
+            bool: True once the command is done, failed or superseded
+        """
+        return self._event.is_set()
+
+    def wait(self, timeout: float = None):
+        """Block until the command is finished
+
+        Arg:
+            timeout(float): Maximum time to wait in seconds
+
+        Return:
+            bool: True if it finished
+        """
+        return self._event.wait(timeout)
+
+    def get_latency(self):
+        """Return:
+            float: Time in seconds from submission to acknowledgement, None if not finished
+        """
+        return self.finished - self.submitted if self.finished is not None else None
+
+
+class LaserCommandExecutor:
+    """Executor thread that sends queued commands to the laser one at a time, in order.
+
+    submit() returns immediately with a CommandTicket that reports completion or failure. A tune command replaces a
+    pending tune of the same tuner, which is marked superseded, so only the newest target is sent. The replacing
+    command goes to the end of the queue so it stays behind commands submitted before it."""
+    COALESCED = ("tune_reference_cavity", "tune_etalon")
+
+    def __init__(self, laser, latency_window: int = 1000, verbose: bool = False):
+        """Constructor function
+
+        Args:
+            laser(LaserBackend): Laser to send the commands to
+            latency_window(int): Number of commands the latency statistics are taken over
+            verbose(bool): whether to print messages on the terminal
+        """
+        self.laser = laser
+        self.verbose = verbose
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.executor_thread = None
+        self.is_running = False
+        self.busy = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.latency = RollingStats(windows=(latency_window,))  # submission to acknowledgement
+        self.execution = RollingStats(windows=(latency_window,))  # time the laser took
+
+    def start(self):
+        """Start the executor thread"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.executor_thread = threading.Thread(target=self._executor_loop, daemon=True)
+        self.executor_thread.start()
+
+    def submit(self, name: str, *args, **kwargs):
+        """Queue a command without waiting for it
+
+        Args:
+            name(str): Name of the laser method, e.g. "tune_reference_cavity"
+            args, kwargs: Arguments of the call
+
+        Return:
+            CommandTicket: Handle to wait for the command and get its outcome
+        """
+        ticket = CommandTicket(name, args, kwargs)
+        with self.condition:
+            if name in self.COALESCED:
+                for old in [queued for queued in self.queue if queued.name == name]:
+                    self.queue.remove(old)
+                    old.superseded_by = ticket
+                    old._finish("superseded")
+                    self.skipped += 1
+            self.queue.append(ticket)
+            self.submitted += 1
+            self.condition.notify_all()
+        return ticket
+
+    def call(self, name: str, *args, timeout: float = None, **kwargs):
+        """Queue a command and wait for it, raising its error if it failed. A superseded tune waits for the tune that
+        replaced it, within the same timeout
+
+        Args:
+            name(str): Name of the laser method
+            timeout(float): Maximum time to wait in seconds
+            args, kwargs: Arguments of the call
+
+        Return:
+            Return value of the laser method
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = self.submit(name, *args, **kwargs)
+        while True:
+            remaining = None if deadline is None else max(0., deadline - time.monotonic())
+            if not ticket.wait(remaining):
+                raise TimeoutError(f"Laser command {name} not acknowledged within {timeout} s")
+            if ticket.status != "superseded":
+                break
+            ticket = ticket.superseded_by
+        if ticket.error is not None:
+            raise ticket.error
+        return ticket.result
+
+    def _executor_loop(self):
+        """Loop to send the queued commands"""
+        while True:
+            with self.condition:
+                while self.is_running and not self.queue:
+                    self.condition.wait()
+                if not self.queue:
+                    break
+                ticket = self.queue.popleft()
+                self.busy = True
+            ticket.status = "sent"
+            ticket.sent = time.monotonic()
+            try:
+                result = getattr(self.laser, ticket.name)(*ticket.args, **ticket.kwargs)
+            except Exception as e:
+                ticket._finish("failed", error=e)
+                if self.verbose:
+                    print(f"Laser command {ticket.name}{ticket.args} failed: {e}")
+            else:
+                ticket._finish("done", result=result)
+            self.latency.add(ticket.get_latency())
+            self.execution.add(ticket.finished - ticket.sent)
+            with self.condition:
+                if ticket.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.busy = False
+                self.condition.notify_all()
+
+    def flush(self, timeout: float = None):
+        """Block until every queued command has been sent and acknowledged
+
+        Arg:
+            timeout(float): Maximum time to wait in seconds
+
+        Return:
+            bool: True if the queue is empty
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queue and not self.busy, timeout)
+
+    def get_stats(self):
+        """Get the counters and latencies of the executor
+
+        Return:
+            dict: submitted, completed, failed, skipped (superseded tunes), queue_depth, and the latency
+            (submission to acknowledgement) and execution statistics in seconds, see RollingWindow.get
+        """
+        with self.condition:
+            stats = {"submitted": self.submitted,
+                     "completed": self.completed,
+                     "failed": self.failed,
+                     "skipped": self.skipped,
+                     "queue_depth": len(self.queue)}
+        stats["latency"] = self.latency.get()
+        stats["execution"] = self.execution.get()
+        return stats
+
+    def stop(self, drain: bool = True):
+        """Stop the executor thread
+
+        Arg:
+            drain(bool): Send the queued commands first; otherwise they are marked failed
+        """
+        with self.condition:
+            if not drain:
+                while self.queue:
+                    self.queue.popleft()._finish("failed", error=RuntimeError("Executor stopped"))
+                    self.failed += 1
+            self.is_running = False
+            self.condition.notify_all()
+        if self.executor_thread:
+            self.executor_thread.join()
+            self.executor_thread = None
@@ -0,0 +1,76 @@
+import json
+import os
+
+# Directory of the per-laser settings files; overridden by the EMA_LASER_CONFIG_DIR environment variable
+DEFAULT_CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".ema_laser_control")
+
+
+def config_dir():
+    """Return:
+        str: Directory the per-laser settings are stored in
+    """
+    return os.environ.get("EMA_LASER_CONFIG_DIR", DEFAULT_CONFIG_DIR)
+
+
+def config_path(tag: str):
+    """Arg:
+        tag(str): Laser tag, e.g. "wavenumber_1"
+
+    Return:
+        str: Path of the settings file of the laser
+    """
+    return os.path.join(config_dir(), f"{tag}.json")
+
+
+def load_laser_config(tag: str):
+    """Load the stored settings of a laser, e.g. its calibration
+
+    Arg:
+        tag(str): Laser tag
+
+    Return:
+        dict: Stored settings; empty if there are none or the file cannot be read
+    """
+    path = config_path(tag)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Unable to read the settings of {tag} from {path}: {e}")
+        return {}
+    return config if isinstance(config, dict) else {}
+
+
+def save_laser_config(tag: str, updates: dict):
+    """Merge settings into the stored ones of a laser. The file is replaced atomically, so a crash while saving
+    keeps the previous settings
+
+    Args:
+        tag(str): Laser tag
+        updates(dict): Top-level keys to set
+
+    Return:
+        dict: All stored settings after the update
+    """
+    config = load_laser_config(tag)
+    config.update(updates)
+    write_json(config_path(tag), config)
+    return config
+
+
+def write_json(path: str, data):
+    """Write JSON to a file by replacing it atomically, so a crash while writing keeps the previous contents
+
+    Args:
+        path(str): File to write
+        data: JSON-serializable data
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+from .config import config_dir
+
+# Events of the journal; lines with other events are skipped when replaying
+EVENTS = ("lock", "unlock", "scan_start", "step", "pass", "scan_end", "gains", "snapshot")
+
+
+def journal_path(tag: str):
+    """Arg:
+        tag(str): Laser tag
+
+    Return:
+        str: Path of the control journal of the laser
+    """
+    return os.path.join(config_dir(), f"{tag}_journal.jsonl")
+
+
+def initial_state():
+    """Return:
+        dict: Control state before any event: mode ("idle", "locked" or "scanning"), target, gains (with the time
+        they were set) and scan
+    """
+    return {"mode": "idle", "target": None, "gains": None, "scan": None}
+
+
+def apply_event(state: dict, record: dict):
+    """Advance a control state by one journal record
+
+    Args:
+        state(dict): Control state, see initial_state; changed in place
+        record(dict): Journal record with its event and fields
+
+    Return:
+        dict: The state
+    """
+    event = record.get("event")
+    if event == "snapshot":
+        state.clear()
+        state.update(record["state"])
+    elif event == "lock":
+        state.update(mode="locked", target=record["target"], scan=None)
+    elif event == "unlock" or event == "scan_end":
+        state.update(mode="idle", scan=None)
+    elif event == "scan_start":
+        state.update(mode="scanning", scan={"plan": record["plan"], "settle": record.get("settle", {}),
+                                            "feed_forward": record.get("feed_forward", True),
+                                            "scan_id": record["scan_id"], "pass": 0, "step": None, "tuner": None})
+    elif event == "step" and state.get("scan") is not None:
+        state["scan"].update({"pass": record["pass"], "step": record["step"], "tuner": record.get("tuner")})
+        state["target"] = record["target"]
+    elif event == "pass" and state.get("scan") is not None:
+        state["scan"].update({"pass": record["pass"], "step": None})
+    elif event == "gains":
+        state["gains"] = {"kp": record["kp"], "ki": record["ki"], "kd": record["kd"], "time": record.get("time")}
+    return state
+
+
+class ControlJournal:
+    """Append-only journal of the control state transitions of one laser: lock target, scan started, scan step
+    advanced, pass flipped, scan ended and gains changed.
+
+    Every record is one JSON line, flushed and fsynced before record() returns, so the state survives the process or
+    the tweaking thread dying. Replaying the records gives the last consistent state; a line torn by a crash while
+    writing is ignored. The journal is compacted into one snapshot record when it is opened and whenever it has grown
+    past max_bytes while idle."""
+    def __init__(self, path: str, max_bytes: int = 1_000_000, verbose: bool = False):
+        """Constructor function that replays and compacts the journal
+
+        Args:
+            path(str): Journal file
+            max_bytes(int): Size after which the journal is compacted once the laser is idle
+            verbose(bool): whether to print messages on the terminal
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self.records = 0
+        self.torn = 0
+        self.state = self.replay()
+        self.file = None
+        self.compact()
+
+    def replay(self):
+        """Read the journal
+
+        Return:
+            dict: Last consistent control state, see initial_state
+        """
+        state = initial_state()
+        if not os.path.exists(self.path):
+            return state
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.torn += 1
+                    continue
+                if not isinstance(record, dict) or record.get("event") not in EVENTS:
+                    continue
+                try:
+                    apply_event(state, record)
+                except KeyError:
+                    self.torn += 1
+                    continue
+                self.records += 1
+        if self.torn and self.verbose:
+            print(f"Skipped {self.torn} incomplete records of {self.path}")
+        return state
+
+    def compact(self):
+        """Replace the journal with one snapshot of the current state"""
+        with self._lock:
+            if self.file is not None:
+                self.file.close()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(json.dumps({"event": "snapshot", "time": time.time(), "state": self.state}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, "a")
+
+    def record(self, event: str, **fields):
+        """Append one transition and apply it to the state
+
+        Args:
+            event(str): One of EVENTS
+            fields: Fields of the event
+
+        Return:
+            dict: Control state after the event
+        """
+        record = dict(event=event, time=time.time(), **fields)
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            apply_event(self.state, record)
+            self.records += 1
+            grown = self.state["mode"] == "idle" and self.file.tell() > self.max_bytes
+        if grown:
+            self.compact()
+        return self.state
+
+    def get_state(self):
+        """Return:
+            dict: Copy of the current control state
+        """
+        with self._lock:
+            return json.loads(json.dumps(self.state))
+
+    def close(self):
+        """Close the journal file"""
+        with self._lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
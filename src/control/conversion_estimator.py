@@ -0,0 +1,131 @@
+import math
+import threading
+
+
+class ConversionEstimator:
+    """Online estimate of the conversion between the reference cavity tuner and the wavenumber.
+
+    The wavenumber changes by slope * tuner change, with conversion = -1 / slope in tuner percent per cm^-1 (raising
+    the tuner lowers the wavenumber). Every actuation/response pair - the tuner and wavenumber before a move and
+    after the tuner has stayed put for settle_samples observations - updates the slope by recursive least squares
+    with a forgetting factor, so the estimate follows the local slope as the laser is tuned across its range.
+    The slope variance gives confidence bounds on the conversion."""
+    def __init__(self, initial: float = 60., forgetting: float = 0.9, prior_std: float = 0.3, noise: float = 2e-5,
+                 settle_samples: int = 3, min_step: float = 1e-3, move_tolerance: float = 1e-4,
+                 valid_range=(10., 200.), z: float = 1.96):
+        """Constructor function
+
+        Args:
+            initial(float): Conversion to start from in tuner percent per cm^-1
+            forgetting(float): Weight of older pairs per new pair, between 0 and 1; 1 never forgets
+            prior_std(float): Relative uncertainty of the initial conversion
+            noise(float): Standard deviation of a measured wavenumber change in cm^-1
+            settle_samples(int): Observations with an unchanged tuner after which the response counts as complete
+            min_step(float): Smallest tuner change in percent that updates the estimate
+            move_tolerance(float): Tuner changes below this many percent are not a move
+            valid_range(tuple): Conversions outside this range are not used; the last valid one is kept
+            z(float): Width of the confidence bounds in standard deviations
+        """
+        self.initial = initial
+        self.forgetting = forgetting
+        self.prior_std = prior_std
+        self.noise = noise
+        self.settle_samples = settle_samples
+        self.min_step = min_step
+        self.move_tolerance = move_tolerance
+        self.valid_range = valid_range
+        self.z = z
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, initial: float = None):
+        """Start over from the initial conversion
+
+        Arg:
+            initial(float): New initial conversion; the one given to the constructor if None
+        """
+        if initial is not None:
+            self.initial = initial
+        with self._lock:
+            self.slope = -1. / self.initial
+            self.variance = (self.slope * self.prior_std) ** 2
+            self.last_valid = self.initial
+            self.updates = 0
+            self.residual = None
+            self.last_tuner = None
+            self.steady = 0
+            self.anchor = None  # (tuner, wavenumber) of the last settled observation
+
+    def observe(self, tuner: float, wnum: float):
+        """Feed one observation of the tuner value in effect and the wavenumber measured with it
+
+        Args:
+            tuner(float): Reference cavity tuner value in percent
+            wnum(float): Measured wavenumber in cm^-1
+
+        Return:
+            bool: True if the observation completed a pair and updated the estimate
+        """
+        if tuner is None or wnum is None:
+            return False
+        with self._lock:
+            if self.last_tuner is None or abs(tuner - self.last_tuner) > self.move_tolerance:
+                self.last_tuner = tuner
+                self.steady = 0
+                return False
+            self.steady += 1
+            if self.steady < self.settle_samples:
+                return False
+            anchor, self.anchor = self.anchor, (tuner, wnum)
+            if self.steady > self.settle_samples or anchor is None or abs(tuner - anchor[0]) < self.min_step:
+                return False
+            self._update(tuner - anchor[0], wnum - anchor[1])
+            return True
+
+    def add_pair(self, tuner_change: float, wnum_change: float):
+        """Update the estimate with a measured actuation/response pair
+
+        Args:
+            tuner_change(float): Tuner change in percent
+            wnum_change(float): Resulting wavenumber change in cm^-1
+        """
+        with self._lock:
+            self._update(tuner_change, wnum_change)
+
+    def _update(self, du: float, dw: float):
+        """One recursive least squares step of the slope with forgetting"""
+        variance = self.variance / self.forgetting
+        gain = variance * du / (du * du * variance + self.noise ** 2)
+        self.residual = dw - self.slope * du
+        self.slope += gain * self.residual
+        self.variance = (1 - gain * du) * variance
+        self.updates += 1
+        conversion = -1. / self.slope if self.slope < 0 else math.inf
+        if self.valid_range[0] <= conversion <= self.valid_range[1]:
+            self.last_valid = conversion
+
+    def get_conversion(self):
+        """Return:
+            float: Latest conversion in tuner percent per cm^-1 that lies in the valid range
+        """
+        with self._lock:
+            return self.last_valid
+
+    def get(self):
+        """Get the estimate with its confidence bounds
+
+        Return:
+            dict: conversion (last valid one), estimate (raw, may be out of range), lower and upper confidence
+            bounds (inf if the slope could be zero), slope, slope_std, updates and the last residual in cm^-1
+        """
+        with self._lock:
+            std = math.sqrt(self.variance)
+            steep, flat = self.slope - self.z * std, self.slope + self.z * std
+            return {"conversion": self.last_valid,
+                    "estimate": -1. / self.slope if self.slope < 0 else math.inf,
+                    "lower": -1. / steep if steep < 0 else math.inf,
+                    "upper": -1. / flat if flat < 0 else math.inf,
+                    "slope": self.slope,
+                    "slope_std": std,
+                    "updates": self.updates,
+                    "residual": self.residual}
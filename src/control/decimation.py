@@ -0,0 +1,153 @@
+import threading
+import numpy as np
+from .ring_buffer import RingBuffer
+
+
+class DecimationPyramid:
+    """Multi-resolution history of a time series kept as min/max/mean buckets.
+
+    Level i aggregates factors[i] consecutive samples into one bucket (time of its first sample, min, max, mean), so
+    with the default factors the same capacity covers 1x, 10x, 100x and 1000x as much time. Appending costs one
+    accumulator update per level. query() picks the finest level that fits the requested number of points."""
+    def __init__(self, factors=(1, 10, 100, 1000), capacity: int = 100000):
+        """Constructor function that allocates one ring buffer per level
+
+        Args:
+            factors(tuple): Number of samples per bucket for each level, finest first
+            capacity(int): Number of buckets kept per level
+        """
+        self.factors = tuple(int(f) for f in factors)
+        self.levels = [RingBuffer(capacity, width=4) for _ in self.factors]
+        self._lock = threading.Lock()
+        self._reset_accumulators()
+
+    def _reset_accumulators(self):
+        """Start empty buckets on every level"""
+        n = len(self.factors)
+        self._count = [0] * n
+        self._start = [0.] * n
+        self._min = [0.] * n
+        self._max = [0.] * n
+        self._sum = [0.] * n
+
+    def append(self, t: float, y: float):
+        """Add one sample to every level
+
+        Args:
+            t(float): time stamp
+            y(float): value
+        """
+        with self._lock:
+            for i, factor in enumerate(self.factors):
+                if factor == 1:
+                    self.levels[i].append(t, y, y, y)
+                    continue
+                if self._count[i] == 0:
+                    self._start[i], self._min[i], self._max[i], self._sum[i] = t, y, y, 0.
+                elif y < self._min[i]:
+                    self._min[i] = y
+                elif y > self._max[i]:
+                    self._max[i] = y
+                self._sum[i] += y
+                self._count[i] += 1
+                if self._count[i] == factor:
+                    self.levels[i].append(self._start[i], self._min[i], self._max[i], self._sum[i] / factor)
+                    self._count[i] = 0
+
+    def _partial_bucket(self, i):
+        """Get the bucket still being filled on level i
+
+        Return:
+            tuple: time, min, max and mean of the partial bucket, None if it is empty
+        """
+        with self._lock:
+            count = self._count[i]
+            if count == 0:
+                return None
+            return self._start[i], self._min[i], self._max[i], self._sum[i] / count
+
+    def _choose_level(self, t_start, t_end, raw_budget, bucket_budget):
+        """Find the finest level that covers the time range within the budget
+
+        Args:
+            raw_budget(int): Maximum number of samples from a raw level (factor 1)
+            bucket_budget(int): Maximum number of buckets from a decimated level
+
+        Return:
+            int: Index of the level
+        """
+        for i, level in enumerate(self.levels):
+            if len(level) == 0:
+                continue
+            budget = raw_budget if self.factors[i] == 1 else bucket_budget
+            covers = len(level) < level.capacity or level.first()[0] <= t_start
+            if covers and self._estimate_buckets(i, t_start, t_end) <= budget:
+                return i
+        return len(self.levels) - 1
+
+    def _estimate_buckets(self, i, t_start, t_end):
+        """Estimate how many buckets of level i lie in the time range from the level's average bucket spacing"""
+        level = self.levels[i]
+        oldest, newest = level.first(), level.last()
+        if oldest is None or len(level) < 2:
+            return len(level)
+        spacing = (newest[0] - oldest[0]) / (len(level) - 1)
+        if spacing <= 0:
+            return len(level)
+        span = min(t_end, newest[0]) - max(t_start, oldest[0])
+        return int(max(0., span) // spacing) + 1
+
+    def _buckets(self, i, t_start, t_end, max_buckets):
+        """Get the buckets of level i in the time range, including the one still being filled, keeping the newest max_buckets"""
+        columns = self.levels[i].between(t_start, t_end)
+        partial = self._partial_bucket(i)
+        if partial is not None and t_start <= partial[0] <= t_end:
+            columns = tuple(np.append(column, value) for column, value in zip(columns, partial))
+        if len(columns[0]) > max_buckets:
+            columns = tuple(column[-max_buckets:] for column in columns)
+        return columns
+
+    def query_buckets(self, t_start: float, t_end: float, max_buckets: int):
+        """Get the buckets of the finest level that covers [t_start, t_end] with at most max_buckets buckets
+
+        Args:
+            t_start(float): Start of the time range
+            t_end(float): End of the time range
+            max_buckets(int): Maximum number of buckets to return
+
+        Returns:
+            int: Number of samples per bucket of the chosen level
+            tuple: np.ndarray of bucket times, minima, maxima and means
+        """
+        i = self._choose_level(t_start, t_end, max_buckets, max_buckets)
+        return self.factors[i], self._buckets(i, t_start, t_end, max_buckets)
+
+    def query(self, t_start: float, t_end: float, max_points: int):
+        """Get at most max_points points that represent the time range for plotting.
+        Decimated levels give each bucket's min and max, so peaks stay visible.
+
+        Args:
+            t_start(float): Start of the time range
+            t_end(float): End of the time range
+            max_points(int): Maximum number of points to return
+
+        Returns:
+            np.ndarray: x data - time stamps
+            np.ndarray: y data - values
+        """
+        i = self._choose_level(t_start, t_end, max_points, max(1, max_points // 2))
+        if self.factors[i] == 1:
+            t, low, high, mean = self._buckets(i, t_start, t_end, max_points)
+            return t, mean
+        t, low, high, mean = self._buckets(i, t_start, t_end, max(1, max_points // 2))
+        x = np.repeat(t, 2)
+        y = np.empty(2 * len(t))
+        y[0::2], y[1::2] = low, high
+        return x, y
+
+    def clear(self):
+        """Drop the whole history"""
+        with self._lock:
+            for level in self.levels:
+                level.clear()
+            self._reset_accumulators()
@@ -0,0 +1,76 @@
+from .base import LaserBackend
+
+try:
+    from pylablib.devices import M2
+except ImportError:
+    M2 = None
+
+
+class SolstisBackend(LaserBackend):
+    """LaserBackend for a real M2 Solstis, passing every call to pylablib's M2.Solstis"""
+    def __init__(self, ip_address: str, port: int):
+        """Constructor function that connects to the laser
+
+        Args:
+            ip_address(str): IP address for the M2 laser
+            port(int): Port for the M2 laser
+        """
+        if M2 is None:
+            raise ImportError("The Solstis backend requires the pylablib package")
+        self.device = M2.Solstis(ip_address, port)
+
+    def lock_etalon(self):
+        """Lock the etalon lock"""
+        return self.device.lock_etalon()
+
+    def unlock_etalon(self):
+        """Unlock the etalon lock"""
+        return self.device.unlock_etalon()
+
+    def lock_reference_cavity(self):
+        """Lock the reference cavity lock"""
+        return self.device.lock_reference_cavity()
+
+    def unlock_reference_cavity(self):
+        """Unlock the reference cavity lock"""
+        return self.device.unlock_reference_cavity()
+
+    def tune_reference_cavity(self, value, sync=True):
+        """Tune the reference cavity tuner
+
+        Args:
+            value(float): Tuner value in percent
+            sync(bool): Wait until the laser has applied it
+        """
+        return self.device.tune_reference_cavity(value, sync=sync)
+
+    def tune_etalon(self, value, sync=True):
+        """Tune the etalon tuner
+
+        Args:
+            value(float): Tuner value in percent
+            sync(bool): Wait until the laser has applied it
+        """
+        return self.device.tune_etalon(value, sync=sync)
+
+    def get_full_web_status(self):
+        """Return:
+            dict: Status of the laser web interface, including 'cavity_tune' and 'etalon_tune'
+        """
+        return self.device.get_full_web_status()
+
+    def get_etalon_lock_status(self):
+        """Return:
+            str: Etalon lock status
+        """
+        return self.device.get_etalon_lock_status()
+
+    def get_reference_cavity_lock_status(self):
+        """Return:
+            str: Reference cavity lock status
+        """
+        return self.device.get_reference_cavity_lock_status()
+
+    def close(self):
+        """Close the connection to the laser"""
+        self.device.close()
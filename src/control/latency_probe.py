@@ -0,0 +1,162 @@
+import json
+import time
+import numpy as np
+
+
+def summarize_latencies(latencies, command_times=None):
+    """Summarize measured latencies
+
+    Args:
+        latencies(np.ndarray): Command-to-response latencies in seconds; NaN for steps without a detected response
+        command_times(np.ndarray): Times in seconds the laser took to acknowledge the commands
+
+    Return:
+        dict: count, missed, mean, p50, p95, p99, max and dead_time (shortest latency) in seconds
+    """
+    latencies = np.asarray(latencies, dtype=np.float64)
+    valid = latencies[~np.isnan(latencies)]
+    summary = {"count": int(len(valid)), "missed": int(len(latencies) - len(valid))}
+    if len(valid):
+        p50, p95, p99 = np.percentile(valid, [50, 95, 99])
+        summary.update({"mean": float(valid.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99),
+                        "max": float(valid.max()), "dead_time": float(valid.min())})
+    if command_times is not None and len(command_times):
+        summary["command_p50"] = float(np.median(command_times))
+    return summary
+
+
+class LatencyProbe:
+    """Measures the time from a reference cavity tuner command to its first effect on the wavemeter.
+
+    Every repetition measures the wavenumber on a few updates before the step, sends a small tuner step (alternately
+    away from and back to the start value, so the laser ends where it started), and takes the first update that
+    leaves the noise band of that baseline as the response. Only real updates of the source count, not polls
+    repeating one. Times come from the reader's clock, so they are comparable with the sample time stamps; updates
+    are timed by their source time stamps where the source gives them, see _update_time."""
+    def __init__(self, tune, reader, center: float, step: float = 0.005, repeats: int = 20, conversion: float = 60.,
+                 baseline: int = 5, settle: int = 5, n_sigma: float = 4., detect_fraction: float = 0.5,
+                 timeout: float = 2., verbose: bool = False):
+        """Constructor function
+
+        Args:
+            tune(callable): Sets the reference cavity tuner and returns once the laser acknowledged it
+            reader(EMAServerReader): Reader of the wavemeter
+            center(float): Tuner value in percent to step from and return to
+            step(float): Tuner step in percent; keep it small, the default is a few GHz
+            repeats(int): Number of steps
+            conversion(float): Tuner percent per cm^-1, used for the expected response
+            baseline(int): Updates to average before every step
+            settle(int): Updates to wait after a response before the next step
+            n_sigma(float): Responses must leave the baseline by this many standard deviations
+            detect_fraction(float): ... and by this fraction of the expected wavenumber change
+            timeout(float): Maximum time in seconds to wait for a response
+            verbose(bool): whether to print messages on the terminal
+        """
+        self.tune = tune
+        self.reader = reader
+        self.center = center
+        self.step = step
+        self.repeats = repeats
+        self.expected = abs(step / conversion)
+        self.baseline = baseline
+        self.settle = settle
+        self.n_sigma = n_sigma
+        self.detect_fraction = detect_fraction
+        self.timeout = timeout
+        self.verbose = verbose
+        self.latencies = np.full(repeats, np.nan)
+        self.command_times = np.full(repeats, np.nan)
+        self.source_offset = None  # smallest reader minus source time stamp of an update seen
+        self.result = None
+
+    def _collect(self, count: int):
+        """Wait for count real updates and return their wavenumbers"""
+        values = []
+        seen = self.reader.update_count
+        for _ in range(count):
+            seen = self.reader.wait_for_new_value(seen, timeout=self.timeout)
+            if seen is None:
+                break
+            t, w, source_time = self.reader.get_latest_update()
+            self._update_time(t, source_time)
+            values.append(w)
+        return np.array(values)
+
+    def _update_time(self, t: float, source_time: float):
+        """Time of an update on the reader's clock, from the time stamp the source gave it if there is one.
+
+        Polls see an update up to one poll period after it was published, so the time they record it with is late by
+        a varying amount. The time stamps of the source are not, but may come from another clock; the smallest
+        difference between the two seen so far maps them onto the reader's clock
+
+        Args:
+            t(float): Time stamp the reader recorded the update with
+            source_time(float): Time stamp the source gave the update, None if it gave none
+
+        Return:
+            float: Time of the update
+        """
+        if source_time is None:
+            return t
+        offset = t - source_time
+        if self.source_offset is None or offset < self.source_offset:
+            self.source_offset = offset
+        return source_time + self.source_offset
+
+    def _wait_for_response(self, mean: float, threshold: float, start: float, seen: int):
+        """Return the time of the first real update after start that leaves the band, None on timeout"""
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            count = self.reader.wait_for_new_value(seen, timeout=max(0., deadline - time.monotonic()))
+            if count is None:
+                return None
+            seen = count
+            t, w, source_time = self.reader.get_latest_update()
+            t = self._update_time(t, source_time)
+            if t >= start and abs(w - mean) > threshold:
+                return t
+        return None
+
+    def run(self):
+        """Run all steps and summarize them; the tuner is set back to the center at the end
+
+        Return:
+            dict: See summarize_latencies, plus the step, the threshold range and the raw latencies
+        """
+        thresholds = []
+        try:
+            for i in range(self.repeats):
+                values = self._collect(self.baseline)
+                if len(values) == 0:
+                    continue
+                threshold = max(self.n_sigma * values.std(), self.detect_fraction * self.expected)
+                thresholds.append(threshold)
+                target = self.center + self.step if i % 2 == 0 else self.center
+                seen = self.reader.update_count
+                start = self.reader.get_time()
+                self.tune(float(target))
+                self.command_times[i] = self.reader.get_time() - start
+                response = self._wait_for_response(values.mean(), threshold, start, seen)
+                if response is not None:
+                    self.latencies[i] = response - start
+                if self.verbose:
+                    print(f"Latency step {i + 1}/{self.repeats}: {self.latencies[i] * 1000:.0f} ms")
+                self._collect(self.settle)
+        finally:
+            self.tune(float(self.center))
+        self.result = summarize_latencies(self.latencies, self.command_times[~np.isnan(self.command_times)])
+        self.result.update({"step": self.step,
+                            "threshold_min": float(min(thresholds)) if thresholds else None,
+                            "threshold_max": float(max(thresholds)) if thresholds else None,
+                            "latencies": [None if np.isnan(x) else float(x) for x in self.latencies],
+                            "time": time.time()})
+        return self.result
+
+    def save(self, path: str):
+        """Write the result as JSON
+
+        Arg:
+            path(str): File to write
+        """
+        with open(path, "w") as f:
+            json.dump(self.result, f, indent=2)
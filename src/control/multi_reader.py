@@ -0,0 +1,182 @@
+import threading
+import time
+import traceback
+from collections import deque
+from functools import partial
+from epics import PV, ca
+from .server_reader import EMAServerReader
+from .clock import ClockService, make_offset_source
+
+
+class EMAMultiReader:
+    """Reader that watches several wavenumber PVs with one thread and one clock.
+
+    All PVs are connected together and read in one batch of Channel Access requests per period ("poll"), or
+    subscribed to with one callback each ("monitor"). Every PV keeps its own EMAServerReader in "external" mode for
+    its buffers, history and saving, so a LaserControl can use get_reader(name) like a reader of its own."""
+    def __init__(self, pv_names, reading_frequency: float = 0.1, acquisition_mode: str = "poll", sources: dict = None,
+                 time_source: str = "ntp", ntp_sync_interval: float = 60, connection_timeout: float = 5.,
+                 verbose: bool = False, **reader_kwargs):
+        """Constructor function that connects to all PVs and makes one reader per PV
+
+        Args:
+            pv_names(list): PV names for getting wavenumbers
+            reading_frequency(float): The frequency for reading data in poll mode
+            acquisition_mode(str): "poll" or "monitor", see EMAServerReader
+            sources(dict): PV name to PV-like object (e.g. SoftPV) to use instead of connecting through EPICS
+            time_source(str): Reference for time stamps: "ntp", "epics" or "local"
+            ntp_sync_interval(float): The interval to synchronize the clock offset with the time source
+            connection_timeout(float): Time in seconds to wait for all PVs to connect
+            verbose(bool): Specifies whether to print message on the back end
+            reader_kwargs: Further arguments for the EMAServerReader of every PV, e.g. plot_limit
+        """
+        if acquisition_mode not in ("poll", "monitor"):
+            raise ValueError(f"Unknown acquisition mode: {acquisition_mode}")
+        sources = sources or {}
+        self.names = list(pv_names)
+        self.reading_frequency = reading_frequency
+        self.acquisition_mode = acquisition_mode
+        self.verbose = verbose
+        # Creating all PVs first lets them connect in parallel
+        self.pvs = {name: sources[name] if name in sources else PV(name) for name in self.names}
+        self.connect(connection_timeout)
+        self.clock = ClockService(source=make_offset_source(time_source, self.pvs[self.names[0]]),
+                                  sync_interval=ntp_sync_interval, verbose=verbose)
+        reader_kwargs.setdefault("change_only", acquisition_mode == "poll")
+        self.readers = {name: EMAServerReader(name, reading_frequency=reading_frequency, verbose=verbose,
+                                              acquisition_mode="external", source=self.pvs[name], clock=self.clock,
+                                              **reader_kwargs)
+                        for name in self.names}
+        self.batch_epics = all(isinstance(pv, PV) for pv in self.pvs.values())
+        self.callback_indices = {}
+        self.pending = deque()
+        self.new_data = threading.Condition()
+        self.reading_thread = None
+        self.is_reading = False
+        self.batches = 0
+
+    def connect(self, timeout: float):
+        """Wait for all PVs to connect, sharing one timeout
+
+        Arg:
+            timeout(float): Time in seconds to wait in total
+
+        Return:
+            list: Names of the PVs that did not connect
+        """
+        deadline = time.time() + timeout
+        missing = [name for name, pv in self.pvs.items()
+                   if not pv.wait_for_connection(timeout=max(0., deadline - time.time()))]
+        if missing and self.verbose:
+            print(f"PVs not connected: {missing}")
+        return missing
+
+    def get_reader(self, name):
+        """Get the reader of one PV
+
+        Arg:
+            name(str): PV name
+
+        Return:
+            EMAServerReader: Reader holding the buffers of the PV
+        """
+        return self.readers[name]
+
+    def get_values(self):
+        """Read all PVs in one batch: every request is sent before waiting for any reply
+
+        Return:
+            dict: PV name to raw value, None for failed reads
+        """
+        if self.batch_epics:
+            for pv in self.pvs.values():
+                ca.get(pv.chid, wait=False)
+            ca.poll()
+            return {name: ca.get_complete(pv.chid, timeout=self.reading_frequency) for name, pv in self.pvs.items()}
+        return {name: pv.get() for name, pv in self.pvs.items()}
+
+    def start_reading(self):
+        """Start the reading thread, the clock and the readers of all PVs"""
+        if self.is_reading:
+            if self.verbose:
+                print("Reading is already in progress.")
+            return
+        self.is_reading = True
+        self.clock.start()
+        for reader in self.readers.values():
+            reader.start_reading()
+        if self.acquisition_mode == "monitor":
+            for name, pv in self.pvs.items():
+                self.callback_indices[name] = pv.add_callback(partial(self._on_monitor, name))
+            self.reading_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        else:
+            self.reading_thread = threading.Thread(target=self._reading_loop, daemon=True)
+        self.reading_thread.start()
+
+    def _record(self, name, current_time, value, source_time=None):
+        """Hand one sample to the reader of its PV if that reader is on"""
+        reader = self.readers[name]
+        if not reader.is_reading:
+            return
+        try:
+            current_wnum = round(float(value), 5)
+        except (TypeError, ValueError):
+            return
+        reader.record(current_time, current_wnum, source_time)
+
+    def _reading_loop(self):
+        """Loop to poll all PVs in one batch per period"""
+        while self.is_reading:
+            start = time.time()
+            try:
+                values = self.get_values()
+                current_time = self.clock.now()
+                self.batches += 1
+                for name, value in values.items():
+                    # Batched reads bypass the PV objects, whose time stamps then stay behind
+                    source_time = None if self.batch_epics else getattr(self.pvs[name], "timestamp", None)
+                    self._record(name, current_time, value, source_time)
+            except Exception as e:
+                if self.verbose:
+                    print(f"Exception in multi reading loop: {e}. \n {traceback.format_exc()}")
+            time.sleep(max(0., self.reading_frequency - (time.time() - start)))
+
+    def _on_monitor(self, name, pvname=None, value=None, timestamp=None, **kwargs):
+        """Monitor callback that time stamps an update on arrival and hands it to the reading thread"""
+        current_time = self.clock.now()
+        # Every pushed update is a real one, also when it repeats the value
+        source_time = current_time if timestamp is None else timestamp
+        with self.new_data:
+            self.pending.append((name, current_time, value, source_time))
+            self.new_data.notify_all()
+
+    def _monitor_loop(self):
+        """Loop to record the updates pushed by the monitor callbacks"""
+        while self.is_reading:
+            try:
+                with self.new_data:
+                    if not self.pending:
+                        self.new_data.wait(self.reading_frequency)
+                    batch = list(self.pending)
+                    self.pending.clear()
+                for name, current_time, value, source_time in batch:
+                    self._record(name, current_time, value, source_time)
+            except Exception as e:
+                if self.verbose:
+                    print(f"Exception in multi monitor loop: {e}")
+
+    def stop_reading(self):
+        """Unsubscribe from all PVs and catch the reading thread, the clock and the readers"""
+        self.is_reading = False
+        for name, index in self.callback_indices.items():
+            self.pvs[name].remove_callback(index)
+        self.callback_indices = {}
+        if self.reading_thread:
+            self.reading_thread.join()
+            self.reading_thread = None
+        for reader in self.readers.values():
+            reader.stop_reading()
+            reader.stop_saving()
+        self.clock.stop()
+        if self.verbose:
+            print("Multi reading thread caught")
@@ -1,8 +1,18 @@
 import time
 
 class PIDController:
-    """PID controller that takes process variable and calculates the correction based on parameters and setpoint"""
-    def __init__(self, kp, ki, kd, setpoint):
+    """PID controller that takes process variable and calculates the correction based on parameters and setpoint.
+
+    The integral is kept as the integral term itself (ki already applied), so changing ki does not move the output,
+    and kp/kd changes shift it by the difference they make, so gain changes are bumpless. An incremental controller,
+    whose output is added to the actuator every step (as LaserControl does with the tuner), leaves the integral alone
+    on kp/kd changes: the actuator does not jump, and a shifted integral would be added again on every step. The
+    derivative acts on the measurement (no kick on setpoint changes) through a first-order filter. With output limits,
+    the integral stops growing while the output saturates (clamping), or is wound back by back-calculation; an optional
+    slew limit bounds how fast the output may change. update() times steps with the monotonic clock; step() takes dt
+    and does no I/O, for simulations."""
+    def __init__(self, kp, ki, kd, setpoint, output_limits=(None, None), derivative_filter=0.,
+                 slew_rate=None, back_calculation=None, incremental=False):
         """Constructor that specifies the p, i, d paramters and the setpoint
 
         Args:
@@ -10,76 +20,175 @@ class PIDController:
             ki(float): intergal coefficient
             kd(float): derivative coefficient
             setpoint(float): setpoint for wavenumber
+            output_limits(tuple): (lower, upper) bounds of the correction; None for no bound
+            derivative_filter(float): Time constant in seconds of the derivative filter; 0 for no filtering
+            slew_rate(float): Largest change of the correction per second; None for no limit
+            back_calculation(float): Gain in 1/s winding the integral back while the output saturates; None to only
+                clamp the integral to the output limits
+            incremental(bool): Whether the correction is applied as an increment of the actuator every step rather
+                than as its position
         """
         self.kp = kp
         self.ki = ki
         self.kd = kd
         self.setpoint = setpoint
-        self.integral = 0
-        self.previous_error = 0
-        self.previous_time = time.time()
+        self.lower, self.upper = output_limits
+        self.derivative_filter = derivative_filter
+        self.slew_rate = slew_rate
+        self.back_calculation = back_calculation
+        self.incremental = incremental
+        self.integral = 0.  # integral term, ki included
+        self.derivative = 0.  # filtered derivative of the error, from the measurement
+        self.previous_error = 0.
+        self.previous_value = None
+        self.previous_output = None
+        self.previous_time = time.monotonic()
         self.first_update_call = True
 
+    def _clamp(self, value):
+        """Clamp a value to the output limits"""
+        if self.upper is not None and value > self.upper:
+            return self.upper
+        if self.lower is not None and value < self.lower:
+            return self.lower
+        return value
+
+    def step(self, setpoint, measurement, dt):
+        """Advance the controller by one sample without reading any clock
+
+        Args:
+            setpoint(float): setpoint
+            measurement(float): process variable
+            dt(float): time since the previous step in seconds; None or 0 for the first step of a loop
+
+        Return:
+            float: Correction
+        """
+        error = setpoint - measurement
+        previous_value = self.previous_value
+        if dt and previous_value is not None:
+            # Filtered derivative of -measurement: no kick when the setpoint jumps
+            raw = (previous_value - measurement) / dt
+            tf = self.derivative_filter
+            derivative = self.derivative + (raw - self.derivative) * (dt / (tf + dt)) if tf > 0 else raw
+            integral = self.integral + self.ki * error * dt
+        else:
+            derivative = 0.
+            integral = self.integral
+        proportional = self.kp * error
+        d_term = self.kd * derivative
+        output = proportional + integral + d_term
+        lower, upper = self.lower, self.upper
+        if upper is not None and output > upper:
+            integral = self._wind_back(integral, upper, output, dt)
+            output = upper
+        elif lower is not None and output < lower:
+            integral = self._wind_back(integral, lower, output, dt)
+            output = lower
+        slew_rate = self.slew_rate
+        if slew_rate is not None and dt and self.previous_output is not None:
+            previous = self.previous_output
+            limit = slew_rate * dt
+            if output > previous + limit:
+                output = previous + limit
+            elif output < previous - limit:
+                output = previous - limit
+        self.derivative = derivative
+        self.integral = integral
+        self.previous_error = error
+        self.previous_value = measurement
+        self.previous_output = output
+        return output
+
+    def _wind_back(self, integral, limit, output, dt):
+        """Anti-windup while the output saturates at limit
+
+        Return:
+            float: New integral term. Back-calculation winds it back in proportion to how far the output saturates;
+            clamping drops this step's integration if it drives the output further into the limit
+        """
+        if self.back_calculation is not None and dt:
+            return integral + self.back_calculation * (limit - output) * dt
+        if (integral - self.integral) * (output - limit) > 0:
+            return self.integral
+        return integral
+
     def update(self, current_value):
         """Calculates the correction
-        
+
         Args:
             current_value(float): Process variable
-        
+
         Returns:
             float: Error between the setpoint and process variable
             float: Correction
         """
-        current_time = time.time()
-        error = self.setpoint - current_value
-        if self.first_update_call: 
+        current_time = time.monotonic()
+        if self.first_update_call:
             self.first_update_call = False
-            derivative = 0.
+            dt = None
         else:
-            delta_time = current_time - self.previous_time
-            self.integral += error * delta_time
-            derivative = (error - self.previous_error) / delta_time
-
-        output = (self.kp * error) + (self.ki * self.integral) + (self.kd * derivative)
-
-        self.previous_error = error
+            dt = current_time - self.previous_time
         self.previous_time = current_time
+        output = self.step(self.setpoint, current_value, dt)
+        return self.previous_error, output
 
-        return error, output
-    
     def new_loop(self):
         """Reset everything for a new PID loop"""
         self.first_update_call = True
         self.integral = 0.
-    
+        self.derivative = 0.
+        self.previous_value = None
+        self.previous_output = None
+
+    def _bumpless(self, kp, kd):
+        """Move the integral term so the output does not jump when kp or kd change to the given values; an
+        incremental output already moves the actuator smoothly"""
+        if not self.first_update_call and not self.incremental:
+            self.integral += (self.kp - kp) * self.previous_error + (self.kd - kd) * self.derivative
+
     def update_kp(self, new_value):
-        """Update proportional gain
-        
+        """Update proportional gain without a jump of the output
+
         Arg:
             new_value(float): New proportional constant
         """
-        self.kp = new_value 
+        self._bumpless(new_value, self.kd)
+        self.kp = new_value
 
     def update_ki(self, new_value):
-        """Update intergral gain
-        
+        """Update intergral gain; the integral term is kept, so the output does not jump
+
         Arg:
             new_value(float): New integral constant
         """
-        self.ki = new_value 
+        self.ki = new_value
 
     def update_kd(self, new_value):
-        """Update proportional gain
-            
+        """Update derivative gain without a jump of the output
+
             Arg:
-                new_value(float): New proportional constant
+                new_value(float): New derivative constant
             """
-        self.kd = new_value 
-    
+        self._bumpless(self.kp, new_value)
+        self.kd = new_value
+
     def update_setpoint(self, new_value):
         """Update the setpoint for PID controller
-        
+
         Arg:
             new_value(float): New setpoint
         """
         self.setpoint = new_value
+
+    def set_output_limits(self, lower=None, upper=None):
+        """Set the bounds of the correction
+
+        Args:
+            lower(float): Lower bound; None for no bound
+            upper(float): Upper bound; None for no bound
+        """
+        if lower is not None and upper is not None and lower > upper:
+            raise ValueError("lower output limit above the upper one")
+        self.lower, self.upper = lower, upper
+        self.integral = self._clamp(self.integral)
@@ -0,0 +1,277 @@
+import itertools
+import math
+import time
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .pid_controller import PIDController
+from .config import save_laser_config
+
+# Half width in cm^-1 of the window the PID stops correcting in (1 MHz), as in LaserControl.pid_filter_control
+LOCK_WINDOW = 0.00002
+# Score names and whether larger is better
+OBJECTIVES = {"settling_time": False, "overshoot": False, "rms": False, "in_window": True}
+
+
+class CavityModel:
+    """Discrete-time model of the reference cavity loop as LaserControl runs it.
+
+    Every loop period the wavemeter reads wavenumber0 - tuner / conversion + drift + noise, rounded to the
+    wavemeter resolution, and the controller sets a new tuner value. A tuner command acts after dead_time and is
+    then followed with a first-order response. The controller's conversion estimate is off by conversion_error."""
+    def __init__(self, conversion: float = 60., dead_time: float = 0.1, response_time: float = 0.05,
+                 period: float = 0.1, noise: float = 2e-6, drift: float = 2e-6, resolution: float = 1e-5,
+                 conversion_error: float = 0.05, nominal_conversion: float = 60., max_step: float = 0.5):
+        """Constructor function
+
+        Args:
+            conversion(float): Tuner percent per cm^-1 of the plant
+            dead_time(float): Time in seconds from a command to its first effect
+            response_time(float): Time constant in seconds of the tuner following a command
+            period(float): Loop period in seconds
+            noise(float): Standard deviation of the measured wavenumber in cm^-1
+            drift(float): Random walk of the wavenumber in cm^-1 per sqrt(s)
+            resolution(float): Wavemeter resolution in cm^-1
+            conversion_error(float): Relative error of the controller's conversion estimate
+            nominal_conversion(float): Conversion the PID gains are meant for, see LaserControl.NOMINAL_CONVERSION
+            max_step(float): Largest PID correction per step in tuner percent, see LaserControl.MAX_PID_STEP
+        """
+        self.conversion = conversion
+        self.dead_time = dead_time
+        self.response_time = response_time
+        self.period = period
+        self.noise = noise
+        self.drift = drift
+        self.resolution = resolution
+        self.conversion_error = conversion_error
+        self.nominal_conversion = nominal_conversion
+        self.max_step = max_step
+
+    @classmethod
+    def from_config(cls, config: dict, **overrides):
+        """Identify the model from the stored settings of a laser (calibration and latency measurement)
+
+        Args:
+            config(dict): Settings, see load_laser_config
+            overrides: Model parameters to set explicitly
+
+        Return:
+            CavityModel: Model with the measured conversion and dead time where they are known
+        """
+        params = {}
+        if "conversion" in config:
+            params["conversion"] = config["conversion"]
+        latency = config.get("latency") or {}
+        if latency.get("p50") is not None:
+            params["dead_time"] = latency["p50"]
+        calibration = config.get("calibration") or {}
+        if calibration.get("residual_std"):
+            params["noise"] = calibration["residual_std"]
+        params.update(overrides)
+        return cls(**params)
+
+    def to_dict(self):
+        """Return:
+            dict: Model parameters
+        """
+        return dict(vars(self))
+
+
+def simulate(kp: float, ki: float, kd: float, model: CavityModel, step: float = 0.01, duration: float = 20.,
+             seed: int = 0, window: float = LOCK_WINDOW, trace: bool = False):
+    """Closed-loop simulation of one lock: the feed-forward jump to the target followed by PID control with the
+    lock window, as LaserControl does it
+
+    Args:
+        kp, ki, kd(float): PID gains
+        model(CavityModel): Plant
+        step(float): Distance of the target from the start in cm^-1
+        duration(float): Simulated time in seconds
+        seed(int): Seed of the noise and drift
+        window(float): Half width of the lock window in cm^-1
+        trace(bool): Also return the measured wavenumber error of every step
+
+    Return:
+        dict: settling_time (seconds until the error stays inside the window, inf if it does not), overshoot
+        (largest excursion past the target in cm^-1), rms (error in cm^-1 over the run) and in_window (fraction of
+        steps inside the window); with trace, errors as an np.ndarray
+    """
+    n = max(int(round(duration / model.period)), 1)
+    dt = model.period
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(0., model.noise, n)
+    drift = np.cumsum(rng.normal(0., model.drift * math.sqrt(dt), n))
+    # Loop periods a command waits before it acts, beyond the one until the next sample
+    delay = max(math.ceil(model.dead_time / dt - 1e-9) - 1, 0)
+    alpha = 1. - math.exp(-dt / model.response_time) if model.response_time > 0 else 1.
+    conversion = model.conversion * (1. + model.conversion_error)  # what the controller believes
+    scale = conversion / model.nominal_conversion
+    resolution = model.resolution
+    limit = model.max_step / abs(scale)  # the scaled correction is bounded, see LaserControl._pid_control
+    pid = PIDController(kp, ki, kd, step, output_limits=(-limit, limit), derivative_filter=0.3, incremental=True)
+    pid_step = pid.step
+    commands = [0.] * delay  # tuner commands still on their way
+    command = 0.
+    position = 0.
+    errors = np.empty(n)
+    first = True
+    for i in range(n):
+        measured = -position / model.conversion + drift[i] + noise[i]
+        if resolution:
+            measured = round(measured / resolution) * resolution
+        error = step - measured
+        errors[i] = error
+        if i == 0:
+            command -= error * conversion  # feed-forward jump, see LaserControl.wavelength_setter
+        elif -window <= error <= window:
+            first = True  # inside the window the PID loop starts over, see LaserControl.pid_filter_control
+            pid.new_loop()
+        else:
+            u = pid_step(step, measured, None if first else dt)
+            first = False
+            command -= min(max(u * scale, -model.max_step), model.max_step)
+        commands.append(command)
+        position += (commands.pop(0) - position) * alpha
+    abs_errors = np.abs(errors)
+    outside = np.nonzero(abs_errors > window)[0]
+    if len(outside) == 0:
+        settling_time = 0.
+    elif outside[-1] == n - 1:
+        settling_time = math.inf
+    else:
+        settling_time = float(outside[-1] + 1) * dt
+    # Past the target means the error has the opposite sign of the step
+    overshoot = max(0., float(np.max(-np.sign(step) * errors))) if step else float(abs_errors.max())
+    result = {"settling_time": settling_time,
+              "overshoot": overshoot,
+              "rms": float(np.sqrt(np.mean(errors[1:] ** 2))) if n > 1 else float(abs_errors[0]),
+              "in_window": float(np.mean(abs_errors <= window))}
+    if trace:
+        result["errors"] = errors
+    return result
+
+
+def evaluate(gains, model: CavityModel, steps=(0.001, 0.01, -0.01), seeds: int = 3, duration: float = 20.):
+    """Score one gain set over several lock steps and noise seeds
+
+    Args:
+        gains(tuple): (kp, ki, kd)
+        model(CavityModel): Plant
+        steps(tuple): Lock steps in cm^-1
+        seeds(int): Number of noise seeds per step
+        duration(float): Simulated time per lock in seconds
+
+    Return:
+        dict: kp, ki, kd and the scores of simulate, averaged; settling_time is the worst case
+    """
+    kp, ki, kd = gains
+    runs = [simulate(kp, ki, kd, model, step, duration, seed) for step in steps for seed in range(seeds)]
+    return {"kp": kp, "ki": ki, "kd": kd,
+            "settling_time": max(run["settling_time"] for run in runs),
+            "overshoot": float(np.mean([run["overshoot"] for run in runs])),
+            "rms": float(np.mean([run["rms"] for run in runs])),
+            "in_window": float(np.mean([run["in_window"] for run in runs]))}
+
+
+def _evaluate_chunk(args):
+    """Process pool worker: score a chunk of gain sets"""
+    chunk, model_params, steps, seeds, duration = args
+    model = CavityModel(**model_params)
+    return [evaluate(gains, model, steps, seeds, duration) for gains in chunk]
+
+
+def search(model: CavityModel, kp_values, ki_values, kd_values, steps=(0.001, 0.01, -0.01), seeds: int = 3,
+           duration: float = 20., workers: int = None, chunk_size: int = 16):
+    """Score every combination of the given gains on a process pool
+
+    Args:
+        model(CavityModel): Plant
+        kp_values, ki_values, kd_values(list): Gains to combine
+        steps(tuple): Lock steps in cm^-1
+        seeds(int): Number of noise seeds per step
+        duration(float): Simulated time per lock in seconds
+        workers(int): Number of processes; the number of CPUs if None, 1 to run in this process
+        chunk_size(int): Gain sets per task
+
+    Return:
+        list: Scores of every gain set, see evaluate
+    """
+    grid = list(itertools.product(kp_values, ki_values, kd_values))
+    chunks = [grid[i:i + chunk_size] for i in range(0, len(grid), chunk_size)]
+    tasks = [(chunk, model.to_dict(), tuple(steps), seeds, duration) for chunk in chunks]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [result for task in tasks for result in _evaluate_chunk(task)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [result for chunk in pool.map(_evaluate_chunk, tasks) for result in chunk]
+
+
+def pareto_front(results, objectives=None):
+    """Keep the gain sets no other set beats on every score
+
+    Args:
+        results(list): Scores, see evaluate
+        objectives(dict): Score names and whether larger is better; OBJECTIVES if None
+
+    Return:
+        list: Non-dominated scores, by settling time
+    """
+    objectives = OBJECTIVES if objectives is None else objectives
+    if not results:
+        return []
+    # Minimize every column
+    costs = np.array([[-r[name] if larger else r[name] for name, larger in objectives.items()] for r in results])
+    costs = np.nan_to_num(costs, posinf=np.finfo(np.float64).max)
+    dominated = np.zeros(len(results), dtype=bool)
+    for i in range(len(results)):
+        if dominated[i]:
+            continue
+        beats = np.all(costs <= costs[i], axis=1) & np.any(costs < costs[i], axis=1)
+        if beats.any():
+            dominated[i] = True
+    front = [r for r, d in zip(results, dominated) if not d]
+    return sorted(front, key=lambda r: (r["settling_time"], r["rms"]))
+
+
+def choose(front, weights=None):
+    """Pick one gain set of a Pareto front by a weighted sum of its scores, each scaled to 0..1 over the front
+
+    Args:
+        front(list): Pareto front, see pareto_front
+        weights(dict): Weight per score; equal weights if None
+
+    Return:
+        dict: Chosen scores and gains, None for an empty front
+    """
+    if not front:
+        return None
+    weights = weights or {name: 1. for name in OBJECTIVES}
+    total = np.zeros(len(front))
+    for name, weight in weights.items():
+        values = np.array([r[name] for r in front], dtype=np.float64)
+        if OBJECTIVES.get(name):
+            values = -values
+        finite = np.isfinite(values)
+        values[~finite] = values[finite].max() * 2 if finite.any() else 1.
+        span = values.max() - values.min()
+        total += weight * ((values - values.min()) / span if span > 0 else 0.)
+    return front[int(np.argmin(total))]
+
+
+def save_gains(tag: str, result: dict, model: CavityModel = None):
+    """Store gains in the settings of a laser, so LaserControl uses them at its next startup unless they were changed
+    on the controller since
+
+    Args:
+        tag(str): Laser tag
+        result(dict): Scores with kp, ki and kd, see evaluate
+        model(CavityModel): Model the gains were tuned on, stored with them
+
+    Return:
+        dict: All stored settings of the laser
+    """
+    pid = {"kp": result["kp"], "ki": result["ki"], "kd": result["kd"], "time": time.time(),
+           "scores": {name: result[name] for name in OBJECTIVES if name in result}}
+    if model is not None:
+        pid["model"] = model.to_dict()
+    return save_laser_config(tag, {"pid": pid})
@@ -0,0 +1,121 @@
+import threading
+import time
+import numpy as np
+from .soft_pv import SoftPV
+from .session_recorder import FORMATS, read_session, read_metadata
+from .change_filter import expand_runs
+
+
+def get_run_interval(paths, times, counts):
+    """Find the polling interval of a run-length recording
+
+    Args:
+        paths(list): Recorded files in order, or a single path
+        times(np.ndarray): Time of the first sample of every run
+        counts(np.ndarray): Number of samples in every run
+
+    Return:
+        float: Reading frequency stored in the session metadata, else the median time per sample between runs
+    """
+    first = paths if isinstance(paths, str) else paths[0]
+    if first.endswith(tuple(FORMATS.values())):
+        interval = read_metadata(first).get("reading_frequency")
+        if interval:
+            return float(interval)
+    spacing = np.diff(times) / counts[:-1]
+    spacing = spacing[spacing > 0]
+    return float(np.median(spacing)) if len(spacing) else 0.
+
+
+class ReplaySource(SoftPV):
+    """Wavenumber source that plays a recorded session back through the reader pipeline.
+
+    Every recorded sample is put() with its recorded time stamp, so a reader in monitor mode with
+    timestamps="source" rebuilds the original timeline. Runs saved with a Count column are expanded back into the
+    polled samples first. Playback runs in real time (speed=1), accelerated (speed=N) or as fast as possible
+    (speed=None)."""
+    def __init__(self, paths, speed: float = 1., pvname: str = "Replay:wavenumber", loop: bool = False,
+                 interval: float = None):
+        """Constructor function that loads the recording
+
+        Args:
+            paths(list): Recorded .arrows/.parquet/.csv files in order, or a single path
+            speed(float): Playback speed relative to real time; None to play as fast as possible
+            pvname(str): Name reported to callbacks
+            loop(bool): Specifies whether to start over at the end of the recording
+            interval(float): Polling interval in seconds the runs were recorded with; taken from the session
+                metadata or estimated from the runs if None
+        """
+        table = read_session(paths)
+        self.times = np.asarray(table.column("Time").to_numpy(), dtype=np.float64)
+        self.wnums = np.asarray(table.column("Wavenumber").to_numpy(), dtype=np.float64)
+        if "Count" in table.column_names:
+            counts = np.asarray(table.column("Count").to_numpy(), dtype=np.int64)
+            if interval is None:
+                interval = get_run_interval(paths, self.times, counts)
+            self.times, self.wnums = expand_runs(self.times, self.wnums, counts, interval)
+        super().__init__(pvname, float(self.wnums[0]) if len(self.wnums) else None)
+        self.speed = speed
+        self.loop = loop
+        self.position = 0
+        self.time_shift = 0.  # added to recorded time stamps so looped playback keeps going forward in time
+        self.replay_thread = None
+        self.is_replaying = False
+        self.done = threading.Event()
+
+    def __len__(self):
+        return len(self.times)
+
+    def start(self):
+        """Start playing back on a child thread"""
+        if self.is_replaying:
+            return
+        self.is_replaying = True
+        self.done.clear()
+        self.replay_thread = threading.Thread(target=self._replay_loop, daemon=True)
+        self.replay_thread.start()
+
+    def _replay_loop(self):
+        """Loop to put the recorded samples at their (scaled) recorded times"""
+        while self.is_replaying:
+            if len(self.times) == 0:
+                break
+            start_wall, start_data = time.monotonic(), self.times[self.position]
+            while self.is_replaying and self.position < len(self.times):
+                t, value = self.times[self.position], self.wnums[self.position]
+                if self.speed:
+                    delay = start_wall + (t - start_data) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.put(float(value), timestamp=float(t) + self.time_shift)
+                self.position += 1
+            if not self.loop or not self.is_replaying:
+                break
+            self.position = 0
+            self.time_shift += self.times[-1] - self.times[0] + (self.times[1] - self.times[0] if len(self.times) > 1 else 0.)
+        self.is_replaying = False
+        self.done.set()
+
+    def wait_done(self, timeout: float = None):
+        """Block until the recording has been played back
+
+        Arg:
+            timeout(float): Maximum time to wait in seconds
+
+        Return:
+            bool: True if playback finished
+        """
+        return self.done.wait(timeout)
+
+    def get_progress(self):
+        """Return:
+            float: Fraction of the recording played back
+        """
+        return self.position / len(self.times) if len(self.times) else 1.
+
+    def stop(self):
+        """Stop playing back"""
+        self.is_replaying = False
+        if self.replay_thread:
+            self.replay_thread.join()
+            self.replay_thread = None
@@ -0,0 +1,107 @@
+import threading
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-capacity circular buffer backed by a preallocated NumPy array.
+
+    Each row holds one sample, e.g. (timestamp, wavenumber). Appending is O(1) and never reallocates; once the
+    buffer is full the oldest row is overwritten. All access goes through a lock so a reader thread can take a
+    consistent snapshot while another thread keeps appending."""
+    def __init__(self, capacity: int, width: int = 2, dtype=np.float64):
+        """Constructor function that preallocates the storage
+
+        Args:
+            capacity(int): Maximum number of rows kept in the buffer
+            width(int): Number of columns per row
+            dtype(np.dtype): Data type of the storage
+        """
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = int(capacity)
+        self.width = int(width)
+        self._data = np.zeros((self.capacity, self.width), dtype=dtype)
+        self._head = 0  # index where the next row is written
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def append(self, *row):
+        """Append one row, overwriting the oldest one if the buffer is full
+
+        Args:
+            row(float): One value per column
+        """
+        with self._lock:
+            self._data[self._head] = row
+            self._head = (self._head + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+
+    def last(self):
+        """Get the latest row
+
+        Returns:
+            np.ndarray: Copy of the latest row, or None if the buffer is empty
+        """
+        with self._lock:
+            if self._size == 0:
+                return None
+            return self._data[self._head - 1].copy()
+
+    def snapshot(self):
+        """Get a consistent copy of the buffer in chronological order
+
+        Returns:
+            tuple: One contiguous np.ndarray per column, oldest row first
+        """
+        with self._lock:
+            if self._size < self.capacity:
+                block = self._data[:self._size].copy()
+            else:
+                block = np.concatenate((self._data[self._head:], self._data[:self._head]))
+        return tuple(np.ascontiguousarray(block[:, i]) for i in range(self.width))
+
+    def between(self, lower: float, upper: float, column: int = 0):
+        """Get the rows whose value in column lies in [lower, upper], assuming that column never decreases (e.g. time)
+
+        Args:
+            lower(float): Lower bound
+            upper(float): Upper bound
+            column(int): Column to select on
+
+        Returns:
+            tuple: One contiguous np.ndarray per column, oldest row first
+        """
+        with self._lock:
+            if self._size < self.capacity:
+                segments = (self._data[:self._size],)
+            else:
+                segments = (self._data[self._head:], self._data[:self._head])
+            parts = []
+            for segment in segments:
+                keys = segment[:, column]
+                start, stop = np.searchsorted(keys, lower, 'left'), np.searchsorted(keys, upper, 'right')
+                if stop > start:
+                    parts.append(segment[start:stop])
+            block = np.concatenate(parts) if parts else np.empty((0, self.width), dtype=self._data.dtype)
+        return tuple(np.ascontiguousarray(block[:, i]) for i in range(self.width))
+
+    def first(self):
+        """Get the oldest row
+
+        Returns:
+            np.ndarray: Copy of the oldest row, or None if the buffer is empty
+        """
+        with self._lock:
+            if self._size == 0:
+                return None
+            return self._data[(self._head - self._size) % self.capacity].copy()
+
+    def clear(self):
+        """Drop all rows without releasing the storage"""
+        with self._lock:
+            self._head = 0
+            self._size = 0
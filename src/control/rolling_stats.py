@@ -0,0 +1,151 @@
+import math
+import threading
+from collections import deque
+
+
+class RollingWindow:
+    """Statistics over the last `size` samples, updated in O(1) per sample.
+
+    Running sums are kept relative to a reference value (the first sample), because wavenumbers around 1e4 cm^-1
+    with 1e-5 resolution would lose all precision in a plain sum of squares. Min and max come from monotonic deques.
+    The sums are recomputed from the window once per `size` samples so rounding errors cannot build up."""
+    def __init__(self, size: int):
+        """Constructor function that allocates the window
+
+        Arg:
+            size(int): Number of samples in the window
+        """
+        if size <= 0:
+            raise ValueError("window size must be positive")
+        self.size = int(size)
+        self.clear()
+
+    def clear(self):
+        """Drop all samples"""
+        self.values = [0.] * self.size
+        self.count = 0  # total number of samples added
+        self.ref = None
+        self.sum = 0.
+        self.sumsq = 0.
+        self.min_deque = deque()  # (index, value), values increasing
+        self.max_deque = deque()  # (index, value), values decreasing
+
+    def add(self, x: float):
+        """Add one sample, dropping the oldest one if the window is full
+
+        Arg:
+            x(float): New sample
+        """
+        if self.ref is None:
+            self.ref = x
+        i = self.count
+        slot = i % self.size
+        d = x - self.ref
+        if i >= self.size:
+            old = self.values[slot]
+            self.sum -= old
+            self.sumsq -= old * old
+        self.values[slot] = d
+        self.sum += d
+        self.sumsq += d * d
+        self.count += 1
+        if self.count % self.size == 0:
+            self.sum = math.fsum(self.values)
+            self.sumsq = math.fsum(v * v for v in self.values)
+
+        start = self.count - self.size
+        while self.min_deque and self.min_deque[-1][1] >= x:
+            self.min_deque.pop()
+        self.min_deque.append((i, x))
+        while self.min_deque[0][0] < start:
+            self.min_deque.popleft()
+        while self.max_deque and self.max_deque[-1][1] <= x:
+            self.max_deque.pop()
+        self.max_deque.append((i, x))
+        while self.max_deque[0][0] < start:
+            self.max_deque.popleft()
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def get(self, target: float = None):
+        """Get the statistics of the window
+
+        Arg:
+            target(float): Value to compute the RMS deviation from, e.g. the lock target
+
+        Return:
+            dict: count, mean, std, min, max, p2p and rms (deviation from target, None without target); None if empty
+        """
+        n = len(self)
+        if n == 0:
+            return None
+        mean_d = self.sum / n
+        var = max(0., self.sumsq / n - mean_d * mean_d)
+        low, high = self.min_deque[0][1], self.max_deque[0][1]
+        stats = {"count": n,
+                 "mean": self.ref + mean_d,
+                 "std": math.sqrt(var),
+                 "min": low,
+                 "max": high,
+                 "p2p": high - low,
+                 "rms": None}
+        if target is not None:
+            offset = self.ref + mean_d - target
+            stats["rms"] = math.sqrt(var + offset * offset)
+        return stats
+
+
+class RollingStats:
+    """Rolling statistics of one stream over several window sizes, safe to query from another thread"""
+    def __init__(self, windows=(10, 100, 600)):
+        """Constructor function that makes one RollingWindow per size
+
+        Arg:
+            windows(tuple): Window sizes in samples
+        """
+        self.windows = {int(size): RollingWindow(size) for size in windows}
+        self._lock = threading.Lock()
+
+    def add(self, x: float):
+        """Add one sample to every window
+
+        Arg:
+            x(float): New sample
+        """
+        with self._lock:
+            for window in self.windows.values():
+                window.add(x)
+
+    def get(self, size: int = None, target: float = None):
+        """Get the statistics of one window
+
+        Args:
+            size(int): Window size in samples; the largest window if None
+            target(float): Value to compute the RMS deviation from
+
+        Return:
+            dict: See RollingWindow.get
+        """
+        if size is None:
+            size = max(self.windows)
+        with self._lock:
+            return self.windows[size].get(target)
+
+    def get_all(self, target: float = None):
+        """Get the statistics of every window
+
+        Arg:
+            target(float): Value to compute the RMS deviation from
+
+        Return:
+            dict: Window size to statistics
+        """
+        with self._lock:
+            return {size: window.get(target) for size, window in self.windows.items()}
+
+    def clear(self):
+        """Drop all samples"""
+        with self._lock:
+            for window in self.windows.values():
+                window.clear()
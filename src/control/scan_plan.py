@@ -0,0 +1,340 @@
+import csv
+import json
+import os
+import numpy as np
+
+# Largest step between two targets in cm^-1, the same guard as the Scan tab
+MAX_SCAN_STEP = 0.1
+
+
+def segment_targets(segment: dict):
+    """Targets of one segment of a scan plan
+
+    A segment is one of
+        {"start": a, "end": b, "steps": n}: n targets from a to b
+        {"start": a, "end": b, "step": s}: targets from a to b every s cm^-1 (b included if it is on the grid)
+        {"center": c, "span": w, "steps": n}: n targets over c - w / 2 .. c + w / 2, e.g. dense around a resonance
+        {"targets": [...]}: the given targets
+    with "dwell" in seconds, either one value or one per target.
+
+    Arg:
+        segment(dict): Segment of a plan
+
+    Returns:
+        np.ndarray: Targets in cm^-1
+        np.ndarray: Dwell time of every target in seconds
+    """
+    if "targets" in segment:
+        targets = np.asarray(segment["targets"], dtype=np.float64)
+    elif "center" in segment:
+        half = segment["span"] / 2
+        targets = np.linspace(segment["center"] - half, segment["center"] + half, int(segment["steps"]))
+    elif "step" in segment:
+        start, end, step = segment["start"], segment["end"], abs(segment["step"])
+        if step == 0:
+            raise ValueError("Segment step must not be 0")
+        count = int(np.floor(abs(end - start) / step + 1e-9)) + 1
+        targets = start + np.sign(end - start) * step * np.arange(count)
+    elif "start" in segment:
+        targets = np.linspace(segment["start"], segment["end"], int(segment["steps"]))
+    else:
+        raise ValueError(f"Segment needs targets, center/span/steps or start/end/steps: {segment}")
+    if "dwell" not in segment:
+        raise ValueError(f"Segment needs a dwell time: {segment}")
+    dwells = np.broadcast_to(np.asarray(segment["dwell"], dtype=np.float64), targets.shape).copy()
+    return targets, dwells
+
+
+class SettleModel:
+    """Time a scan step takes to settle as a linear function of its size, fitted by least squares to the steps
+    LaserControl has seen settle, and starting from a prior of base + per_wnum * step size"""
+    def __init__(self, base: float = 1., per_wnum: float = 0., min_points: int = 3):
+        """Constructor function
+
+        Args:
+            base(float): Settle time in seconds of a vanishing step until measured
+            per_wnum(float): Additional settle time in seconds per cm^-1 of step until measured
+            min_points(int): Number of observed steps before the fit replaces the prior
+        """
+        self.base = base
+        self.per_wnum = per_wnum
+        self.min_points = min_points
+        self.sums = np.zeros(5)  # n, sum x, sum y, sum xx, sum xy
+
+    def observe(self, step: float, seconds: float):
+        """Add one step that settled
+
+        Args:
+            step(float): Size of the step in cm^-1
+            seconds(float): Time from the start of the step until it settled
+        """
+        x = abs(step)
+        self.sums += (1., x, seconds, x * x, x * seconds)
+
+    def get(self):
+        """Return:
+            tuple: base in seconds and per_wnum in seconds per cm^-1 of the current model
+        """
+        n, sx, sy, sxx, sxy = self.sums
+        if n < self.min_points:
+            return self.base, self.per_wnum
+        det = n * sxx - sx * sx
+        if det <= 1e-12 * max(n * sxx, 1e-300):
+            # All steps had the same size, only the mean is known
+            return sy / n, self.per_wnum
+        per_wnum = (n * sxy - sx * sy) / det
+        return (sy - per_wnum * sx) / n, per_wnum
+
+    def predict(self, steps):
+        """Arg:
+            steps(np.ndarray): Step sizes in cm^-1
+
+        Return:
+            np.ndarray: Expected settle times in seconds, at least 0
+        """
+        base, per_wnum = self.get()
+        return np.maximum(base + per_wnum * np.abs(steps), 0.)
+
+    def to_dict(self):
+        """Return:
+            dict: Model to store with the laser settings
+        """
+        base, per_wnum = self.get()
+        return {"base": float(base), "per_wnum": float(per_wnum), "points": int(self.sums[0])}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Arg:
+            data(dict): Stored model, see to_dict
+
+        Return:
+            SettleModel: Model starting from the stored one
+        """
+        return cls(base=data.get("base", 1.), per_wnum=data.get("per_wnum", 0.))
+
+
+class ScanPlan:
+    """Targets and dwell times of a scan, made of segments with their own step sizes and dwell times.
+
+    Passes run the targets alternately forwards and backwards, as LaserControl does. Plans are loaded from JSON, with
+    the segments described in segment_targets, or from CSV files with a target and optionally a dwell column."""
+    def __init__(self, targets, dwells, passes: int = 1, settle: dict = None, name: str = None):
+        """Constructor function
+
+        Args:
+            targets(np.ndarray): Targets of the first pass in cm^-1
+            dwells(np.ndarray): Dwell time of every target in seconds
+            passes(int): Number of passes
+            settle(dict): Settling settings of LaserControl.start_scan (wait_for_settle, settle_tolerance, ...)
+            name(str): Name of the plan
+        """
+        self.targets = np.asarray(targets, dtype=np.float64)
+        self.dwells = np.asarray(dwells, dtype=np.float64)
+        if self.targets.ndim != 1 or len(self.targets) == 0:
+            raise ValueError("Scan plan needs at least one target")
+        if self.dwells.shape != self.targets.shape:
+            raise ValueError("Scan plan needs one dwell time per target")
+        self.passes = int(passes)
+        self.settle = dict(settle or {})
+        self.name = name
+
+    @classmethod
+    def linear(cls, start: float, end: float, steps: int, dwell: float, passes: int = 1):
+        """Arg:
+            start, end(float): First and last target in cm^-1
+            steps(int): Number of targets
+            dwell(float): Dwell time per target in seconds
+            passes(int): Number of passes
+
+        Return:
+            ScanPlan: The linear scan of the Scan tab
+        """
+        targets = np.linspace(start, end, int(steps))
+        return cls(targets, np.full(len(targets), float(dwell)), passes)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Arg:
+            data(dict): {"segments": [...], "passes": n, "settle": {...}, "name": ...}
+
+        Return:
+            ScanPlan: Plan of the concatenated segments; a segment starting on the target the previous one ended on
+            does not repeat it
+        """
+        targets, dwells = [], []
+        for segment in data.get("segments", []):
+            t, d = segment_targets(segment)
+            if targets and len(t) and len(targets[-1]) and np.isclose(t[0], targets[-1][-1], rtol=0., atol=1e-9):
+                t, d = t[1:], d[1:]
+            targets.append(t)
+            dwells.append(d)
+        if not targets:
+            raise ValueError("Scan plan has no segments")
+        return cls(np.concatenate(targets), np.concatenate(dwells), data.get("passes", 1), data.get("settle"),
+                   data.get("name"))
+
+    @classmethod
+    def load(cls, path: str, dwell: float = None):
+        """Load a plan from a JSON or CSV file
+
+        Args:
+            path(str): File of the plan
+            dwell(float): Dwell time for CSV files without a dwell column
+
+        Return:
+            ScanPlan: Loaded plan
+        """
+        with open(path) as f:
+            text = f.read()
+        name, ext = os.path.splitext(os.path.basename(path))
+        return cls.parse(text, "json" if ext == ".json" else "csv", dwell, name)
+
+    @classmethod
+    def parse(cls, text: str, fmt: str, dwell: float = None, name: str = None):
+        """Make a plan from the contents of a plan file, e.g. an uploaded one
+
+        Args:
+            text(str): Contents of the file
+            fmt(str): "json" or "csv"
+            dwell(float): Dwell time for CSV rows without one
+            name(str): Name of the plan unless the file gives one
+
+        Return:
+            ScanPlan: Parsed plan
+        """
+        if fmt == "json":
+            data = json.loads(text)
+            data.setdefault("name", name)
+            return cls.from_dict(data)
+        if fmt == "csv":
+            return cls.from_csv(text, dwell, name)
+        raise ValueError(f"Unknown scan plan format: {fmt}")
+
+    @classmethod
+    def from_csv(cls, text: str, dwell: float = None, name: str = None):
+        """Arg:
+            text(str): Rows of target[,dwell], optionally under a header
+            dwell(float): Dwell time for rows without one
+            name(str): Name of the plan
+
+        Return:
+            ScanPlan: Plan of the rows in order
+        """
+        targets, dwells = [], []
+        for row in csv.reader(text.splitlines()):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            try:
+                target = float(row[0])
+            except ValueError:
+                continue  # header
+            value = float(row[1]) if len(row) > 1 and row[1].strip() else dwell
+            if value is None:
+                raise ValueError(f"No dwell time for target {target}")
+            targets.append(target)
+            dwells.append(value)
+        return cls(targets, dwells, name=name)
+
+    def to_dict(self):
+        """Return:
+            dict: Plan as one target segment, loadable with from_dict
+        """
+        return {"name": self.name, "passes": self.passes, "settle": self.settle,
+                "segments": [{"targets": self.targets.tolist(), "dwell": self.dwells.tolist()}]}
+
+    def get_steps(self, current: float = None):
+        """Arg:
+            current(float): Wavenumber before the first target; the first step is 0 if None
+
+        Return:
+            np.ndarray: Size in cm^-1 of the step to every target of the first pass
+        """
+        first = 0. if current is None else self.targets[0] - current
+        return np.concatenate([[first], np.diff(self.targets)])
+
+    def validate(self, current: float = None, max_step: float = MAX_SCAN_STEP):
+        """Check the plan before running it
+
+        Args:
+            current(float): Current wavenumber; the first target has to be within max_step of it
+            max_step(float): Largest allowed step in cm^-1
+
+        Raises:
+            ValueError: Describing the first problem found
+        """
+        if not np.all(np.isfinite(self.targets)):
+            raise ValueError("Scan plan has targets that are not finite")
+        if np.any(self.dwells <= 0) or not np.all(np.isfinite(self.dwells)):
+            raise ValueError("Scan plan has dwell times that are not positive")
+        if self.passes < 1:
+            raise ValueError("Scan plan needs at least one pass")
+        steps = np.abs(self.get_steps(current))
+        too_large = np.nonzero(steps >= max_step)[0]
+        if len(too_large):
+            i = too_large[0]
+            if i == 0 and current is not None:
+                raise ValueError(f"First target {self.targets[0]:.5f} is {steps[0]:.5f} cm^-1 away from the current "
+                                 f"wavenumber, more than {max_step} cm^-1")
+            raise ValueError(f"Step {i} from {self.targets[i - 1]:.5f} to {self.targets[i]:.5f} is {steps[i]:.5f} "
+                             f"cm^-1, more than {max_step} cm^-1")
+
+    def get_pass(self, pass_index: int):
+        """Arg:
+            pass_index(int): Pass number from 0
+
+        Returns:
+            np.ndarray: Targets of the pass in scan order
+            np.ndarray: Dwell times of the pass in scan order
+        """
+        if pass_index % 2 == 0:
+            return self.targets, self.dwells
+        return self.targets[::-1], self.dwells[::-1]
+
+    def get_step_times(self, settle_model: SettleModel = None, wait_for_settle: bool = None, current: float = None):
+        """Expected time of every step of every pass
+
+        Args:
+            settle_model(SettleModel): Settle times; a SettleModel with its prior if None
+            wait_for_settle(bool): Whether dwell waits for settling; from the settle settings of the plan if None
+            current(float): Wavenumber before the first target
+
+        Return:
+            np.ndarray: Seconds per step, shape (passes, steps)
+        """
+        settle_model = settle_model or SettleModel()
+        if wait_for_settle is None:
+            wait_for_settle = self.settle.get("wait_for_settle", False)
+        times = np.empty((self.passes, len(self.targets)))
+        for p in range(self.passes):
+            targets, dwells = self.get_pass(p)
+            times[p] = dwells
+            if wait_for_settle:
+                previous = targets[0] if p else current
+                steps = np.concatenate([[0. if previous is None else targets[0] - previous], np.diff(targets)])
+                settle = settle_model.predict(steps)
+                timeout = self.settle.get("settle_timeout")
+                if timeout is not None:
+                    # A step that does not settle in time is given up without dwell
+                    times[p] = np.where(settle >= timeout, timeout, settle + dwells)
+                else:
+                    times[p] += settle
+        return times
+
+    def estimate(self, settle_model: SettleModel = None, wait_for_settle: bool = None, current: float = None,
+                 pass_index: int = 0, step: int = 0, elapsed_in_step: float = 0.):
+        """Estimate the remaining time of the plan
+
+        Args:
+            settle_model(SettleModel): Settle times
+            wait_for_settle(bool): Whether dwell waits for settling
+            current(float): Wavenumber before the first target
+            pass_index(int): Pass in progress
+            step(int): Step in progress in the pass
+            elapsed_in_step(float): Time spent on the step in progress
+
+        Return:
+            float: Seconds until the plan is done
+        """
+        times = self.get_step_times(settle_model, wait_for_settle, current)
+        remaining = times[pass_index, step:].sum() + times[pass_index + 1:].sum()
+        return float(max(remaining - elapsed_in_step, 0.))
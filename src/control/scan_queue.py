@@ -0,0 +1,406 @@
+import json
+import os
+import threading
+import time
+import uuid
+from .config import config_dir, write_json, load_laser_config
+from .scan_plan import ScanPlan, SettleModel
+from .session_recorder import FORMATS
+
+# Job statuses; "interrupted" jobs were running when the process that ran them ended
+PENDING, RUNNING, DONE, FAILED, CANCELLED, INTERRUPTED = "pending", "running", "done", "failed", "cancelled", "interrupted"
+# Seconds a calibration is expected to take until one has been timed
+DEFAULT_CALIBRATION_TIME = 60.
+
+# One queue per laser for the whole process, so it outlives the UI session that started it
+_queues = {}
+
+
+def get_queue(tag: str, **kwargs):
+    """Get the queue of a laser, making it on first use
+
+    Args:
+        tag(str): Laser tag
+        kwargs: Keyword arguments of ScanJobQueue for a new queue
+
+    Return:
+        ScanJobQueue: Queue of the laser
+    """
+    if tag not in _queues:
+        _queues[tag] = ScanJobQueue(tag, **kwargs)
+    return _queues[tag]
+
+
+def queue_path(tag: str):
+    """Arg:
+        tag(str): Laser tag
+
+    Return:
+        str: Path of the stored queue of the laser
+    """
+    return os.path.join(config_dir(), f"{tag}_queue.json")
+
+
+class ScanJobQueue:
+    """Persistent queue of scan jobs of one laser, run in order on a runner thread.
+
+    Every job is a scan plan with its options: calibrate first, lock to the first target and wait for it to settle
+    before scanning, and the settling settings of the scan. Each job is recorded to its own data file. The queue is
+    stored as JSON on every change, so it survives UI reloads and restarts; jobs left running by a process that ended
+    are marked interrupted and can be retried."""
+    def __init__(self, tag: str, directory: str = None, fmt: str = "arrow", path: str = None, verbose: bool = False):
+        """Constructor function that loads the stored queue
+
+        Args:
+            tag(str): Laser tag
+            directory(str): Directory of the data files; "scans/<tag>" in the settings directory if None
+            fmt(str): Default format of the data files, "arrow", "parquet" or "csv"
+            path(str): File the queue is stored in; see queue_path if None
+            verbose(bool): whether to print messages on the terminal
+        """
+        self.tag = tag
+        self.directory = directory or os.path.join(config_dir(), "scans", tag)
+        self.fmt = fmt
+        self.path = path or queue_path(tag)
+        self.verbose = verbose
+        self.jobs = []
+        self.control = None
+        self.current = None
+        self.runner_thread = None
+        self.is_running = False
+        self.stop_event = threading.Event()
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """Read the stored queue; jobs it lists as running are marked interrupted"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                jobs = json.load(f).get("jobs", [])
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Unable to read the scan queue of {self.tag} from {self.path}: {e}")
+            return
+        for job in jobs:
+            if job.get("status") == RUNNING:
+                job["status"] = INTERRUPTED
+        with self._lock:
+            self.jobs = jobs
+
+    def save(self):
+        """Store the queue"""
+        with self._lock:
+            write_json(self.path, {"tag": self.tag, "jobs": self.jobs})
+
+    def add(self, plan, name: str = None, relock: bool = True, calibrate=False, feed_forward: bool = True,
+            fmt: str = None, **settle):
+        """Append a job
+
+        Args:
+            plan(ScanPlan): Plan to scan
+            name(str): Name of the job and its data file; the plan name if None
+            relock(bool): Lock to the first target and wait for it to settle before the scan
+            calibrate: False, True or keyword arguments of LaserControl.calibrate to calibrate before the scan
+            feed_forward(bool): Start scan steps from the precomputed tuner trajectory
+            fmt(str): Format of the data file; the queue default if None
+            settle: Settling settings of LaserControl.start_scan
+
+        Return:
+            str: Id of the job
+        """
+        job = {"id": uuid.uuid4().hex[:8],
+               "name": name or plan.name or "scan",
+               "plan": plan.to_dict(),
+               "relock": relock,
+               "calibrate": calibrate,
+               "feed_forward": feed_forward,
+               "fmt": fmt or self.fmt,
+               "settle": settle,
+               "status": PENDING,
+               "file": None,
+               "added": time.time(),
+               "started": None,
+               "finished": None,
+               "error": None}
+        with self._lock:
+            self.jobs.append(job)
+            self.save()
+        return job["id"]
+
+    def _find(self, job_id: str):
+        for i, job in enumerate(self.jobs):
+            if job["id"] == job_id:
+                return i, job
+        raise KeyError(f"No scan job {job_id}")
+
+    def remove(self, job_id: str):
+        """Remove a job that is not running
+
+        Arg:
+            job_id(str): Id of the job
+        """
+        with self._lock:
+            i, job = self._find(job_id)
+            if job["status"] == RUNNING:
+                raise RuntimeError("A running job cannot be removed, stop the queue first")
+            del self.jobs[i]
+            self.save()
+
+    def move(self, job_id: str, offset: int):
+        """Move a job up (negative offset) or down in the queue
+
+        Args:
+            job_id(str): Id of the job
+            offset(int): Places to move by
+        """
+        with self._lock:
+            i, job = self._find(job_id)
+            new = min(max(i + offset, 0), len(self.jobs) - 1)
+            self.jobs.insert(new, self.jobs.pop(i))
+            self.save()
+
+    def retry(self, job_id: str):
+        """Queue a failed, cancelled or interrupted job again
+
+        Arg:
+            job_id(str): Id of the job
+        """
+        with self._lock:
+            _, job = self._find(job_id)
+            if job["status"] in (PENDING, RUNNING):
+                return
+            job.update(status=PENDING, error=None, started=None, finished=None)
+            self.save()
+
+    def clear_finished(self):
+        """Remove the jobs that are done"""
+        with self._lock:
+            self.jobs = [job for job in self.jobs if job["status"] != DONE]
+            self.save()
+
+    def get_jobs(self):
+        """Return:
+            list: Copies of the jobs in queue order
+        """
+        with self._lock:
+            return [dict(job) for job in self.jobs]
+
+    def start(self, control):
+        """Run the pending jobs in order on a runner thread
+
+        Arg:
+            control(LaserControl): Controller of the laser to scan with; while a runner is still alive, it must be the
+                one the runner scans with
+        """
+        if self.is_running or (self.runner_thread is not None and self.runner_thread.is_alive()):
+            if control is not self.control:
+                raise RuntimeError("Scan queue is running with another controller, stop it first")
+            # A runner told to stop after its job keeps going instead
+            self.is_running = True
+            if self.verbose:
+                print("Scan queue is already running")
+            return
+        self.control = control
+        self.stop_event.clear()
+        self.is_running = True
+        self.runner_thread = threading.Thread(target=self._runner_loop, daemon=True)
+        self.runner_thread.start()
+
+    def stop(self, cancel_current: bool = False):
+        """Stop running jobs
+
+        Arg:
+            cancel_current(bool): Stop the running scan or calibration now and wait for the runner thread; otherwise
+                the running job is finished first and no other one is started
+        """
+        self.is_running = False
+        if not cancel_current:
+            return
+        self.stop_event.set()
+        # A running calibration does not watch the stop event, stop it before waiting for the runner
+        if self.control is not None and self.control.calibration is not None:
+            self.control.calibration.stop()
+        if self.runner_thread is not None and threading.current_thread() is not self.runner_thread:
+            self.runner_thread.join()
+            self.runner_thread = None
+
+    def _next_job(self):
+        with self._lock:
+            return next((job for job in self.jobs if job["status"] == PENDING), None)
+
+    def _set(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+            self.save()
+
+    def _runner_loop(self):
+        """Loop to run pending jobs until there are none or the queue is stopped"""
+        while self.is_running:
+            job = self._next_job()
+            if job is None:
+                break
+            self.current = job
+            self._set(job, status=RUNNING, started=time.time(), error=None)
+            try:
+                status = self._run_job(job)
+                self._set(job, status=status, finished=time.time())
+            except Exception as e:
+                print(f"Scan job {job['name']} failed: {e}")
+                self._set(job, status=FAILED, finished=time.time(), error=str(e))
+                self._release()
+                # A laser that cannot be reached fails every following job too
+                if isinstance(e, ConnectionError):
+                    break
+            finally:
+                self.current = None
+        self.is_running = False
+
+    def _release(self):
+        """Leave the laser unlocked after a job"""
+        try:
+            self.control.stop_backup_saving()
+            if self.control.scan == 1:
+                self.control.stop_scan()
+            self.control.unlock()
+        except Exception as e:
+            print(f"Unable to release the laser after a scan job: {e}")
+
+    def _check_tweaking(self):
+        """Raise if the tweaking thread of the controller has died"""
+        thread = self.control.tweaking_thread
+        if self.control.is_tweaking and thread is not None and not thread.is_alive():
+            raise ConnectionError("Tweaking loop stopped")
+
+    def get_data_path(self, job):
+        """Arg:
+            job(dict): Job
+
+        Return:
+            str: Data file of the job
+        """
+        suffix = FORMATS.get(job["fmt"], ".csv")
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(job["started"] or time.time()))
+        return os.path.join(self.directory, f"{self.tag}_{stamp}_{job['name']}_{job['id']}{suffix}")
+
+    def _run_job(self, job):
+        """Calibrate, re-lock, and scan one job while recording it to its own file
+
+        Arg:
+            job(dict): Job to run
+
+        Return:
+            str: DONE, or CANCELLED if the queue was stopped with cancel_current
+        """
+        control = self.control
+        plan = ScanPlan.from_dict(job["plan"])
+        settle = dict(plan.settle, **job["settle"])
+        if job["calibrate"]:
+            control.unlock()
+            settings = job["calibrate"] if isinstance(job["calibrate"], dict) else {}
+            if self.stop_event.is_set() or control.calibrate(**settings) is None:
+                self._release()
+                return CANCELLED
+        if job["relock"]:
+            self._relock(plan.targets[0], settle)
+        if self.stop_event.is_set():
+            self._release()
+            return CANCELLED
+        path = self.get_data_path(job)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._set(job, file=path)
+        control.start_backup_saving(path, job["fmt"])
+        try:
+            control.start_scan_plan(plan, feed_forward=job["feed_forward"], **settle)
+            while control.scan == 1:
+                if self.stop_event.wait(0.5):
+                    control.stop_scan()
+                    self._release()
+                    return CANCELLED
+                self._check_tweaking()
+        finally:
+            control.stop_backup_saving()
+        control.stop_tweaking()
+        control.unlock()
+        return DONE
+
+    def _relock(self, target, settle):
+        """Lock to a target and wait until the wavenumber has stayed within the settle tolerance for the hold time
+
+        Args:
+            target(float): Wavenumber to lock to in cm^-1
+            settle(dict): Settling settings, see LaserControl.start_scan
+        """
+        tolerance = settle.get("settle_tolerance", 0.00002)
+        hold = settle.get("settle_hold", 0.5)
+        timeout = settle.get("settle_timeout", 30.)
+        control = self.control
+        control.lock(float(target))
+        start = time.monotonic()
+        since = None
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if abs(control.get_current_wnum() - target) <= tolerance:
+                since = now if since is None else since
+                if now - since >= hold:
+                    if self.verbose:
+                        print(f"Locked to {target:.5f} in {now - start:.1f} s")
+                    return
+            else:
+                since = None
+            if now - start >= timeout:
+                raise RuntimeError(f"Laser did not settle at {target:.5f} cm^-1 within {timeout} s")
+            self._check_tweaking()
+            self.stop_event.wait(0.1)
+
+    def estimate_job(self, job, settle_model: SettleModel = None, config: dict = None):
+        """Expected duration of a job including calibration and re-lock
+
+        Args:
+            job(dict): Job
+            settle_model(SettleModel): Settle times; the stored one of the laser if None
+            config(dict): Stored settings of the laser; loaded if None
+
+        Return:
+            float: Seconds
+        """
+        if config is None:
+            config = load_laser_config(self.tag)
+        if settle_model is None:
+            settle_model = SettleModel.from_dict(config.get("settle", {}))
+        plan = ScanPlan.from_dict(job["plan"])
+        settle = dict(plan.settle, **job["settle"])
+        duration = float(plan.get_step_times(settle_model, settle.get("wait_for_settle", False)).sum())
+        if job["relock"]:
+            duration += float(settle_model.predict([0.])[0]) + settle.get("settle_hold", 0.5)
+        if job["calibrate"]:
+            duration += (config.get("calibration") or {}).get("duration", DEFAULT_CALIBRATION_TIME)
+        return duration
+
+    def get_progress(self):
+        """Get the progress of the queue
+
+        Return:
+            dict: running, numbers of done, failed and pending jobs, name of the current job, ETA of the current job
+            and of the whole queue in seconds
+        """
+        jobs = self.get_jobs()
+        control = self.control
+        config = load_laser_config(self.tag)
+        settle_model = control.settle_model if control is not None else SettleModel.from_dict(config.get("settle", {}))
+        current = self.current
+        current_eta = None
+        if current is not None:
+            current_eta = control.get_scan_eta() if control.scan == 1 else None
+            if current_eta is None:
+                current_eta = self.estimate_job(current, settle_model, config)
+        pending = [job for job in jobs if job["status"] == PENDING]
+        eta = (current_eta or 0.) + sum(self.estimate_job(job, settle_model, config) for job in pending)
+        return {"running": self.is_running,
+                "done": sum(job["status"] == DONE for job in jobs),
+                "failed": sum(job["status"] in (FAILED, INTERRUPTED) for job in jobs),
+                "pending": len(pending),
+                "total": len(jobs),
+                "current": current["name"] if current is not None else None,
+                "current_eta": current_eta,
+                "eta": eta}
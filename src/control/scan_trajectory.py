@@ -0,0 +1,144 @@
+import numpy as np
+
+
+class ScanTrajectory:
+    """Reference cavity tuner values of every step of a scan, precomputed from the tuner model.
+
+    The model is the one the calibration fits, wavenumber = offset + gain * (tuner - center) + direction *
+    hysteresis / 2, where direction is +1 for a tuner moving up and -1 moving down. Passes alternate in direction as
+    in LaserControl._do_scan, so the flipped passes are predicted on the other hysteresis branch. The offset is
+    anchored to the tuner value and wavenumber at the start of the scan, and the trim PID applies at the end of a step
+    is carried over to the next steps, so slow drift does not build up over the scan."""
+    def __init__(self, targets, passes: int, gain: float, hysteresis: float = 0., center: float = 0.,
+                 offset: float = 0.):
+        """Constructor function
+
+        Args:
+            targets(np.ndarray): Wavenumbers of the first pass in cm^-1
+            passes(int): Number of passes; every other one runs the targets backwards
+            gain(float): Wavenumber change per tuner percent in cm^-1
+            hysteresis(float): Wavenumber between the up and down branches in cm^-1
+            center(float): Tuner value the offset refers to
+            offset(float): Wavenumber at center in cm^-1, halfway between the branches
+        """
+        if gain == 0 or not np.isfinite(gain):
+            raise ValueError("Tuner model needs a finite nonzero gain")
+        self.targets = np.asarray(targets, dtype=np.float64)
+        self.passes = max(int(passes), 1)
+        self.gain = gain
+        self.hysteresis = hysteresis
+        self.center = center
+        self.offset = offset
+        self.bias = 0.
+        self.tuners = None
+        self.directions = None
+        self.last_trim = None
+
+    @classmethod
+    def from_calibration(cls, targets, passes: int, calibration: dict):
+        """Arg:
+            targets(np.ndarray): Wavenumbers of the first pass in cm^-1
+            passes(int): Number of passes
+            calibration(dict): Calibration result, see fit_calibration
+
+        Return:
+            ScanTrajectory: Trajectory on the calibrated model
+        """
+        return cls(targets, passes, calibration["gain"], calibration.get("hysteresis", 0.),
+                   calibration.get("center", 0.), calibration.get("offset", 0.))
+
+    @classmethod
+    def from_conversion(cls, targets, passes: int, conversion: float):
+        """Arg:
+            targets(np.ndarray): Wavenumbers of the first pass in cm^-1
+            passes(int): Number of passes
+            conversion(float): Tuner percent per cm^-1
+
+        Return:
+            ScanTrajectory: Trajectory on a linear model without hysteresis
+        """
+        return cls(targets, passes, -1. / conversion)
+
+    def get_pass_targets(self, pass_index: int):
+        """Arg:
+            pass_index(int): Pass number from 0
+
+        Return:
+            np.ndarray: Targets of the pass in scan order
+        """
+        return self.targets if pass_index % 2 == 0 else self.targets[::-1]
+
+    def predict(self, wnum: float, direction: float):
+        """Invert the model
+
+        Args:
+            wnum(float): Wavenumber in cm^-1
+            direction(float): Branch, +1 tuning up, -1 tuning down, 0 between the branches
+
+        Return:
+            float: Tuner value in percent
+        """
+        return self.center + (wnum - self.offset - direction * self.hysteresis / 2) / self.gain
+
+    def plan(self, tuner: float, wnum: float, direction: float = 0.):
+        """Anchor the model to the current tuner value and wavenumber and compute the tuner values of every step
+
+        Args:
+            tuner(float): Current reference cavity tuner value in percent
+            wnum(float): Current wavenumber in cm^-1
+            direction(float): Branch the laser is on, 0 if not known
+
+        Return:
+            np.ndarray: Tuner values of shape (passes, steps)
+        """
+        # Keep the calibrated gain and hysteresis; the offset follows the laser since the calibration
+        self.offset = wnum - self.gain * (tuner - self.center) - direction * self.hysteresis / 2
+        self.bias = 0.
+        self.last_trim = None
+        steps = len(self.targets)
+        self.tuners = np.empty((self.passes, steps))
+        self.directions = np.empty((self.passes, steps))
+        previous_tuner, previous_wnum = tuner, wnum
+        for p in range(self.passes):
+            for j, target in enumerate(self.get_pass_targets(p)):
+                # The tuner moves by the wavenumber change over the gain; a step that stays put keeps the branch
+                move = np.sign((target - previous_wnum) / self.gain)
+                if move != 0:
+                    direction = move
+                self.tuners[p, j] = self.predict(target, direction)
+                self.directions[p, j] = direction
+                previous_wnum = target
+        return self.tuners
+
+    def get_tuner(self, pass_index: int, step: int):
+        """Arg:
+            pass_index(int): Pass number from 0
+            step(int): Step number in the pass from 0
+
+        Return:
+            float: Predicted tuner value of the step, corrected by the trim of the previous steps
+        """
+        return float(self.tuners[pass_index, step] + self.bias)
+
+    def trim(self, pass_index: int, step: int, tuner: float):
+        """Record the tuner value a step ended with after PID trimmed it; the difference to the prediction is
+        carried over to the next steps
+
+        Args:
+            pass_index(int): Pass number from 0
+            step(int): Step number in the pass from 0
+            tuner(float): Tuner value in percent at the end of the step
+
+        Return:
+            float: Trim of the step in tuner percent
+        """
+        self.last_trim = float(tuner - self.tuners[pass_index, step] - self.bias)
+        self.bias = float(tuner - self.tuners[pass_index, step])
+        return self.last_trim
+
+    def get(self):
+        """Return:
+            dict: Model (gain, hysteresis, center, offset), current bias and last trim in tuner percent
+        """
+        return {"gain": self.gain, "hysteresis": self.hysteresis, "center": self.center, "offset": self.offset,
+                "bias": self.bias, "last_trim": self.last_trim}
@@ -0,0 +1,140 @@
+import math
+import threading
+import time
+import numpy as np
+
+
+class FixedRateScheduler:
+    """Deadline-based timer that runs a loop at a fixed rate.
+
+    Deadlines are start + k * period, so time spent in the loop body does not add up into drift the way a plain
+    sleep(period) does. When the body overruns one or more deadlines, they are skipped and counted instead of run
+    back to back, and the loop continues on the same grid. Every tick records the measured period and how late it
+    woke up (jitter) in histograms, with the last bin collecting everything beyond the range."""
+    def __init__(self, period: float, bins: int = 30, period_range: float = 3., jitter_range: float = 1.):
+        """Constructor function
+
+        Args:
+            period(float): Loop period in seconds
+            bins(int): Number of histogram bins
+            period_range(float): Upper edge of the period histogram in periods
+            jitter_range(float): Upper edge of the jitter histogram in periods
+        """
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.bins = bins
+        self.period_range = period_range
+        self.jitter_range = jitter_range
+        self._lock = threading.Lock()
+        self.next_deadline = None
+        self.set_period(period)
+
+    def set_period(self, period: float):
+        """Change the loop period; the histograms are rescaled and cleared
+
+        Arg:
+            period(float): Loop period in seconds
+        """
+        if period <= 0:
+            raise ValueError("period must be positive")
+        with self._lock:
+            self.period = period
+            self.period_edges = np.linspace(0., self.period_range * period, self.bins + 1)
+            self.jitter_edges = np.linspace(0., self.jitter_range * period, self.bins + 1)
+            self._clear_stats()
+            if self.next_deadline is not None:
+                self.next_deadline = time.monotonic() + period
+
+    def _clear_stats(self):
+        """Clear the counters and histograms"""
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self.last_tick = None
+        self.period_count = 0
+        self.period_mean = 0.
+        self.period_m2 = 0.
+        self.period_min = math.inf
+        self.period_max = 0.
+        self.jitter_max = 0.
+        self.jitter_sum = 0.
+        self.period_hist = np.zeros(self.bins, dtype=np.int64)
+        self.jitter_hist = np.zeros(self.bins, dtype=np.int64)
+
+    def reset_stats(self):
+        """Clear the counters and histograms, keeping the schedule"""
+        with self._lock:
+            self._clear_stats()
+
+    def start(self):
+        """Start the schedule; the first deadline is one period from now"""
+        with self._lock:
+            self.next_deadline = time.monotonic() + self.period
+            self.last_tick = None
+
+    def wait(self):
+        """Sleep until the next deadline, or skip the deadlines already missed
+
+        Return:
+            bool: True if the deadline was met, False if the loop body overran it
+        """
+        if self.next_deadline is None:
+            self.start()
+        now = time.monotonic()
+        deadline = self.next_deadline
+        on_time = now <= deadline
+        if on_time:
+            time.sleep(deadline - now)
+            tick = time.monotonic()
+        else:
+            tick = now
+            missed = int((now - deadline) // self.period)
+            deadline += missed * self.period
+        with self._lock:
+            if not on_time:
+                self.overruns += 1
+                self.missed += missed
+            self.next_deadline = deadline + self.period
+            self._record(tick, tick - deadline)
+        return on_time
+
+    def _record(self, tick: float, lateness: float):
+        """Add one tick to the period and jitter statistics"""
+        self.ticks += 1
+        lateness = max(0., lateness)
+        self.jitter_sum += lateness
+        self.jitter_max = max(self.jitter_max, lateness)
+        self.jitter_hist[min(np.searchsorted(self.jitter_edges, lateness, side="right") - 1, self.bins - 1)] += 1
+        if self.last_tick is not None:
+            period = tick - self.last_tick
+            self.period_count += 1
+            diff = period - self.period_mean
+            self.period_mean += diff / self.period_count
+            self.period_m2 += diff * (period - self.period_mean)
+            self.period_min = min(self.period_min, period)
+            self.period_max = max(self.period_max, period)
+            self.period_hist[min(np.searchsorted(self.period_edges, period, side="right") - 1, self.bins - 1)] += 1
+        self.last_tick = tick
+
+    def get_timing(self):
+        """Get the timing statistics of the loop
+
+        Return:
+            dict: target period, ticks, overruns (late ticks), missed (skipped deadlines), period mean/std/min/max,
+            jitter mean/max (lateness after the deadline), and the period and jitter histograms as (counts, edges);
+            times in seconds
+        """
+        with self._lock:
+            count = self.period_count
+            return {"period_target": self.period,
+                    "ticks": self.ticks,
+                    "overruns": self.overruns,
+                    "missed": self.missed,
+                    "period_mean": self.period_mean if count else None,
+                    "period_std": math.sqrt(self.period_m2 / count) if count else None,
+                    "period_min": self.period_min if count else None,
+                    "period_max": self.period_max if count else None,
+                    "jitter_mean": self.jitter_sum / self.ticks if self.ticks else None,
+                    "jitter_max": self.jitter_max if self.ticks else None,
+                    "period_hist": (self.period_hist.copy(), self.period_edges.copy()),
+                    "jitter_hist": (self.jitter_hist.copy(), self.jitter_edges.copy())}
@@ -1,84 +1,113 @@
-import pyarrow as pa
-import pyarrow.csv as pc
-import os
-import ntplib
 import time
 from epics import PV
 import numpy as np
 from typing import List, Dict, Any, Optional
 import threading
-import asyncio
 import traceback
+from collections import deque
+from .ring_buffer import RingBuffer
+from .decimation import DecimationPyramid
+from .rolling_stats import RollingStats
+from .change_filter import ChangeFilter, PublishRateEstimator
+from .backup_writer import BackupWriter, CsvSink
+from .clock import ClockService, make_offset_source
 
 class EMAServerReader:
-    """Server reader that creates a thread to get wavenumber from the server, synchronize time stamp with NTP server time, 
-    and make data for saving and plotting"""
+    """Server reader that creates a thread to get wavenumber from the server, time stamp it with a clock synchronized to
+    NTP, EPICS or local time, and make data for saving and plotting.
+
+    In "poll" mode the reading thread calls pv.get() every reading_frequency seconds. In "monitor" mode the PV pushes
+    every update to a callback that time stamps it on arrival, and the reading thread only records what was pushed.
+    In "external" mode the reader has no thread of its own and another object (e.g. EMAMultiReader) calls record()."""
     def __init__(self, pv_name: str, reading_frequency: float = 0.1, ntp_sync_interval: float = 60, verbose: bool = False, plot_limit: int = 300, 
-                 saving_interval: int = 30):
+                 saving_interval: int = 30, acquisition_mode: str = "poll", source=None, history_capacity: int = 100000,
+                 time_source: str = "ntp", clock=None, stats_windows=(10, 100, 600), timestamps: str = "arrival",
+                 max_pending: int = 10000, change_only: bool = None):
         """Constructor function that initializes the class.
         
         Args:
             pv_name(str): PV name for getting wavenumber
-            reading_frequency(float): The frequency for reading data
-            ntp_sync_interval(float): The interval to synchronize time stamp with NTP
+            reading_frequency(float): The frequency for reading data in poll mode
+            ntp_sync_interval(float): The interval to synchronize the clock offset with the time source
             verbose(bool): Specifies whether to print message on the back end
-            plot_limit(int): The number of points to be shown on the plot; plot_limit times reading_frequency gives the number of seconds to be plotted.
-            saving_interval(int): The interval to save data to the disk
+            plot_limit(int): The number of points kept for the plot; plot_limit times reading_frequency gives the number of seconds to be plotted.
+            saving_interval(int): The maximum interval between two writes to the disk
+            acquisition_mode(str): "poll" to call pv.get() periodically, "monitor" to record every update the server pushes, "external" to be fed through record()
+            source: WavenumberSource (e.g. SoftPV or ReplaySource) to read from instead of connecting to pv_name through EPICS
+            history_capacity(int): Number of buckets per level of the decimated history used for long plot windows
+            time_source(str): Reference for time stamps: "ntp", "epics" (time stamps of the PV updates) or "local"
+            clock(ClockService): Clock shared with other readers; the reader makes and runs its own from time_source if None
+            stats_windows(tuple): Window sizes in updates of the rolling statistics
+            timestamps(str): In monitor mode, "arrival" to time stamp updates with the clock when they arrive, "source" to keep the time stamps of the source (e.g. recorded ones)
+            max_pending(int): In monitor mode, number of unrecorded updates after which the callback waits for the reading thread; only fast replays get there
+            change_only(bool): Save only samples that differ from the previous one and repeats as a count; on by default except in monitor mode, where every update is real
         """
+        if acquisition_mode not in ("poll", "monitor", "external"):
+            raise ValueError(f"Unknown acquisition mode: {acquisition_mode}")
+        if timestamps not in ("arrival", "source"):
+            raise ValueError(f"Unknown time stamp mode: {timestamps}")
         self.name = pv_name
-        self.pv = PV(pv_name)
+        self.pv = source if source is not None else PV(pv_name)
+        self.acquisition_mode = acquisition_mode
+        self.timestamps = timestamps
+        self.max_pending = max_pending
         self.saving_dir = None
-        self.ntp_client = ntplib.NTPClient()
-        self.timelist = []
-        self.wnumlist = []
+        self.writer = None
+        self.record_columns = ("Time", "Wavenumber", "Count")
+        self.tag_columns = ()
+        self.tags = ()  # labels saved with every sample from now on
+        self.run_tags = ()  # labels of the open run
+        if change_only is None:
+            change_only = acquisition_mode != "monitor"
+        self.change_filter = ChangeFilter() if change_only else None
+        self.publish_rate = PublishRateEstimator()
+        self.last_source_time = None
+        self.last_value = None  # wavenumber of the previous sample
+        self.record_lock = threading.Lock()
         self.saving_interval = saving_interval
         self.reading_frequency = reading_frequency
         self.ntp_sync_interval = ntp_sync_interval
         self.date_format = '%a %b %d %H:%M:%S %Y'
         self.verbose = verbose
-        self.last_ntp_sync_time = time.time()
-        self.offset = 0
-        self.xDat = []
-        self.yDat = []
-        self.y_for_average = np.array([])
+        self.owns_clock = clock is None
+        self.clock = clock if clock is not None else ClockService(source=make_offset_source(time_source, self.pv), sync_interval=ntp_sync_interval, verbose=verbose)
+        self.plot_buffer = RingBuffer(plot_limit, width=2)
+        self.history = DecimationPyramid(capacity=history_capacity)
+        self.stats = RollingStats(stats_windows)
+        self.average_sum = 0.
+        self.average_count = 0
         self.first_time = 0.
         self.plot_limit = plot_limit
         self.reading_thread = None
         self.is_reading = False
+        self.new_data = threading.Condition()
+        self.sample_count = 0  # samples recorded, polls included
+        self.last_sample = (None, None)
+        self.update_count = 0  # real updates of the source
+        self.last_update = (None, None, None)
+        self.pending = deque()
+        self.callback_index = None
 
-    def sync_time_with_ntp(self):
-        """Check the time offset between computer time and server time"""
-        async def sync_time():
-            try:
-                response = await asyncio.get_event_loop().run_in_executor(None, self.ntp_client.request, 'pool.ntp.org')
-                ntp_time = response.tx_time
-                self.offset = ntp_time - time.time()
-                self.last_ntp_sync_time = time.time()
-                if self.verbose:
-                    print(f"Time synchronized with NTP. Offset: {self.offset} seconds")
-            except Exception as e:
-                if self.verbose:
-                    print(f"Error syncing time with NTP: {e}")
-        
-        asyncio.run(sync_time())
-                        
+    def sync_time(self):
+        """Measure the clock offset now instead of waiting for the clock thread. Blocks for as long as the time source takes"""
+        return self.clock.sync()
 
     def get_time(self):
-        """Get time stamp based on server time and synchronize if reaching sync interval
+        """Get time stamp from the synchronized clock. This only does arithmetic, the offset is kept up to date by the clock thread
 
         Returns:
-            float: current time stamp based on server time
+            float: current time stamp based on the time source
         """
-        if time.time() - self.last_ntp_sync_time > self.ntp_sync_interval:
-            self.sync_time_with_ntp()
-        return time.time() + self.offset
+        return self.clock.now()
 
     def get_read_value(self):
-        """Get current wavenumber
+        """Get current wavenumber. Unless polling, this is the latest recorded value, so no round-trip is made
         
         Return:
             float: current wavenumber rounded to 5 decimal places
         """
+        if self.acquisition_mode != "poll" and self.last_sample[1] is not None:
+            return self.last_sample[1]
         try:
             value = self.pv.get()
             value = round(float(value), 5)
@@ -99,22 +128,85 @@ class EMAServerReader:
         scalar = self.get_read_value()
         return current_time, scalar
 
+    def get_latest_sample(self):
+        """Get the latest recorded sample without talking to the server
+
+        Returns:
+            float: time stamp of the latest sample, None if nothing was recorded yet
+            float: wavenumber of the latest sample, None if nothing was recorded yet
+        """
+        with self.new_data:
+            return self.last_sample
+
+    def wait_for_update(self, last_count: int = None, timeout: float = None):
+        """Block until a sample newer than last_count has been recorded
+
+        Args:
+            last_count(int): Sample count the caller has already seen; the current count if not given
+            timeout(float): Maximum time to wait in seconds, forever if None
+
+        Return:
+            int: Sample count of the newest sample, None if timed out
+        """
+        with self.new_data:
+            if last_count is None:
+                last_count = self.sample_count
+            if not self.new_data.wait_for(lambda: self.sample_count > last_count, timeout):
+                return None
+            return self.sample_count
+
+    def wait_for_new_value(self, last_count: int = None, timeout: float = None):
+        """Block until the source has published an update newer than last_count. Unlike wait_for_update, polls that
+        repeat the previous update do not count: a real update has a new value or a new source time stamp
+
+        Args:
+            last_count(int): Update count the caller has already seen; the current count if not given
+            timeout(float): Maximum time to wait in seconds, forever if None
+
+        Return:
+            int: Update count of the newest update, None if timed out
+        """
+        with self.new_data:
+            if last_count is None:
+                last_count = self.update_count
+            if not self.new_data.wait_for(lambda: self.update_count > last_count, timeout):
+                return None
+            return self.update_count
+
+    def get_latest_update(self):
+        """Get the latest real update of the source without talking to the server
+
+        Returns:
+            float: time stamp the update was recorded with, None if there was none yet
+            float: wavenumber of the update, None if there was none yet
+            float: time stamp the source gave the update, None if it gave none
+        """
+        with self.new_data:
+            return self.last_update
+
     def start_reading(self):
-        """Start a child thread for reading data"""
+        """Start a child thread for reading data and subscribe to the PV in monitor mode"""
         if self.is_reading:
             if self.verbose:
                 print("Reading is already in progress.")
             return
         else:
             if self.verbose:
-                print(f"Starting reading for {self.name}")
+                print(f"Starting reading for {self.name} in {self.acquisition_mode} mode")
             self.is_reading = True
-            self.reading_thread = threading.Thread(target=self._reading_loop, daemon=True)
+            if self.acquisition_mode == "external":
+                return
+            if self.owns_clock:
+                self.clock.start()
+            if self.acquisition_mode == "monitor":
+                self.callback_index = self.pv.add_callback(self._on_monitor)
+                self.reading_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+            else:
+                self.reading_thread = threading.Thread(target=self._reading_loop, daemon=True)
             self.reading_thread.start()
 
     def _reading_loop(self):
-        """Loop to make the data for plotting and saving"""
-        t0 = self.get_time()
+        """Loop to poll the PV and make the data for plotting and saving"""
         while self.is_reading:
             try:
                 current_time, current_wnum = self.get_single_value()
@@ -123,131 +215,261 @@ class EMAServerReader:
                         print("Failed to get payload. Continuing.")
                     time.sleep(self.reading_frequency)
                     continue
-                # if self.verbose:
-                #     print("Reading thread doing work")
-
-                #self.update_plot_df(current_time, current_wnum)
-                self.update_plot_df_no_average(current_time, current_wnum)
-                if self.saving_dir is not None:
-                    self.update_save_df(current_time, current_wnum)
-                    if (current_time - t0) >= self.saving_interval:
-                        self.save_full()
-                        t0 = current_time  # Reset the saving time interval
-                # if self.saving_dir is not None:
-                #     self.save_single(current_time, current_wnum, 5)
+                self.record(current_time, current_wnum, getattr(self.pv, "timestamp", None))
                 time.sleep(self.reading_frequency)
             except Exception as e:
                 if self.verbose:
                     print(f"Exception in reading loop: {e}")
 
+    def _on_monitor(self, pvname=None, value=None, timestamp=None, **kwargs):
+        """Monitor callback that time stamps an update on arrival and hands it to the reading thread.
+        It runs on the EPICS callback thread, so it must stay short.
+
+        Args:
+            pvname(str): Name of the PV that was updated
+            value(float): New wavenumber
+            timestamp(float): Time stamp given by the source
+        """
+        if self.timestamps == "source" and timestamp is not None:
+            current_time = timestamp
+        else:
+            current_time = self.get_time()
+        try:
+            current_wnum = round(float(value), 5)
+        except (TypeError, ValueError):
+            return
+        with self.new_data:
+            if len(self.pending) >= self.max_pending:
+                self.new_data.wait_for(lambda: len(self.pending) < self.max_pending or not self.is_reading, timeout=1.)
+            self.pending.append((current_time, current_wnum))
+            self.new_data.notify_all()
+
+    def _monitor_loop(self):
+        """Loop to record the updates pushed by the monitor callback"""
+        while self.is_reading:
+            try:
+                with self.new_data:
+                    if not self.pending:
+                        self.new_data.wait(self.reading_frequency)
+                    batch = list(self.pending)
+                    self.pending.clear()
+                    self.new_data.notify_all()
+                for current_time, current_wnum in batch:
+                    self.record(current_time, current_wnum)
+            except Exception as e:
+                if self.verbose:
+                    print(f"Exception in monitor loop: {e}")
+
+    def record(self, current_time, current_wnum, source_time: float = None):
+        """Make the data for plotting and saving from one sample and wake the threads waiting for it.
+        Every sample counts in sample_count; only real updates of the source (see wait_for_new_value) go to the plot,
+        the history and the statistics and count in update_count. With change_only, a repeat of the previous value
+        only increases the count of the current run; runs are saved as (time of first sample, wavenumber, count) once
+        they end
+
+        Args:
+            current_time(float): time stamp
+            current_wnum(float): wavenumber
+            source_time(float): time stamp the source gave the value, if known; a new one marks a real update
+        """
+        with self.record_lock:
+            if self.change_filter is not None:
+                starts_run = self.change_filter.current() is None
+                is_new, closed = self.change_filter.add(current_time, current_wnum)
+                if closed is not None and self.writer is not None:
+                    self.writer.put(*closed, *self.run_tags)
+                if is_new or starts_run:
+                    self.run_tags = self.tags
+            elif self.writer is not None:
+                self.writer.put(current_time, current_wnum, 1, *self.tags)
+            # A poll repeating the last update is not a real update: a real one brings a new value or a new source
+            # time stamp, and every monitor update is one
+            new_source = source_time is not None and source_time != self.last_source_time
+            is_update = self.acquisition_mode == "monitor" or new_source or current_wnum != self.last_value
+            if source_time is not None:
+                self.last_source_time = source_time
+            self.last_value = current_wnum
+            if is_update and (source_time is None or new_source):
+                self.publish_rate.update(current_time if source_time is None else source_time)
+        if is_update:
+            #self.update_plot_df(current_time, current_wnum)
+            self.update_plot_df_no_average(current_time, current_wnum)
+            self.history.append(current_time, current_wnum)
+            self.stats.add(current_wnum)
+        with self.new_data:
+            self.sample_count += 1
+            self.last_sample = (current_time, current_wnum)
+            if is_update:
+                self.update_count += 1
+                self.last_update = (current_time, current_wnum, source_time)
+            self.new_data.notify_all()
+
+    def set_tag_columns(self, columns):
+        """Save labels (e.g. the scan step) with every sample in extra columns. Takes effect with the next start_saving
+
+        Arg:
+            columns(tuple): Names of the label columns
+        """
+        with self.record_lock:
+            self.tag_columns = tuple(columns)
+            self.record_columns = ("Time", "Wavenumber", "Count") + self.tag_columns
+            self.tags = self.run_tags = (0,) * len(self.tag_columns)
+
+    def set_tags(self, *tags):
+        """Label the samples recorded from now on. With change_only, the open run is closed, so a run never spans two
+        labels
+
+        Arg:
+            tags: One value per tag column
+        """
+        if len(tags) != len(self.tag_columns):
+            raise ValueError(f"Expected {len(self.tag_columns)} tags, got {len(tags)}")
+        with self.record_lock:
+            if tags == self.tags:
+                return
+            self.tags = tags
+            if self.change_filter is not None:
+                closed = self.change_filter.split()
+                if closed is not None and self.writer is not None:
+                    self.writer.put(*closed, *self.run_tags)
+                self.run_tags = tags
+
     def stop_reading(self):
-        """Catch reading thread"""
+        """Catch reading thread and unsubscribe from the PV"""
         self.is_reading = False
+        if self.callback_index is not None:
+            self.pv.remove_callback(self.callback_index)
+            self.callback_index = None
         if self.reading_thread:
             self.reading_thread.join()
             self.reading_thread = None
             if self.verbose:
                 print("Reading thread caught")
+        if self.owns_clock:
+            self.clock.stop()
 
-    def update_save_df(self, time, wnum):
-        """Append last data to time and wavenumber list
+    def start_saving(self, path, sink=None):
+        """Start a writer thread that saves every recorded sample. The reading thread only queues samples for it
         
         Args:
-            time(float): time stamp
-            wnum(float): wavenumber"""
-        self.timelist.append(time)
-        self.wnumlist.append(wnum)
-    
+            path(str): File to save data to; a numbered file next to it if it has other columns
+            sink: Object with write(data), sync() and close() taking record_columns, to use instead of a CSV file at path
+        """
+        if self.writer is not None:
+            self.stop_saving()
+        columns = self.record_columns
+        if sink is None:
+            sink = CsvSink(path, columns)
+            path = sink.path
+        writer = BackupWriter(sink, columns=columns, flush_interval=self.saving_interval, verbose=self.verbose)
+        writer.start()
+        with self.record_lock:
+            self.saving_dir = path
+            self.writer = writer
+
+    def stop_saving(self):
+        """Stop queueing samples, write what is left including the open run and catch the writer thread"""
+        with self.record_lock:
+            writer = self.writer
+            self.writer = None
+            self.saving_dir = None
+            if writer is not None and self.change_filter is not None:
+                run = self.change_filter.current()
+                if run is not None:
+                    writer.put(*run, *self.run_tags)
+                self.change_filter.reset()
+        if writer is not None:
+            writer.stop()
+            if self.verbose:
+                print(f"Saving stopped with {writer.get_stats()}")
+
+    def get_publish_rate(self):
+        """Get the live estimate of how often the source publishes new values
+        
+        Returns:
+            float: Mean interval between new values in seconds, None until estimated
+            float: Jitter (standard deviation) of the interval in seconds, None until estimated
+        """
+        return self.publish_rate.get()
+
+    def get_saving_stats(self):
+        """Get queue depth and dropped/delayed counts of the writer
+        
+        Return:
+            dict: Writer statistics, None if data is not being saved
+        """
+        writer = self.writer
+        return writer.get_stats() if writer is not None else None
+
     def update_plot_df(self, current_time, current_wnum, average_limit: int = 5):
-        """Average the last average_limit wavenumbers, append the latest data to plotting lists and delete if they surpass the plotting limit
+        """Average every average_limit wavenumbers and append the mean to the plot buffer
         
         Args:
             current_time(float): time stamp
             current_wnum(float): wavenumber
         """
-        if len(self.xDat) == self.plot_limit:
-            self.xDat.pop(0)
-            self.yDat.pop(0)
-
-        if len(self.xDat) == 0:
-            self.first_time = self.get_time()
-            self.xDat.append(0)
-            self.yDat.append(current_wnum)
+        if len(self.plot_buffer) == 0 and self.average_count == 0:
+            self.first_time = current_time
+            self.plot_buffer.append(0., current_wnum)
         
-        if len(self.y_for_average) < average_limit:
-            self.y_for_average = np.append(self.y_for_average, current_wnum)
-        else:
-            rel_time = current_time - self.first_time
-            self.xDat.append(rel_time)
-            mean = np.mean(self.y_for_average)
-            self.yDat.append(mean)
-            self.y_for_average = np.array([])
-            self.y_for_average = np.append(self.y_for_average, current_wnum)
+        if self.average_count == average_limit:
+            self.plot_buffer.append(current_time - self.first_time, self.average_sum / self.average_count)
+            self.average_sum, self.average_count = 0., 0
+        self.average_sum += current_wnum
+        self.average_count += 1
 
     def update_plot_df_no_average(self, current_time, current_wnum):
-        """NO AVERAGE: Append the latest data to plotting lists and delete if they surpass the plotting limit
+        """NO AVERAGE: Append the latest data to the plot buffer, which drops the oldest point once plot_limit is reached
 
         Args:
             current_time(float): time stamp
             current_wnum(float): wavenumber
         """
-        if len(self.xDat) == self.plot_limit:
-            self.xDat.pop(0)
-            self.yDat.pop(0)
-
-        if len(self.xDat) == 0:
-            self.first_time = self.get_time()
-            self.xDat.append(0)
-        else:
-            rel_time = current_time - self.first_time
-            self.xDat.append(rel_time)
-        
-        self.yDat.append(current_wnum)              
+        if len(self.plot_buffer) == 0:
+            self.first_time = current_time
+        self.plot_buffer.append(current_time - self.first_time, current_wnum)
     
-    def save_single(self, time, wnum):
-        """Write the latest time to the disk.
+    def get_plot_data(self):
+        """Get a consistent snapshot of the data to plot
         
-        Args:
-            current_time(float): time stamp
-            current_wnum(float): wavenumber
+        Returns:
+            np.ndarray: x data - time in seconds since the first plotted point
+            np.ndarray: y data - wavenumber
         """
-        if time and wnum:
-            data = {'Time': [time],
-                    'Wavenumber': [wnum]}
-            table = pa.table(data)
-            if os.path.exists(self.saving_dir):
-                with open(self.saving_dir, 'ab') as f:
-                    pc.write_csv(table, f, write_options=pc.WriteOptions(include_header=False))
-            else:
-                with open(self.saving_dir, 'wb') as f:
-                    pc.write_csv(table, f, write_options=pc.WriteOptions(include_header=True))
-            if self.verbose:
-                print(f"Dava being saved to {self.saving_dir}")
-    
-    def save_full(self):
-        """Write data during the saving interval to the disk and clear cache"""
-        data = {'Time': self.timelist,
-                'Wavenumber': self.wnumlist}
-        table = pa.table(data)
-        if os.path.exists(self.saving_dir):
-            with open(self.saving_dir, 'ab') as f:
-                pc.write_csv(table, f, write_options=pc.WriteOptions(include_header=False))
-        else:
-            with open(self.saving_dir, 'wb') as f:
-                pc.write_csv(table, f, write_options=pc.WriteOptions(include_header=True))
-        self.timelist, self.wnumlist = [], []
-        if self.verbose:
-            print(f"Dava being saved to {self.saving_dir}")
-    
-    def get_plot_data(self):
-        """Get data to Plot
+        return self.plot_buffer.snapshot()
+
+    def get_plot_history(self, duration: float, max_points: int = 2000):
+        """Get at most max_points points covering the last duration seconds since the plot was cleared, decimated to min/max envelopes where needed
+        
+        Args:
+            duration(float): Length of the time window in seconds
+            max_points(int): Maximum number of points to return
         
         Returns:
-            list: x data - time stamp
-            list: y data - wavenumber
+            np.ndarray: x data - time in seconds since the first plotted point
+            np.ndarray: y data - wavenumber
         """
-        return self.xDat, self.yDat
+        t_end, _ = self.get_latest_sample()
+        if t_end is None or len(self.plot_buffer) == 0:
+            return np.array([]), np.array([])
+        t_start = max(t_end - duration, self.first_time)
+        x, y = self.history.query(t_start, t_end, max_points)
+        return x - self.first_time, y
     
     def clear_plot(self):
         """Clear the plot"""
-        self.xDat, self.yDat = [], []
+        self.plot_buffer.clear()
+        self.average_sum, self.average_count = 0., 0
+
+    def get_stats(self, window: int = None, target: float = None):
+        """Get rolling statistics of the latest updates of the wavenumber without copying any buffer
+        
+        Args:
+            window(int): Window size in updates, one of stats_windows; the largest if None
+            target(float): Wavenumber to compute the RMS deviation from, e.g. the lock target
+        
+        Return:
+            dict: count, mean, std, min, max, p2p and rms of the window, None if nothing was recorded
+        """
+        return self.stats.get(window, target)
+
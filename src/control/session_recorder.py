@@ -0,0 +1,177 @@
+import pyarrow as pa
+import pyarrow.csv as pc
+import pyarrow.parquet as pq
+import os
+import json
+import time
+import datetime
+
+FORMATS = {"arrow": ".arrows", "parquet": ".parquet"}
+# Columns not listed here are float64
+COLUMN_TYPES = {"Count": pa.int64(), "ScanId": pa.int64(), "Pass": pa.int64(), "Step": pa.int64(), "Settled": pa.int64()}
+
+
+class SessionRecorder:
+    """Sink for BackupWriter that records a session as typed columns (float64, int64 for counts) in Arrow IPC stream or Parquet files.
+
+    Every flush becomes one record batch (Arrow) or one row group (Parquet). A new file is started once the current one
+    reaches max_bytes or max_duration. The session metadata is stored in the schema of every file, so each part can be
+    read on its own. Arrow streams stay readable up to the last complete batch if the process dies; Parquet files are
+    only readable once closed."""
+    def __init__(self, directory: str, basename: str, columns=("Time", "Wavenumber"), fmt: str = "arrow",
+                 metadata: dict = None, max_bytes: int = 256 * 1024 ** 2, max_duration: float = 3600.):
+        """Constructor function that opens the first file of the session
+
+        Args:
+            directory(str): Directory to write the files to
+            basename(str): Prefix of the file names
+            columns(list): Column names, in the order of the values passed to BackupWriter.put
+            fmt(str): "arrow" for Arrow IPC stream files or "parquet"
+            metadata(dict): Session information stored with every file, e.g. laser tag, PV name and PID gains
+            max_bytes(int): Size in bytes after which a new file is started
+            max_duration(float): Time in seconds after which a new file is started
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown recording format: {fmt}")
+        self.directory = directory
+        self.basename = basename
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration
+        self.session_start = datetime.datetime.now()
+        metadata = dict(metadata or {})
+        metadata["session_start"] = self.session_start.isoformat()
+        self.metadata = metadata
+        self.files = []
+        self.part = 0
+        self.file = None
+        self.writer = None
+        self.opened_at = 0.
+        self._open()
+
+    def _open(self):
+        """Start the next file of the session"""
+        stamp = self.session_start.strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, f"{self.basename}_{stamp}_{self.part:03d}{FORMATS[self.fmt]}")
+        metadata = dict(self.metadata, part=self.part)
+        schema = pa.schema([pa.field(name, COLUMN_TYPES.get(name, pa.float64())) for name in self.columns],
+                           metadata={"session": json.dumps(metadata)})
+        self.file = open(path, 'wb')
+        if self.fmt == "arrow":
+            self.writer = pa.ipc.new_stream(self.file, schema)
+        else:
+            self.writer = pq.ParquetWriter(self.file, schema)
+        self.schema = schema
+        self.opened_at = time.monotonic()
+        self.files.append(path)
+        self.part += 1
+
+    def _close_file(self):
+        """Finish the current file"""
+        self.writer.close()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    def write(self, data):
+        """Write one batch, starting a new file first if the current one is full or too old
+
+        Arg:
+            data(dict): Column name to np.ndarray of values
+
+        Return:
+            int: Number of bytes written
+        """
+        if self.file.tell() >= self.max_bytes or time.monotonic() - self.opened_at >= self.max_duration:
+            self._close_file()
+            self._open()
+        batch = pa.record_batch([pa.array(data[name]).cast(self.schema.field(name).type) for name in self.columns],
+                                schema=self.schema)
+        start = self.file.tell()
+        if self.fmt == "arrow":
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        self.file.flush()
+        return self.file.tell() - start
+
+    def sync(self):
+        """Force the written data to the disk"""
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        """Finish the session"""
+        self._close_file()
+
+
+def read_table(path: str):
+    """Read one recorded file or a CSV backup
+
+    Arg:
+        path(str): Path of a .arrows, .parquet or .csv file
+
+    Return:
+        pa.Table: The recorded data
+    """
+    if path.endswith(FORMATS["arrow"]):
+        with pa.OSFile(path, 'rb') as f:
+            try:
+                return pa.ipc.open_stream(f).read_all()
+            except (pa.ArrowInvalid, OSError):
+                # A session that was not closed cleanly ends with a partial batch; keep the complete ones
+                f.seek(0)
+                reader = pa.ipc.open_stream(f)
+                batches = []
+                try:
+                    for batch in reader:
+                        batches.append(batch)
+                except (pa.ArrowInvalid, OSError):
+                    pass
+                return pa.Table.from_batches(batches, schema=reader.schema)
+    if path.endswith(FORMATS["parquet"]):
+        return pq.read_table(path)
+    return pc.read_csv(path)
+
+
+def read_session(paths):
+    """Read the files of a session into one table
+
+    Arg:
+        paths(list): Paths of the files in order, or a single path
+
+    Return:
+        pa.Table: The recorded data of all files
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    tables = [read_table(path) for path in paths]
+    return pa.concat_tables([table.replace_schema_metadata(None) for table in tables])
+
+
+def read_metadata(path: str):
+    """Read the session metadata stored with a recorded file
+
+    Arg:
+        path(str): Path of a .arrows or .parquet file
+
+    Return:
+        dict: The session metadata, empty if there is none
+    """
+    if path.endswith(FORMATS["parquet"]):
+        schema = pq.read_schema(path)
+    else:
+        with pa.OSFile(path, 'rb') as f:
+            schema = pa.ipc.open_stream(f).schema
+    metadata = schema.metadata or {}
+    return json.loads(metadata.get(b"session", b"{}"))
+
+
+def export_csv(paths, csv_path: str):
+    """Export recorded files to one CSV file in the same layout as the CSV backups
+
+    Args:
+        paths(list): Paths of the files in order, or a single path
+        csv_path(str): Path of the CSV file to write
+    """
+    pc.write_csv(read_session(paths), csv_path)
@@ -0,0 +1,255 @@
+import math
+import threading
+import time
+from collections import deque
+import numpy as np
+from .base import LaserBackend
+from .soft_pv import SoftPV
+
+
+class SimulatedSolstis(LaserBackend):
+    """Simulated M2 Solstis with a wavemeter that publishes to a SoftPV.
+
+    The plant is wavenumber = wavenumber0 - (cavity - cavity0) / conversion + drift + noise, plus half the
+    hysteresis in the direction of the last tuner move: a reference cavity tuner command takes effect after a dead
+    time (latency) and the tuner then follows it with a first-order response. The free-running offset is a random walk with occasional mode hops of one cavity mode spacing;
+    unlocking the reference cavity scales the noise up and unlocking the etalon makes mode hops more likely.
+    All randomness comes from one seeded generator.
+
+    The simulation runs in real time on a child thread after start(), or is stepped with advance() for
+    deterministic offline runs, e.g. benchmarks of lock settling time and scan throughput."""
+    def __init__(self, pv=None, wavenumber: float = 12500., cavity_tune: float = 50., etalon_tune: float = 50.,
+                 conversion: float = 60., latency: float = 0.05, latency_jitter: float = 0.01,
+                 response_time: float = 0.05, command_time: float = 0.02, drift: float = 2e-6, noise: float = 2e-6,
+                 mode_hop_rate: float = 0., mode_spacing: float = 0.0067, unlocked_noise: float = 20.,
+                 unlocked_hop_factor: float = 10., publish_interval: float = 0.1, resolution: float = 1e-5,
+                 hysteresis: float = 0., seed: int = 0, pvname: str = "Sim:wavenumber", verbose: bool = False):
+        """Constructor function that sets up the plant
+
+        Args:
+            pv(SoftPV): PV to publish the wavenumber to; a new SoftPV named pvname if None
+            wavenumber(float): Wavenumber in cm^-1 at the initial tuner value without drift
+            cavity_tune(float): Initial reference cavity tuner value in percent
+            etalon_tune(float): Initial etalon tuner value in percent
+            conversion(float): Tuner percent per cm^-1; raising the tuner lowers the wavenumber
+            latency(float): Mean dead time in seconds between a tuner command and its effect
+            latency_jitter(float): Standard deviation of the dead time in seconds
+            response_time(float): Time constant in seconds of the tuner following a command
+            command_time(float): Time in seconds a synchronous command blocks the caller in real time
+            drift(float): Random walk of the wavenumber in cm^-1 per sqrt(s)
+            noise(float): Standard deviation of the measured wavenumber in cm^-1
+            mode_hop_rate(float): Mean number of mode hops per second with both locks on
+            mode_spacing(float): Size of a mode hop in cm^-1
+            unlocked_noise(float): Noise factor while the reference cavity is unlocked
+            unlocked_hop_factor(float): Mode hop rate factor while the etalon is unlocked
+            publish_interval(float): Interval in seconds between wavemeter updates
+            resolution(float): Wavemeter resolution in cm^-1
+            hysteresis(float): Wavenumber difference in cm^-1 between reaching a tuner value upwards and downwards
+            seed(int): Seed of the random generator
+            pvname(str): Name of the PV made if pv is None
+            verbose(bool): whether to print messages on the terminal
+        """
+        self.pv = pv if pv is not None else SoftPV(pvname)
+        self.wavenumber0 = wavenumber
+        self.cavity0 = cavity_tune
+        self.conversion = conversion
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.response_time = response_time
+        self.command_time = command_time
+        self.drift = drift
+        self.noise = noise
+        self.mode_hop_rate = mode_hop_rate
+        self.mode_spacing = mode_spacing
+        self.unlocked_noise = unlocked_noise
+        self.unlocked_hop_factor = unlocked_hop_factor
+        self.publish_interval = publish_interval
+        self.resolution = resolution
+        self.hysteresis = hysteresis
+        self.direction = 0.  # direction of the last tuner move, +1 up and -1 down
+        self.verbose = verbose
+        self.rng = np.random.default_rng(seed)
+        self.epoch = time.time()  # wall time of simulation time 0, used for the PV time stamps
+        self.sim_time = 0.
+        self.next_publish = 0.
+        self.cavity_setpoint = cavity_tune  # command in effect
+        self.cavity_position = cavity_tune  # where the tuner actually is
+        self.etalon_tune = etalon_tune
+        self.offset = 0.  # drift and mode hops
+        self.mode_hops = 0
+        self.commands = deque()  # (time the command takes effect, tuner value), in order
+        self.etalon_lock = "on"
+        self.cavity_lock = "on"
+        self._lock = threading.RLock()
+        self.sim_thread = None
+        self.is_running = False
+        self.start_mono = None
+        self._publish()
+        self.next_publish = publish_interval
+
+    def now(self):
+        """Return:
+            float: Current simulation time in seconds
+        """
+        if self.is_running:
+            return time.monotonic() - self.start_mono
+        return self.sim_time
+
+    def wavenumber(self):
+        """Return:
+            float: Noise-free wavenumber at the current simulation time
+        """
+        with self._lock:
+            return (self.wavenumber0 - (self.cavity_position - self.cavity0) / self.conversion + self.offset
+                    + self.direction * self.hysteresis / 2)
+
+    def advance(self, duration: float):
+        """Step the simulation forward and publish the wavemeter updates that fall into it
+
+        Arg:
+            duration(float): Time to advance in seconds
+        """
+        self._advance_to(self.sim_time + duration)
+
+    def _advance_to(self, end: float):
+        """Evolve the plant up to simulation time end, publishing at every wavemeter update on the way"""
+        with self._lock:
+            while self.sim_time < end:
+                stop = max(self.sim_time, min(end, self.next_publish))
+                if self.commands and self.commands[0][0] < stop:
+                    stop = max(self.commands[0][0], self.sim_time)
+                self._evolve(stop - self.sim_time)
+                self.sim_time = stop
+                while self.commands and self.commands[0][0] <= self.sim_time:
+                    setpoint = self.commands.popleft()[1]
+                    if setpoint != self.cavity_setpoint:
+                        self.direction = 1. if setpoint > self.cavity_setpoint else -1.
+                    self.cavity_setpoint = setpoint
+                if self.sim_time >= self.next_publish:
+                    self._publish()
+                    self.next_publish += self.publish_interval
+
+    def _evolve(self, dt: float):
+        """Move the tuner towards its setpoint and let the offset drift and hop for dt seconds"""
+        if dt <= 0:
+            return
+        if self.response_time > 0:
+            decay = math.exp(-dt / self.response_time)
+            self.cavity_position = self.cavity_setpoint + (self.cavity_position - self.cavity_setpoint) * decay
+        else:
+            self.cavity_position = self.cavity_setpoint
+        self.offset += self.rng.normal(0., self.drift * math.sqrt(dt))
+        rate = self.mode_hop_rate * (self.unlocked_hop_factor if self.etalon_lock != "on" else 1.)
+        if rate > 0:
+            for _ in range(self.rng.poisson(rate * dt)):
+                self.offset += self.mode_spacing * self.rng.choice((-1., 1.))
+                self.mode_hops += 1
+                if self.verbose:
+                    print(f"Simulated mode hop at {self.sim_time:.2f} s")
+
+    def _publish(self):
+        """Put one noisy wavemeter reading, rounded to the resolution, to the PV"""
+        noise = self.noise * (self.unlocked_noise if self.cavity_lock != "on" else 1.)
+        value = self.wavenumber() + self.rng.normal(0., noise)
+        value = round(round(value / self.resolution) * self.resolution, 10)
+        self.pv.put(value, timestamp=self.epoch + self.sim_time)
+
+    def start(self):
+        """Run the simulation in real time on a child thread"""
+        if self.is_running:
+            return
+        self.start_mono = time.monotonic() - self.sim_time
+        self.is_running = True
+        self.sim_thread = threading.Thread(target=self._sim_loop, daemon=True)
+        self.sim_thread.start()
+
+    def _sim_loop(self):
+        """Loop to advance the simulation to the wall clock at every wavemeter update"""
+        while self.is_running:
+            self._advance_to(time.monotonic() - self.start_mono)
+            time.sleep(max(0., self.next_publish - (time.monotonic() - self.start_mono)))
+
+    def stop(self):
+        """Stop the real-time simulation; advance() can be used again afterwards"""
+        self.is_running = False
+        if self.sim_thread:
+            self.sim_thread.join()
+            self.sim_thread = None
+
+    def close(self):
+        """Stop the simulation"""
+        self.stop()
+
+    def _command(self):
+        """Block the caller for the time a command to the real laser takes"""
+        if self.is_running and self.command_time > 0:
+            time.sleep(self.command_time)
+
+    def lock_etalon(self):
+        """Lock the etalon lock"""
+        with self._lock:
+            self.etalon_lock = "on"
+
+    def unlock_etalon(self):
+        """Unlock the etalon lock"""
+        with self._lock:
+            self.etalon_lock = "off"
+
+    def lock_reference_cavity(self):
+        """Lock the reference cavity lock"""
+        with self._lock:
+            self.cavity_lock = "on"
+
+    def unlock_reference_cavity(self):
+        """Unlock the reference cavity lock"""
+        with self._lock:
+            self.cavity_lock = "off"
+
+    def tune_reference_cavity(self, value, sync=True):
+        """Command the reference cavity tuner; it starts moving after the dead time
+
+        Args:
+            value(float): Tuner value in percent, clipped to 0-100
+            sync(bool): Block for the command time like the real laser does
+        """
+        value = min(100., max(0., float(value)))
+        with self._lock:
+            delay = max(0., self.rng.normal(self.latency, self.latency_jitter)) if self.latency > 0 else 0.
+            apply_time = max(self.now() + delay, self.commands[-1][0] if self.commands else 0.)
+            self.commands.append((apply_time, value))
+        if sync:
+            self._command()
+
+    def tune_etalon(self, value, sync=True):
+        """Set the etalon tuner
+
+        Args:
+            value(float): Tuner value in percent, clipped to 0-100
+            sync(bool): Block for the command time like the real laser does
+        """
+        with self._lock:
+            self.etalon_tune = min(100., max(0., float(value)))
+        if sync:
+            self._command()
+
+    def get_full_web_status(self):
+        """Return:
+            dict: 'cavity_tune', 'etalon_tune' and the lock statuses, like the web status of the laser
+        """
+        with self._lock:
+            return {"cavity_tune": self.cavity_position,
+                    "etalon_tune": self.etalon_tune,
+                    "cavity_lock_status": self.cavity_lock,
+                    "etalon_lock_status": self.etalon_lock}
+
+    def get_etalon_lock_status(self):
+        """Return:
+            str: Etalon lock status, "on" or "off"
+        """
+        return self.etalon_lock
+
+    def get_reference_cavity_lock_status(self):
+        """Return:
+            str: Reference cavity lock status, "on" or "off"
+        """
+        return self.cavity_lock
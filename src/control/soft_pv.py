@@ -0,0 +1,84 @@
+import threading
+import time
+from .base import WavenumberSource
+
+
+class SoftPV(WavenumberSource):
+    """Local stand-in for an epics.PV, used to run the reader without the lab network.
+
+    It implements the part of the pyepics PV interface the reader uses: get(), put(), add_callback(),
+    remove_callback(), clear_callbacks() and wait_for_connection(). Callbacks are called from the thread that
+    calls put(), with the same keyword arguments pyepics passes to monitor callbacks."""
+    def __init__(self, pvname: str, value: float = None):
+        """Constructor function that initializes the soft PV
+
+        Args:
+            pvname(str): Name of the PV
+            value(float): Initial value
+        """
+        self.pvname = pvname
+        self.value = value
+        self.timestamp = time.time()
+        self.connected = True
+        self.callbacks = {}
+        self._next_index = 1
+        self._lock = threading.Lock()
+
+    def get(self, *args, **kwargs):
+        """Get the current value
+
+        Return:
+            float: current value
+        """
+        return self.value
+
+    def put(self, value, timestamp: float = None):
+        """Set a new value and run the monitor callbacks
+
+        Args:
+            value(float): New value
+            timestamp(float): Time stamp of the new value; current time if not given
+        """
+        with self._lock:
+            self.value = value
+            self.timestamp = time.time() if timestamp is None else timestamp
+            callbacks = list(self.callbacks.values())
+        for callback in callbacks:
+            callback(pvname=self.pvname, value=value, timestamp=self.timestamp)
+
+    def add_callback(self, callback):
+        """Add a monitor callback
+
+        Arg:
+            callback(callable): Function called with pvname, value and timestamp keywords on every update
+
+        Return:
+            int: Index to remove the callback with
+        """
+        with self._lock:
+            index = self._next_index
+            self._next_index += 1
+            self.callbacks[index] = callback
+        return index
+
+    def remove_callback(self, index):
+        """Remove a monitor callback
+
+        Arg:
+            index(int): Index returned by add_callback
+        """
+        with self._lock:
+            self.callbacks.pop(index, None)
+
+    def clear_callbacks(self):
+        """Remove all monitor callbacks"""
+        with self._lock:
+            self.callbacks = {}
+
+    def wait_for_connection(self, timeout=None):
+        """Soft PVs are always connected
+
+        Return:
+            bool: True
+        """
+        return True
@@ -1,4 +1,3 @@
-from pylablib.devices import M2
 import numpy as np
 import datetime
 import time
@@ -6,15 +5,38 @@ from time import ctime
 from typing import List, Dict, Any, Optional
 import threading
 import asyncio
+import os
 from .base import ControlLoop
 from .pid_controller import PIDController
 from .server_reader import EMAServerReader
+from .session_recorder import SessionRecorder, FORMATS
+from .laser_backend import SolstisBackend
+from .scheduler import FixedRateScheduler
+from .status_cache import LaserStatusCache
+from .status_subscriber import LaserStatusSubscriber
+from .command_queue import LaserCommandExecutor
+from .conversion_estimator import ConversionEstimator
+from .calibration import CavityCalibration
+from .config import load_laser_config, save_laser_config
+from .latency_probe import LatencyProbe
+from .scan_trajectory import ScanTrajectory
+from .scan_plan import ScanPlan, SettleModel
+from .control_journal import ControlJournal, journal_path
 
 
 
 class LaserControl(ControlLoop):
     """Main class that controls the M2 laser"""
-    def __init__(self, ip_address, port, wavenumber_pv, verbose):
+    # Conversion in tuner percent per cm^-1 the PID gains are meant for; the PID output is scaled from it
+    NOMINAL_CONVERSION = 60.
+    # Largest PID correction of the cavity tuner per loop step, in percent
+    MAX_PID_STEP = 0.5
+    # Labels saved with every sample: scan id (0 outside scans), pass and step index (-1 outside scans), and 1 once
+    # the step has settled
+    SCAN_TAG_COLUMNS = ("ScanId", "Pass", "Step", "Settled")
+
+    def __init__(self, ip_address, port, wavenumber_pv, verbose, acquisition_mode="poll", source=None, reader=None,
+                 laser=None, loop_period=None, status_ttl=0.5, subscribe_status=True):
 
         """Constructor function that initializes the class and passes laser information
 
@@ -23,11 +45,28 @@ class LaserControl(ControlLoop):
             port(int): Port for the M2 laser
             wavenumber_pv(str): PV for getting wavenumber
             verbose(bool): whether to print messages on the terminal
+            acquisition_mode(str): "poll" or "monitor", see EMAServerReader
+            source: PV-like object to read the wavenumber from instead of EPICS, e.g. a SoftPV
+            reader(EMAServerReader): Reader to use instead of making one, e.g. EMAMultiReader.get_reader(wavenumber_pv)
+            laser(LaserBackend): Laser to control instead of connecting to a Solstis, e.g. a SimulatedSolstis
+            loop_period(float): Period of the tweaking loop in seconds; the reading rate if None
+            status_ttl(float): Time in seconds a status snapshot of the laser is shared for, see LaserStatusCache
+            subscribe_status(bool): Keep tuner values and lock statuses up to date from the websocket of the laser's web interface; only used without laser
         """
-        self.laser = None
+        self.laser = laser
+        self.wavenumber_pv = wavenumber_pv
+        self.tag = wavenumber_pv.split(':')[-1]
         self.ip_address = ip_address
         self.port = port    
         self.patient_laser_init()
+        self.status_subscriber = None
+        if subscribe_status and laser is None:
+            self.start_status_subscription(verbose)
+        # All laser calls go through the cache, so status reads share one round-trip and commands invalidate it
+        self.laser = LaserStatusCache(self.laser, ttl=status_ttl, subscriber=self.status_subscriber)
+        # Commands go through one executor thread, so the control loop never blocks on the laser
+        self.commands = LaserCommandExecutor(self.laser, verbose=verbose)
+        self.commands.start()
         self.old_wnum = 0.
         self.wnum = 0.
         self.delta = 0.
@@ -40,17 +79,53 @@ class LaserControl(ControlLoop):
         self.current_pass = 0
         self.total_passes = 1
         self.rate = 0.1  #in seconds
-        self.conversion = 60
+        # Settings stored per laser, e.g. the last calibration
+        self.config = load_laser_config(self.tag)
+        self.conversion = self.config.get("conversion", self.NOMINAL_CONVERSION)
+        self.conversion_estimator = ConversionEstimator(initial=self.conversion)
+        self.observed_tuner = None  # tuner value the wavenumbers of observed_wnum were read with
+        self.observed_wnum = (0., 0)  # sum and number of wavenumbers read since that tune took effect
+        self.settle_model = SettleModel.from_dict(self.config.get("settle", {}))
+        # Control state transitions are journaled, so a lock or scan can be resumed after a crash, see resume
+        self.journal = ControlJournal(journal_path(self.tag), verbose=verbose)
+        self.calibration = None
+        self.calibration_settings = {}
         self.now = datetime.datetime.now()
-        self.reply = None
+        self.reply = None  # ticket of the last reference cavity tune
         self.verbose = verbose
         self.update_tuner = 0
         self.tweaking_thread = None
         self.is_tweaking = False
         self.scan_restarted = False
         self.scan_start_time = 0.
-        self.pid = PIDController(kp=40., ki=0.8, kd=0., setpoint=self.target)
-        self.reader = EMAServerReader(pv_name=wavenumber_pv, reading_frequency=self.rate, verbose=True)
+        self.scan_trajectory = None
+        self.scan_step = None  # (pass, step) of the scan target being approached or dwelled on
+        self.scan_id = 0
+        self.wait_for_settle = False
+        self.settle_tolerance = 0.00002
+        self.settle_hold = 0.5
+        self.settle_timeout = 30.
+        self.settle_since = None  # time the wavenumber entered the tolerance, None while outside
+        self.step_settled = False
+        self.dwell_start_time = 0.
+        self.settled_steps = 0
+        self.timed_out_steps = 0
+        self.scan_plan = None
+        self.scan_dwells = None  # dwell time of every target in the order of scan_targets
+        self.scan_step_size = 0.
+        gains = self.get_startup_gains()
+        self.pid = PIDController(kp=gains.get("kp", 40.), ki=gains.get("ki", 0.8), kd=gains.get("kd", 0.),
+                                 setpoint=self.target,
+                                 output_limits=self.get_pid_limits(), derivative_filter=0.3, incremental=True)
+        self.seen_samples = 0
+        self.stale_steps = 0
+        self.scheduler = FixedRateScheduler(loop_period if loop_period is not None else self.rate)
+        if reader is None:
+            reader = EMAServerReader(pv_name=wavenumber_pv, reading_frequency=self.rate, verbose=True,
+                                     acquisition_mode=acquisition_mode, source=source)
+        self.reader = reader
+        self.reader.set_tag_columns(self.SCAN_TAG_COLUMNS)
+        self.tag_samples()
         self.patient_setup_status()
         self.start_reading()
         self.set_current_wnum()
@@ -72,10 +147,10 @@ class LaserControl(ControlLoop):
         laser_set = 0
         tries = 0
         if self.laser:
-            pass
+            return
         while not laser_set:
             try:
-                self.laser = M2.Solstis(self.ip_address, self.port)
+                self.laser = SolstisBackend(self.ip_address, self.port)
                 laser_set = True
                 break
             except Exception as e:
@@ -88,6 +163,29 @@ class LaserControl(ControlLoop):
                 else:
                     tries += 1
         
+    def start_status_subscription(self, verbose=False):
+        """Subscribe to the status the web interface of the laser pushes; polling is used if that is not possible
+        
+        Arg:
+            verbose(bool): whether to print messages on the terminal
+        """
+        try:
+            self.status_subscriber = LaserStatusSubscriber(self.ip_address, verbose=verbose)
+        except ImportError as e:
+            print(f"Laser status is polled, no subscription: {e}")
+            return
+        self.status_subscriber.start()
+
+    def get_status_subscription_stats(self):
+        """Get the state of the status subscription
+        
+        Return:
+            dict: See LaserStatusSubscriber.get_stats, None without a subscription
+        """
+        if self.status_subscriber is None:
+            return None
+        return self.status_subscriber.get_stats()
+
     def patient_setup_status(self, tryouts = 2) -> None:
         """Initialize locks status and tuner value
         
@@ -100,10 +198,7 @@ class LaserControl(ControlLoop):
         tries = 0
         while not status_set:
             try:
-                self.reference_cavity_lock_status = self.laser.get_reference_cavity_lock_status()
-                self.etalon_lock_status = self.laser.get_etalon_lock_status()
-                self.etalon_tuner_value = self.laser.get_full_web_status()['etalon_tune']
-                self.reference_cavity_tuner_value = self.laser.get_full_web_status()['cavity_tune']
+                self.set_status(self.laser.get_status())
                 status_set = True
                 break
             except Exception as e:
@@ -116,15 +211,31 @@ class LaserControl(ControlLoop):
                 else:
                     tries += 1
     
+    def set_status(self, status):
+        """Take the lock statuses and tuner values from one status snapshot
+        
+        Arg:
+            status(dict): Snapshot from LaserStatusCache.get_status
+        """
+        self.reference_cavity_lock_status = status['cavity_lock']
+        self.etalon_lock_status = status['etalon_lock']
+        self.etalon_tuner_value = status['etalon_tune']
+        self.reference_cavity_tuner_value = status['cavity_tune']
+
+    def get_status_cache_stats(self):
+        """Get the hit/miss counters of the laser status cache
+        
+        Return:
+            dict: See LaserStatusCache.get_stats
+        """
+        return self.laser.get_stats()
+
     def patient_update(self, tryouts = 2):
         status_set = 0
         tries = 0
         while not status_set:
             try:
-                self.reference_cavity_lock_status = self.laser.get_reference_cavity_lock_status()
-                self.etalon_lock_status = self.laser.get_etalon_lock_status()
-                self.etalon_tuner_value = self.laser.get_full_web_status()['etalon_tune']
-                self.reference_cavity_tuner_value = self.laser.get_full_web_status()['cavity_tune']
+                self.set_status(self.laser.get_status())
                 status_set = True
                 break
             except Exception as e:
@@ -139,21 +250,56 @@ class LaserControl(ControlLoop):
         """Update funtion that runs every iteration, also an abstract method of the control loop"""
         self.set_current_wnum()
     
-    def start_backup_saving(self, dir):
-        """Passes the directory to the reader for data saving. This will automaticall start writing data to the disk"""
-        self.reader.saving_dir = dir
+    def start_backup_saving(self, dir, fmt=None):
+        """Passes the file path to the reader for data saving. This will automatically start writing data to the disk on a writer thread
+        
+        Args:
+            dir(str): File to save to. For "arrow" and "parquet" its directory and name are used as the prefix of the rotated session files
+            fmt(str): "csv", "arrow" or "parquet"; guessed from the file extension if None
+        """
+        base, ext = os.path.splitext(dir)
+        if fmt is None:
+            fmt = next((name for name, suffix in FORMATS.items() if suffix == ext), "csv")
+        if fmt == "csv":
+            self.reader.start_saving(dir)
+            return
+        recorder = SessionRecorder(os.path.dirname(base), os.path.basename(base), columns=self.reader.record_columns,
+                                   fmt=fmt, metadata=self.get_session_metadata())
+        self.reader.start_saving(dir, sink=recorder)
+
+    def get_session_metadata(self):
+        """Information about the laser and the controller stored with recorded sessions
+        
+        Return:
+            dict: laser tag, PV name, polling interval and control settings at the start of the session
+        """
+        return {"laser_tag": self.tag,
+                "pv_name": self.wavenumber_pv,
+                "reading_frequency": self.reader.reading_frequency,
+                "kp": self.pid.kp,
+                "ki": self.pid.ki,
+                "kd": self.pid.kd,
+                "conversion": self.conversion}
     
     def stop_backup_saving(self):
-        """Clear the saving directory of the reader, which will stop saving data automatically"""
-        self.reader.saving_dir = None
+        """Stop the writer of the reader after it has written the remaining data"""
+        self.reader.stop_saving()
     
-    def get_df_to_plot(self):
+    def get_df_to_plot(self, duration=None, max_points=2000):
         """Get data to plot from the reader
+        
+        Args:
+            duration(float): Length of the time window in seconds; None for the last plot_limit raw points
+            max_points(int): Maximum number of points for a time window
+        
         Returns:
-            list: x data - time stamp
-            list: y data - wavenumber
+            np.ndarray: x data - time stamp
+            np.ndarray: y data - wavenumber
         """        
-        ts, wn = self.reader.get_plot_data()
+        if duration is None:
+            ts, wn = self.reader.get_plot_data()
+        else:
+            ts, wn = self.reader.get_plot_history(duration, max_points)
         # if len(ts)>0 and len(wn)>0:
         #     print(ts[-1], wn[-1])
         # df_to_plot = pd.DataFrame({"Wavenumber (cm^-1)": wn}, index = ts)
@@ -167,68 +313,135 @@ class LaserControl(ControlLoop):
             print(f"Error in setting the wavenumber: {e}")
             raise        
     
-    def get_conversion(self):
-        """Start process to hack the conversion constants between the wavenumber and voltage of the reference cavity"""
+    def get_conversion(self, **settings):
+        """Start a calibration of the conversion between the wavenumber and the reference cavity tuner on the
+        tweaking thread
+        
+        Arg:
+            settings: Keyword arguments of calibrate
+        """
+        self.calibration_settings = settings
         self.state = 2
         self.start_tweaking()
 
     def do_conversion(self):
-        """Try to hack the conversion constants between the wavenumber and voltage of the reference cavity"""
-        list = np.linspace(10, 100, 10)
-        loop = 0
-        loopend = 5
-        delta = 0.001
-        closest = np.array([])
-        wnum = np.array([])
-        while loop < loopend:
-            output_deltas = np.array([])
-            for i in list:
-                input_wnum = self.reader.get_read_value()
-                i = round(i,0)    
-                u = i * delta
-                self.tune_reference_cavity(float(self.reference_cavity_tuner_value) - u)
-                #The use of tune_ref_cav is outdated here             
-                output_wnum = self.reader.get_read_value()
-                output_delta = np.abs(output_wnum - input_wnum)
-                output_deltas = np.append(output_deltas, output_delta)
-                # print(i)
-                # print(output_delta)
-                #time.sleep(0.1)
-            closest_index = np.abs(output_deltas - delta).argmin()
-            closest_number = list[closest_index]
-            closest = np.append(closest, closest_number)
-            wnum = np.append(wnum, output_deltas[closest_index])
-            print(f"best:{closest_number}")
-            print(f"length:{len(list)- len(output_deltas)}")
-            loop += 1
-            
-        print(f"wavelength:{wnum}")
-        print(closest)
-        self.state = 0
+        """Run the calibration started by get_conversion and go back to idle"""
+        try:
+            self.calibrate(**self.calibration_settings)
+        finally:
+            self.state = 0
+
+    def calibrate(self, span=1., points=11, cycles=1, discard=2, average=3, update_timeout=1.):
+        """Sweep the reference cavity tuner up and down around its current value, fit gain, offset and hysteresis,
+        and use and store the resulting conversion for this laser
+        
+        Args:
+            span(float): Full width of the sweep in tuner percent
+            points(int): Points per direction
+            cycles(int): Number of up/down cycles
+            discard(int): Wavemeter updates to drop after every tune
+            average(int): Wavemeter updates to average at every point
+            update_timeout(float): Maximum time in seconds to wait for one update
+        
+        Return:
+            dict: Calibration result, see fit_calibration; None if stopped
+        """
+        center = self.get_ref_cav_tuner()
+        self.calibration = CavityCalibration(
+            lambda value: self.commands.call("tune_reference_cavity", value, sync=True), self.reader, center,
+            span=span, points=points, cycles=cycles, discard=discard, average=average,
+            update_timeout=update_timeout, verbose=self.verbose)
+        print(f"Calibrating {self.tag} around {center:.4f} %, at most {self.calibration.get_max_duration():.0f} s")
+        result = self.calibration.run()
+        self.reference_cavity_tuner_value = center
+        if result is None:
+            print("Calibration stopped")
+            return None
+        print(f"Calibration of {self.tag}: conversion {result['conversion']:.2f} %/cm^-1, "
+              f"hysteresis {result['hysteresis']:.6f} cm^-1, residual {result['residual_std']:.6f} cm^-1 "
+              f"in {result['duration']:.1f} s")
+        self.apply_calibration(result)
+        return result
+
+    def apply_calibration(self, result):
+        """Use the conversion of a calibration and store the calibration for this laser
+        
+        Arg:
+            result(dict): Calibration result, see fit_calibration
+        """
+        self.conversion = result["conversion"]
+        self.conversion_estimator.reset(initial=self.conversion)
+        calibration = dict(result, time=time.time())
+        self.config = save_laser_config(self.tag, {"conversion": self.conversion, "calibration": calibration})
+
+    def get_calibration_progress(self):
+        """Get the progress of the last calibration
+        
+        Return:
+            dict: See CavityCalibration.get_progress, None if no calibration was started
+        """
+        if self.calibration is None:
+            return None
+        return self.calibration.get_progress()
     
+    def measure_actuation_latency(self, step=0.005, repeats=20, path=None, **settings):
+        """Measure the time from a reference cavity tune to its first effect on the wavenumber PV with small tuner
+        steps around the current value, and store the summary for this laser. Only while not locked or scanning
+        
+        Args:
+            step(float): Tuner step in percent
+            repeats(int): Number of steps
+            path(str): JSON file to also write the full result to
+            settings: Further keyword arguments of LatencyProbe
+        
+        Return:
+            dict: Latency summary (p50, p95, p99, dead time, ...), see LatencyProbe.run
+        """
+        if self.state != 0:
+            raise RuntimeError("Latency can only be measured while the laser is not locked or scanning")
+        center = self.get_ref_cav_tuner()
+        probe = LatencyProbe(lambda value: self.commands.call("tune_reference_cavity", value, sync=True), self.reader,
+                             center, step=step, repeats=repeats, conversion=self.conversion, verbose=self.verbose,
+                             **settings)
+        result = probe.run()
+        self.reference_cavity_tuner_value = center
+        if path is not None:
+            probe.save(path)
+        summary = {key: value for key, value in result.items() if key != "latencies"}
+        self.config = save_laser_config(self.tag, {"latency": summary})
+        if result["count"]:
+            print(f"Actuation latency of {self.tag}: p50 {result['p50'] * 1000:.0f} ms, p95 {result['p95'] * 1000:.0f} ms, "
+                  f"p99 {result['p99'] * 1000:.0f} ms, dead time {result['dead_time'] * 1000:.0f} ms, "
+                  f"{result['missed']} of {repeats} steps without response")
+        else:
+            print(f"No response to any of {repeats} tuner steps")
+        return result
+
     def hack_reading_rate(self):
-        """Hack the publishing rate of the wavemeter server"""
-        rates = np.linspace(500, 1, 100)
-        effective_rates = np.array([])
-        loop = 0
-        loop_end = 100
-        while loop < loop_end:
-            print(f"In {loop} loop now")
-            for rate in rates:
-                first = self.reader.get_read_value()
-                time.sleep(rate*0.001)
-                second = self.reader.get_read_value()
-                if first == second:
-                    effective_rates = np.append(effective_rates, rate)
-                    break
-                else: pass
-            loop += 1
+        """Report the publishing rate of the wavemeter server, which the reader estimates from the updates it records
+        
+        Returns:
+            float: Mean interval between new wavenumbers in seconds, None until estimated
+            float: Jitter of the interval in seconds, None until estimated
+        """
+        interval, jitter = self.reader.get_publish_rate()
+        if interval is None:
+            print("Publishing rate not estimated yet")
+        else:
+            print(f"Estimated publishing interval: {interval * 1000:.1f} ms, jitter: {jitter * 1000:.1f} ms")
+        return interval, jitter
 
-        unique, counts = np.unique(effective_rates, return_counts=True)
-        most_frequent_index = counts.argmax()
-        most_frequent_number = unique[most_frequent_index]
-        print(f"most frequent reading rate: {most_frequent_number} ms")
-        print(f"potential list: {unique}")
+    def get_stats(self, window=None):
+        """Get rolling statistics of the wavenumber; the RMS deviation is taken from the target while locked or scanning
+        
+        Arg:
+            window(int): Window size in samples; the largest window of the reader if None
+        
+        Return:
+            dict: count, mean, std, min, max, p2p and rms, None before the first sample
+        """
+        target = self.target if self.state == 1 else None
+        return self.reader.get_stats(window, target)
 
     def get_current_wnum(self):
         """Get the current wavenumber
@@ -249,6 +462,7 @@ class LaserControl(ControlLoop):
             print(f"lock function called with state being {self.state}")
         self.target = value
         self.init = 1
+        self.journal.record("lock", target=float(value))
         self.clear_plot()
         if self.tweaking_thread is None:
             self.start_tweaking()
@@ -260,51 +474,69 @@ class LaserControl(ControlLoop):
         self.state = 0
         self.scan = 0
         self.stop_tweaking()
+        self.tag_samples()
+        self.journal.record("unlock")
         print("Unlock triggered")
         self.clear_plot()
 
     def lock_etalon(self):
         """Lock the etalon lock"""
-        self.laser.lock_etalon()
+        self.commands.call("lock_etalon")
 
     def unlock_etalon(self):
         """Unlock the etalon lock"""
-        self.laser.unlock_etalon()
+        self.commands.call("unlock_etalon")
 
     def lock_reference_cavity(self):
         """Lock the reference cavity lock"""
-        self.laser.lock_reference_cavity()
+        self.commands.call("lock_reference_cavity")
 
     def unlock_reference_cavity(self):
         """Unlock the reference cavity lock"""
-        self.laser.unlock_reference_cavity()
+        self.commands.call("unlock_reference_cavity")
 
     def tune_reference_cavity(self, value):
-        """Tune reference cavity tuner to the set value
+        """Queue a reference cavity tune without waiting for it; a pending tune is replaced by this one. Raises the
+        error of the previous tune if it failed
         
         Arg:
             value(float): Target tuner value for reference cavity tuner
+        
+        Return:
+            CommandTicket: Handle to wait for the tune
         """
-        if self.reply is None:
-            self.reply = "something"
-            self.reply = self.laser.tune_reference_cavity(value, sync=True)
-            if self.verbose:
-                print("ref cavity tuned")
+        previous = self.reply
+        if previous is not None and previous.status == "failed":
+            self.reply = None
+            raise previous.error
+        self.reply = self.commands.submit("tune_reference_cavity", value, sync=True)
+        if self.verbose:
+            print("ref cavity tune queued")
+        return self.reply
         
     def tune_etalon(self, value):
-        """Tune reference cavity tuner to the set value and acquire the latest etalon tuner value
+        """Tune etalon tuner to the set value and acquire the latest etalon tuner value
         
         Arg:
-            value(float): Target tuner value for reference cavity tuner
+            value(float): Target tuner value for etalon tuner
+        """
+        self.commands.call("tune_etalon", value)
+        self.etalon_tuner_value = self.laser.get_status()['etalon_tune']
+
+    def get_command_stats(self):
+        """Get the counters and latencies of the laser command executor
+        
+        Return:
+            dict: See LaserCommandExecutor.get_stats
         """
-        self.laser.tune_etalon(value)
-        self.etalon_tuner_value = self.laser.get_full_web_status()['etalon_tune']
+        return self.commands.get_stats()
     
     def get_etalon_tuner(self):
-        """Get current etalon tuner value
+        """Get current etalon tuner value from the status cache
         
         Return:
             float: Current etalon tuner value"""
+        self.etalon_tuner_value = self.laser.get_status()['etalon_tune']
         return self.etalon_tuner_value
 
     def get_ref_cav_tuner(self, tryouts=2):
@@ -318,7 +550,7 @@ class LaserControl(ControlLoop):
         tries = 0
         for tries in range(tryouts):
             try:
-                self.reference_cavity_tuner_value = float(self.laser.get_full_web_status()['cavity_tune'])
+                self.reference_cavity_tuner_value = self.laser.get_status()['cavity_tune']
                 break
             except Exception as e:
                 print(f"Error in getting reference cavity tuner value: {e}")
@@ -353,46 +585,231 @@ class LaserControl(ControlLoop):
         """Update the reference cavity lock status"""        
         self.reference_cavity_lock_status = self.laser.get_reference_cavity_lock_status()
 
-    def start_scan(self, start, end, no_scans, time_per_scan, no_of_passes):
-        self.scan_targets = np.linspace(start, end, no_scans)
-        self.set_tps = time_per_scan
+    def start_scan(self, start, end, no_scans, time_per_scan, no_of_passes, feed_forward=True, wait_for_settle=False,
+                   settle_tolerance=0.00002, settle_hold=0.5, settle_timeout=30.):
+        """Start a linear scan on the tweaking thread
+
+        Args:
+            start(float): First target in cm^-1
+            end(float): Last target in cm^-1
+            no_scans(int): Number of steps per pass
+            time_per_scan(float): Dwell time per step in seconds
+            no_of_passes(int): Number of passes; every other one runs backwards
+            feed_forward(bool): Start every step from the tuner value precomputed from the tuner model instead of a
+                jump with the current conversion
+            wait_for_settle(bool): Count the dwell time of a step only once it has settled, and move on to the next
+                step if it does not settle within settle_timeout; otherwise dwell starts with the step
+            settle_tolerance(float): Distance from the target in cm^-1 within which the wavenumber counts as settled
+            settle_hold(float): Time in seconds the wavenumber has to stay within the tolerance to settle
+            settle_timeout(float): Time in seconds after which a step that has not settled is given up
+        """
+        plan = ScanPlan.linear(start, end, no_scans, time_per_scan, no_of_passes)
+        self.start_scan_plan(plan, feed_forward=feed_forward, validate=False, wait_for_settle=wait_for_settle,
+                             settle_tolerance=settle_tolerance, settle_hold=settle_hold, settle_timeout=settle_timeout)
+
+    def start_scan_plan(self, plan, feed_forward=True, validate=True, scan_id=None, start_pass=0, start_step=0,
+                        **settle):
+        """Run a scan plan on the tweaking thread with the lock and PID of this controller
+
+        Args:
+            plan(ScanPlan): Targets, dwell times and passes
+            feed_forward(bool): Start every step from the tuner value precomputed from the tuner model
+            validate(bool): Check the plan against the current wavenumber and the step guard first
+            scan_id(int): Id of an interrupted scan to continue; a new scan is started and journaled if None
+            start_pass(int): Pass to start from
+            start_step(int): Step of that pass to start from
+            settle: Settling settings of start_scan; those of the plan are used for the ones not given
+
+        Return:
+            float: Estimated duration of the scan in seconds
+        """
+        if validate:
+            plan.validate(self.wnum)
+        settings = dict(plan.settle, **settle)
+        self.wait_for_settle = settings.get("wait_for_settle", False)
+        self.settle_tolerance = settings.get("settle_tolerance", 0.00002)
+        self.settle_hold = settings.get("settle_hold", 0.5)
+        self.settle_timeout = settings.get("settle_timeout", 30.)
+        self.settled_steps = 0
+        self.timed_out_steps = 0
+        self.scan_id = int(time.time()) if scan_id is None else scan_id
+        self.scan_plan = plan
+        self.scan_targets, self.scan_dwells = (values.copy() for values in plan.get_pass(start_pass))
+        self.scan_trajectory = self.plan_scan_trajectory(plan.targets, plan.passes) if feed_forward else None
+        self.scan_step = None
+        self.set_tps = float(plan.dwells[0])
+        step_times = plan.get_step_times(self.settle_model, self.wait_for_settle, self.wnum)
+        if scan_id is None:
+            self.journal.record("scan_start", plan=plan.to_dict(), settle=settings, feed_forward=feed_forward,
+                                scan_id=self.scan_id)
         self.state = 1
         self.scan = 1
-        self.j = 0
-        self.jmax = no_scans
+        self.jmax = len(self.scan_targets)
+        self.j = min(max(int(start_step), 0), self.jmax - 1)
         self.scan_progress = 0.
-        self.total_time = no_scans * time_per_scan
-        self.total_passes = no_of_passes
-        self.current_pass = 0
+        self.total_time = float(step_times[0].sum())
+        self.total_passes = plan.passes
+        self.current_pass = int(start_pass)
         self.scan_restarted = True
         self.start_tweaking()
-    
+        return float(step_times.sum())
+
+    def get_scan_eta(self):
+        """Estimate the time left in the running scan from the dwell times and the settle model
+
+        Return:
+            float: Seconds until the scan is done, None without a running scan
+        """
+        if self.scan != 1 or self.scan_plan is None:
+            return None
+        if self.scan_step is None:
+            return self.scan_plan.estimate(self.settle_model, self.wait_for_settle, self.wnum,
+                                           pass_index=min(self.current_pass, self.total_passes - 1))
+        pass_index, step = self.scan_step
+        return self.scan_plan.estimate(self.settle_model, self.wait_for_settle, pass_index=pass_index, step=step,
+                                       elapsed_in_step=time.time() - self.scan_step_start_time)
+
+    def plan_scan_trajectory(self, targets, passes):
+        """Precompute the tuner values of every step and pass from the calibration of this laser, or from the
+        current conversion without one, anchored at the current tuner value and wavenumber
+
+        Args:
+            targets(np.ndarray): Wavenumbers of the first pass in cm^-1
+            passes(int): Number of passes
+
+        Return:
+            ScanTrajectory: Planned trajectory
+        """
+        calibration = self.config.get("calibration")
+        if calibration and calibration.get("gain"):
+            trajectory = ScanTrajectory.from_calibration(targets, passes, calibration)
+        else:
+            trajectory = ScanTrajectory.from_conversion(targets, passes, self.conversion)
+        trajectory.plan(self.reference_cavity_tuner_value, self.wnum)
+        if self.verbose:
+            print(f"Scan trajectory planned from {trajectory.tuners[0, 0]:.4f} % to {trajectory.tuners[-1, -1]:.4f} %")
+        return trajectory
+
+    def trim_scan_step(self):
+        """Pass the tuner value the finished scan step ended with to the trajectory, so the trim PID applied is
+        carried over to the next steps"""
+        if self.scan_trajectory is None or self.scan_step is None:
+            return
+        trim = self.scan_trajectory.trim(*self.scan_step, self.reference_cavity_tuner_value)
+        if self.verbose:
+            print(f"Scan step {self.scan_step} trimmed by {trim:.5f} %")
+
+    def get_scan_trajectory(self):
+        """Get the tuner model of the running scan
+
+        Return:
+            dict: See ScanTrajectory.get, None without a feed-forward trajectory
+        """
+        if self.scan_trajectory is None:
+            return None
+        return self.scan_trajectory.get()
+
     def stop_scan(self):
         self.scan = 0
         self.state = 0
         self.stop_tweaking()
+        self.tag_samples()
+        self.journal.record("scan_end")
 
     def end_scan(self):
         self.scan = 0
         self.state = 0
         self.scan_progress = self.total_time
         self.current_pass = 0
-    
+        self.tag_samples()
+        self.journal.record("scan_end")
+        if self.settled_steps:
+            # Settle times of this scan make the estimates of the next ones
+            self.config = save_laser_config(self.tag, {"settle": self.settle_model.to_dict()})
+
+    def tag_samples(self, settled=False):
+        """Label the samples recorded from now on with the current scan step, see SCAN_TAG_COLUMNS
+
+        Arg:
+            settled(bool): Whether the current step has settled
+        """
+        if self.scan == 1 and self.scan_step is not None:
+            self.reader.set_tags(self.scan_id, self.scan_step[0], self.scan_step[1], int(settled))
+        else:
+            self.reader.set_tags(0, -1, -1, 0)
+
+    def update_settling(self, now):
+        """Follow whether the current scan step has settled: the wavenumber has to stay within settle_tolerance of
+        the target for settle_hold seconds. Once settled, a step stays settled
+
+        Arg:
+            now(float): Current time
+
+        Return:
+            bool: True if the step has settled
+        """
+        if self.step_settled:
+            return True
+        if abs(self.wnum - self.target) > self.settle_tolerance:
+            self.settle_since = None
+            return False
+        if self.settle_since is None:
+            self.settle_since = now
+        if now - self.settle_since < self.settle_hold:
+            return False
+        self.step_settled = True
+        self.settled_steps += 1
+        self.settle_model.observe(self.scan_step_size, now - self.scan_step_start_time)
+        self.dwell_start_time = now
+        self.tag_samples(settled=True)
+        if self.verbose:
+            print(f"Scan step {self.scan_step} settled after {now - self.scan_step_start_time:.2f} s")
+        return True
+
+    def get_scan_quality(self):
+        """Get the settling counters of the current scan
+
+        Return:
+            dict: scan_id, settled and timed_out steps, and whether the current step has settled
+        """
+        return {"scan_id": self.scan_id, "settled": self.settled_steps, "timed_out": self.timed_out_steps,
+                "step_settled": self.step_settled}
+
     def _do_scan(self):
         try:
+            timed_out = False
             if self.scan_restarted:
-                self.scan_time = self.set_tps
+                self.scan_time = float("inf")
                 self.scan_start_time = time.time()
                 self.scan_restarted = False
             else:
                 now = time.time()
                 time_elapsed = now - self.scan_start_time
-                time_elapsed_ps = now - self.scan_step_start_time
+                settled = self.update_settling(now)
+                if self.wait_for_settle:
+                    # Dwell counts from settling; a step that does not settle in time is given up
+                    time_elapsed_ps = now - self.dwell_start_time if settled else 0.
+                    timed_out = not settled and now - self.scan_step_start_time >= self.settle_timeout
+                else:
+                    time_elapsed_ps = now - self.scan_step_start_time
                 self.scan_time = time_elapsed_ps
                 self.scan_progress = time_elapsed
-            if self.scan_time >= self.set_tps:
+            if timed_out:
+                self.timed_out_steps += 1
+                print(f"Scan step {self.scan_step} did not settle within {self.settle_timeout} s, moving on")
+            if self.scan_time >= self.get_step_dwell() or timed_out:
                 if self.j < self.jmax:
+                    self.trim_scan_step()
+                    previous = self.target if self.scan_step is not None else self.wnum
                     self.target = self.scan_targets[self.j]
+                    self.scan_step_size = self.target - previous
+                    self.journal.record("step", **{"pass": self.current_pass, "step": self.j,
+                                                   "target": float(self.target),
+                                                   "tuner": float(self.reference_cavity_tuner_value)})
+                    self.scan_step = (self.current_pass, self.j)
+                    self.step_settled = False
+                    self.settle_since = None
+                    self.tag_samples()
                     self.init = 1
                     #initialize, and one step forward
                     self.scan_time = 0
@@ -402,6 +819,8 @@ class LaserControl(ControlLoop):
                     print(f"pass:{self.current_pass}")
                     if self.current_pass < self.total_passes:
                         self.scan_targets = np.flip(self.scan_targets)
+                        self.scan_dwells = np.flip(self.scan_dwells)
+                        self.journal.record("pass", **{"pass": self.current_pass})
                         self.j = 0
                         self.scan_progress = 0.
                         self.scan_restarted = True
@@ -410,15 +829,36 @@ class LaserControl(ControlLoop):
         except IndexError:
             self.scan = 0
             self.state = 0
+            self.tag_samples()
+            self.journal.record("scan_end")
 
     def scan_update(self, new_time_ps):
+        """Set the dwell time of every step of the running scan
+
+        Arg:
+            new_time_ps(float): Dwell time per step in seconds
+        """
         self.set_tps = new_time_ps
+        if self.scan_dwells is not None:
+            self.scan_dwells = np.full(len(self.scan_dwells), float(new_time_ps))
+
+    def get_step_dwell(self):
+        """Return:
+            float: Dwell time in seconds of the current scan step
+        """
+        if self.scan_dwells is None or self.scan_step is None:
+            return self.set_tps
+        return float(self.scan_dwells[self.scan_step[1]])
     
     def wavelength_setter(self):
         delta = self.target - self.wnum #how much you would like to tune
         self.delta = delta
-        delta *= self.conversion
-        tuning = self.reference_cavity_tuner_value - delta
+        if self.scan == 1 and self.scan_trajectory is not None and self.scan_step is not None:
+            # Precomputed from the tuner model, PID only trims the residual
+            tuning = self.scan_trajectory.get_tuner(*self.scan_step)
+        else:
+            delta *= self.conversion
+            tuning = self.reference_cavity_tuner_value - delta
         self.tune_reference_cavity(tuning)
         self.reference_cavity_tuner_value = tuning
         self.init = 0
@@ -432,9 +872,24 @@ class LaserControl(ControlLoop):
         if self.verbose:
             print("wavelength set")        
     
+    def get_pid_limits(self):
+        """Return:
+            tuple: Output limits of the PID in its own units that bound the scaled correction to MAX_PID_STEP
+        """
+        limit = self.MAX_PID_STEP * self.NOMINAL_CONVERSION / abs(self.conversion)
+        return -limit, limit
+
     def _pid_control(self):
+        # Saturate the PID, and so stop its integral, where the scaled correction hits the step limit
+        lower, upper = self.get_pid_limits()
+        if (self.pid.lower, self.pid.upper) != (lower, upper):
+            self.pid.set_output_limits(lower, upper)
         error, u = self.pid.update(self.wnum)
         #self.delta = error
+        # Keep the loop gain of the tuned PID parameters where the tuner is more or less sensitive, then bound the
+        # step of the tuner
+        u *= self.conversion / self.NOMINAL_CONVERSION
+        u = min(max(u, -self.MAX_PID_STEP), self.MAX_PID_STEP)
         print(f"tuning={u}")
         tuning = float(self.reference_cavity_tuner_value) - u
         self.tune_reference_cavity(tuning)
@@ -457,19 +912,77 @@ class LaserControl(ControlLoop):
             self.pid.update_kp(float(value))
         except ValueError:
             raise
+        self.record_gains()
 
     def i_update(self, value):
         try:
             self.pid.update_ki(float(value))
         except ValueError:
             raise
+        self.record_gains()
     
     def d_update(self, value):
         try:
             self.pid.update_kd(float(value))
         except ValueError:
             raise
+        self.record_gains()
     
+    def get_startup_gains(self):
+        """Return:
+            dict: The newer of the gains journaled on the controller and those stored by the offline optimizer (see
+            pid_tuner.save_gains), empty if there are neither
+        """
+        journaled = self.journal.get_state()["gains"] or {}
+        stored = self.config.get("pid", {})
+        if not journaled or not stored:
+            return journaled or stored
+        # Gains stored before they carried a time count as older than the journaled ones
+        return stored if (stored.get("time") or 0.) > (journaled.get("time") or 0.) else journaled
+
+    def record_gains(self):
+        """Journal the PID gains, so they are used again after a restart"""
+        self.journal.record("gains", kp=self.pid.kp, ki=self.pid.ki, kd=self.pid.kd)
+
+    def needs_resume(self):
+        """Return:
+            bool: True if the journal ends locked or scanning but no tweaking thread is alive, e.g. after a restart
+            or after the tweaking loop gave up on the laser
+        """
+        if self.journal.get_state()["mode"] == "idle":
+            return False
+        return self.tweaking_thread is None or not self.tweaking_thread.is_alive()
+
+    def resume(self, update_timeout=1.):
+        """Restore the last consistent control state of the journal: lock to its target again, or set the tuner value
+        the interrupted scan step started from and continue the scan from that step with the same scan id. The scan
+        trajectory is anchored at the wavenumber read once that tune took effect
+
+        Arg:
+            update_timeout(float): Maximum time in seconds to wait for a wavenumber update after the tune
+
+        Return:
+            str: Mode restored, "idle", "locked" or "scanning"
+        """
+        state = self.journal.get_state()
+        self.stop_tweaking()
+        if state["mode"] == "locked":
+            self.lock(state["target"])
+        elif state["mode"] == "scanning":
+            scan = state["scan"]
+            if scan["tuner"] is not None:
+                self.commands.call("tune_reference_cavity", scan["tuner"], sync=True)
+                self.reference_cavity_tuner_value = scan["tuner"]
+                time.sleep(self.get_actuation_latency())
+                if self.reader.wait_for_new_value(self.reader.update_count, timeout=update_timeout) is None:
+                    print(f"No wavenumber update within {update_timeout} s after the tune, planning from the last one")
+                self.update()
+            step = scan["step"] if scan["step"] is not None else 0
+            print(f"Resuming scan {scan['scan_id']} at pass {scan['pass']} step {step}")
+            self.start_scan_plan(ScanPlan.from_dict(scan["plan"]), feed_forward=scan["feed_forward"], validate=False,
+                                 scan_id=scan["scan_id"], start_pass=scan["pass"], start_step=step, **scan["settle"])
+        return state["mode"]
+
     def start_tweaking(self):
         print(f"Starting tweaking {self.laser}")
         if self.is_tweaking:
@@ -480,31 +993,97 @@ class LaserControl(ControlLoop):
         self.tweaking_thread = threading.Thread(target=self._tweaking_loop, daemon=True)
         self.tweaking_thread.start()
 
+    def get_actuation_latency(self):
+        """Return:
+            float: Measured time in seconds from a tune being sent to the wavenumber following it (p95, see
+            measure_actuation_latency), 0 if it was never measured
+        """
+        latency = self.config.get("latency", {})
+        return latency.get("p95") or latency.get("p50") or 0.
+
     def update_conversion(self):
-        conversion_change = 1
-        self.old_wnum = self.wnum
-        self.set_current_wnum()        
-        actual_delta = self.wnum - self.old_wnum
-        if abs(actual_delta) < abs(self.delta): self.conversion += conversion_change
-        elif abs(actual_delta) > abs(self.delta): self.conversion -= conversion_change
-        else: pass
-        if self.conversion > 90:
-            raise ValueError           
-        print(f"conversion updated to {self.conversion}")
+        """Feed the tuner value the laser acknowledged and the mean wavenumber read once that tune took effect to the
+        conversion estimator and take its latest estimate. Nothing is fed while a tune is pending or within the
+        actuation latency after it was sent"""
+        reply = self.reply
+        tuner = self.reference_cavity_tuner_value
+        if reply is not None:
+            if not reply.done():
+                return
+            if reply.status == "done":
+                if time.monotonic() - reply.sent < self.get_actuation_latency():
+                    return
+                tuner = reply.args[0]
+        if tuner != self.observed_tuner:
+            self.observed_tuner = tuner
+            self.observed_wnum = (0., 0)
+        total, count = self.observed_wnum
+        self.observed_wnum = (total + self.wnum, count + 1)
+        self.conversion_estimator.observe(tuner, (total + self.wnum) / (count + 1))
+        conversion = self.conversion_estimator.get_conversion()
+        if conversion != self.conversion and self.verbose:
+            print(f"conversion updated to {conversion:.2f}")
+        self.conversion = conversion
+
+    def get_conversion_estimate(self):
+        """Get the online estimate of the conversion between the cavity tuner and the wavenumber
+        
+        Return:
+            dict: See ConversionEstimator.get
+        """
+        return self.conversion_estimator.get()
+
+    def wait_for_next_step(self):
+        """Wait for the next deadline of the fixed-rate loop schedule and count the steps that found no new sample"""
+        self.scheduler.wait()
+        count = self.reader.sample_count
+        if count == self.seen_samples:
+            self.stale_steps += 1
+        self.seen_samples = count
+
+    def set_loop_period(self, period):
+        """Change the period of the tweaking loop; the timing statistics start over
+        
+        Arg:
+            period(float): Loop period in seconds
+        """
+        self.scheduler.set_period(float(period))
+        self.stale_steps = 0
+
+    def get_loop_timing(self):
+        """Get the timing of the tweaking loop
+        
+        Return:
+            dict: See FixedRateScheduler.get_timing, plus stale_steps (steps without a new sample since the last one)
+        """
+        timing = self.scheduler.get_timing()
+        timing["stale_steps"] = self.stale_steps
+        return timing
 
     def _tweaking_loop(self):
         # t0 = self.get_time()
+        self.scheduler.start()
         while self.is_tweaking:
             for t in range(4):
                 try:
                     self.set_current_wnum()
 
-                    self.update_tuner += 1
-                    if self.update_tuner == 5:
+                    # Pushed tuner values are free to read, so they are taken every iteration; without them the
+                    # tuner is read back from the laser every fifth iteration. Neither is done while a queued tune
+                    # has not been applied, as the laser would still report the value from before it
+                    tune_pending = self.reply is not None and not self.reply.done()
+                    pushed = None if tune_pending else self.laser.get_pushed('cavity_tune')
+                    if pushed is not None:
+                        self.reference_cavity_tuner_value = float(pushed)
+                        self.update_tuner = 0
+                    else:
+                        self.update_tuner += 1
+                    if self.update_tuner >= 5 and not tune_pending:
                         before = self.reference_cavity_tuner_value
                         now = self.get_ref_cav_tuner()
                         self.update_tuner = 0
                         print(f"Ref cav updated from {before} to {now}")
+                    self.update_conversion()
 
                     if self.scan == 1:
                         self._do_scan()
@@ -515,7 +1094,6 @@ class LaserControl(ControlLoop):
                         #set the wavelength to the target
                         if self.init == 1:
                             self.wavelength_setter()
-                            self.update_conversion()
                         else:
                             # Simple proportional control
                             self.pid_filter_control(filter=True)
@@ -529,7 +1107,7 @@ class LaserControl(ControlLoop):
                         self.do_conversion()
                     # if self.verbose:
                     #     print("Tweaking loop in progress")
-                    time.sleep(0.1)
+                    self.wait_for_next_step()
                     break
                 except Exception as e:
                     if self.verbose:
@@ -540,6 +1118,8 @@ class LaserControl(ControlLoop):
 
     def stop_tweaking(self):
         self.is_tweaking = False
+        if self.calibration is not None:
+            self.calibration.stop()
         if self.tweaking_thread:
             self.tweaking_thread.join()
             self.tweaking_thread = None
@@ -556,5 +1136,8 @@ class LaserControl(ControlLoop):
     def stop(self):
         """Stop all child threads"""
         self.reader.stop_reading()
+        self.reader.stop_saving()
         self.stop_tweaking()
-        pass
+        self.commands.stop()
+        if self.status_subscriber is not None:
+            self.status_subscriber.stop()
@@ -0,0 +1,217 @@
+import threading
+import time
+from .base import LaserBackend
+
+
+class LaserStatusCache(LaserBackend):
+    """LaserBackend that wraps another one and serves its status from a shared snapshot.
+
+    A snapshot holds the full web status and both lock statuses, fetched together, and is served to every caller
+    for ttl seconds. Concurrent callers with a stale snapshot wait for a single fetch instead of each making one.
+    Tune and lock commands are passed on to the wrapped laser and invalidate the snapshot, so the next read sees
+    their effect. Hit and miss counters show how many round-trips to the laser it saved.
+
+    With a LaserStatusSubscriber, values the laser pushed after the last command are served without any I/O, and
+    a snapshot is only fetched when the subscription has no fresh value."""
+    # Snapshot keys besides the full web status
+    STATUS_KEYS = ("cavity_tune", "etalon_tune", "etalon_lock", "cavity_lock")
+
+    def __init__(self, laser, ttl: float = 0.5, subscriber=None):
+        """Constructor function
+
+        Args:
+            laser(LaserBackend): Laser to wrap
+            ttl(float): Time in seconds a snapshot is served for
+            subscriber(LaserStatusSubscriber): Running subscription to the status the laser pushes
+        """
+        self.laser = laser
+        self.ttl = ttl
+        self.subscriber = subscriber
+        self.invalidated_at = 0.  # time.time() of the last command; pushed values must be newer
+        self.pushes = 0
+        self.snapshot = None
+        self.snapshot_time = None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+        self.fetch_time = 0.  # duration of the last fetch
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+
+    def _fresh(self, max_age):
+        """Return the snapshot if it is younger than max_age, else None"""
+        if self.snapshot is None or time.monotonic() - self.snapshot_time > max_age:
+            return None
+        return self.snapshot
+
+    def get_status(self, max_age: float = None):
+        """Get a status snapshot, fetching a new one if the cached one is too old
+
+        Arg:
+            max_age(float): Maximum age in seconds of the snapshot; the TTL if None, 0 to force a fetch
+
+        Return:
+            dict: 'web' (full web status), 'cavity_tune', 'etalon_tune', 'etalon_lock', 'cavity_lock' and
+            'time' (time.time() of the fetch)
+        """
+        max_age = self.ttl if max_age is None else max_age
+        if max_age > 0:
+            snapshot = self._pushed_snapshot()
+            if snapshot is not None:
+                return snapshot
+        with self._lock:
+            snapshot = self._fresh(max_age)
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+        with self._fetch_lock:
+            # Another caller may have fetched while this one waited
+            with self._lock:
+                snapshot = self._fresh(max_age)
+                if snapshot is not None:
+                    self.hits += 1
+                    return snapshot
+                self.misses += 1
+                generation = self.invalidations
+            start = time.monotonic()
+            try:
+                web = self.laser.get_full_web_status()
+                snapshot = {"web": web,
+                            "cavity_tune": float(web["cavity_tune"]),
+                            "etalon_tune": float(web["etalon_tune"]),
+                            "etalon_lock": self.laser.get_etalon_lock_status(),
+                            "cavity_lock": self.laser.get_reference_cavity_lock_status(),
+                            "time": time.time()}
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                raise
+            with self._lock:
+                self.fetch_time = time.monotonic() - start
+                # A command during the fetch makes this snapshot outdated, so it is not kept
+                if generation == self.invalidations:
+                    self.snapshot = snapshot
+                    self.snapshot_time = start
+            return snapshot
+
+    def _pushed_snapshot(self):
+        """Build a snapshot from pushed values, None unless every field was pushed after the last command"""
+        if self.subscriber is None:
+            return None
+        items = [self.subscriber.get(key, since=self.invalidated_at) for key in self.STATUS_KEYS]
+        if any(item is None for item in items):
+            return None
+        snapshot = {key: value for key, (value, _) in zip(self.STATUS_KEYS, items)}
+        snapshot["cavity_tune"] = float(snapshot["cavity_tune"])
+        snapshot["etalon_tune"] = float(snapshot["etalon_tune"])
+        snapshot["web"] = self.subscriber.get_web_status()
+        snapshot["time"] = min(arrived for _, arrived in items)
+        with self._lock:
+            self.pushes += 1
+        return snapshot
+
+    def get_pushed(self, name: str, default=None):
+        """Get a value the laser pushed after the last command, without any I/O
+
+        Args:
+            name(str): Snapshot key, e.g. 'cavity_tune'
+            default: Returned if there is no such value
+
+        Return:
+            Pushed value, or default
+        """
+        item = self.subscriber.get(name, since=self.invalidated_at) if self.subscriber is not None else None
+        if item is None:
+            return default
+        with self._lock:
+            self.pushes += 1
+        return item[0]
+
+    def invalidate(self):
+        """Drop the snapshot so the next read fetches a new one"""
+        with self._lock:
+            self.snapshot = None
+            self.invalidations += 1
+            self.invalidated_at = time.time()
+
+    def get_stats(self):
+        """Get the cache counters
+
+        Return:
+            dict: hits, pushes (reads served by the subscription), misses (fetches from the laser), errors,
+            invalidations, hit_rate and last fetch_time in seconds
+        """
+        with self._lock:
+            total = self.hits + self.pushes + self.misses
+            return {"hits": self.hits,
+                    "pushes": self.pushes,
+                    "misses": self.misses,
+                    "errors": self.errors,
+                    "invalidations": self.invalidations,
+                    "hit_rate": (self.hits + self.pushes) / total if total else None,
+                    "fetch_time": self.fetch_time}
+
+    def _command(self, method, *args, **kwargs):
+        """Pass a command on to the laser and invalidate the snapshot, also if the command fails"""
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.invalidate()
+
+    def lock_etalon(self):
+        """Lock the etalon lock"""
+        return self._command(self.laser.lock_etalon)
+
+    def unlock_etalon(self):
+        """Unlock the etalon lock"""
+        return self._command(self.laser.unlock_etalon)
+
+    def lock_reference_cavity(self):
+        """Lock the reference cavity lock"""
+        return self._command(self.laser.lock_reference_cavity)
+
+    def unlock_reference_cavity(self):
+        """Unlock the reference cavity lock"""
+        return self._command(self.laser.unlock_reference_cavity)
+
+    def tune_reference_cavity(self, value, sync=True):
+        """Tune the reference cavity tuner
+
+        Args:
+            value(float): Tuner value in percent
+            sync(bool): Wait until the laser has applied it
+        """
+        return self._command(self.laser.tune_reference_cavity, value, sync=sync)
+
+    def tune_etalon(self, value, sync=True):
+        """Tune the etalon tuner
+
+        Args:
+            value(float): Tuner value in percent
+            sync(bool): Wait until the laser has applied it
+        """
+        return self._command(self.laser.tune_etalon, value, sync=sync)
+
+    def get_full_web_status(self):
+        """Return:
+            dict: Full web status from the snapshot
+        """
+        return self.get_status()["web"]
+
+    def get_etalon_lock_status(self):
+        """Return:
+            str: Etalon lock status from the snapshot
+        """
+        return self.get_status()["etalon_lock"]
+
+    def get_reference_cavity_lock_status(self):
+        """Return:
+            str: Reference cavity lock status from the snapshot
+        """
+        return self.get_status()["cavity_lock"]
+
+    def close(self):
+        """Close the wrapped laser"""
+        if hasattr(self.laser, "close"):
+            self.laser.close()
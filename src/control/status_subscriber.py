@@ -0,0 +1,182 @@
+import json
+import logging
+import threading
+import time
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+
+# Keys of the pushed messages to keep, and the snapshot keys of LaserStatusCache they map to
+DEFAULT_FIELDS = {"cavity_tune": "cavity_tune",
+                  "etalon_tune": "etalon_tune",
+                  "etalon_lock": "etalon_lock",
+                  "cavity_lock": "cavity_lock"}
+
+
+class LaserStatusSubscriber:
+    """Background subscriber to the status the M2 web interface pushes over its websocket.
+
+    Keeps one connection open on a child thread and stores the last value of every pushed key with the time it
+    arrived, so readers get the tuner values and lock statuses without any I/O. The connection is reopened with
+    exponential backoff whenever it drops. Values count as fresh only while messages keep arriving."""
+    def __init__(self, address: str, port: int = 8088, path: str = "control.htm", fields=None,
+                 stale_after: float = 2., reconnect_delay: float = 1., max_reconnect_delay: float = 30.,
+                 verbose: bool = False):
+        """Constructor function
+
+        Args:
+            address(str): IP address of the laser
+            port(int): Port of the web interface
+            path(str): Page of the web interface the websocket belongs to
+            fields(dict): Pushed keys to snapshot keys, see DEFAULT_FIELDS
+            stale_after(float): Time in seconds without messages after which values are no longer fresh
+            reconnect_delay(float): First delay in seconds before reconnecting, doubled up to max_reconnect_delay
+            max_reconnect_delay(float): Longest delay in seconds between reconnection attempts
+            verbose(bool): whether to print messages on the terminal
+        """
+        if websocket is None:
+            raise ImportError("The status subscription requires the websocket-client package. "
+                              "You can install it via PyPi as 'pip install websocket-client'")
+        self.url = f"ws://{address}:{port}/{path}"
+        self.fields = dict(DEFAULT_FIELDS if fields is None else fields)
+        self.stale_after = stale_after
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.verbose = verbose
+        self.values = {}  # snapshot key -> (value, time.time() it arrived)
+        self.web_status = {}  # every key pushed so far
+        self.last_message = None
+        self.connected = False
+        self.messages = 0
+        self.reconnects = 0
+        self.errors = 0
+        self.ws = None
+        self.subscriber_thread = None
+        self.is_running = False
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Open the connection on a child thread"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.stop_event.clear()
+        self.subscriber_thread = threading.Thread(target=self._subscriber_loop, daemon=True)
+        self.subscriber_thread.start()
+
+    def _subscriber_loop(self):
+        """Loop to keep the connection open, reconnecting with backoff when it drops"""
+        delay = self.reconnect_delay
+        logging.getLogger("websocket").setLevel(logging.CRITICAL)
+        while self.is_running:
+            self.ws = websocket.WebSocketApp(self.url, on_open=self.on_open, on_message=self.on_message,
+                                             on_error=self.on_error, on_close=self.on_close)
+            messages = self.messages
+            try:
+                self.ws.run_forever()
+            except Exception as e:
+                self.on_error(self.ws, e)
+            self.connected = False
+            if not self.is_running:
+                break
+            if self.messages > messages:
+                delay = self.reconnect_delay
+            if self.verbose:
+                print(f"Status websocket disconnected, reconnecting in {delay:.0f} s")
+            if self.stop_event.wait(delay):
+                break
+            delay = min(2 * delay, self.max_reconnect_delay)
+            self.reconnects += 1
+
+    def on_open(self, ws):
+        """Websocket callback: connection opened"""
+        self.connected = True
+        if self.verbose:
+            print(f"Status websocket connected to {self.url}")
+
+    def on_message(self, ws, message):
+        """Websocket callback: store the known fields of a pushed status message"""
+        now = time.time()
+        try:
+            status = json.loads(message)
+        except ValueError:
+            self.errors += 1
+            return
+        if not isinstance(status, dict):
+            return
+        with self._lock:
+            self.web_status.update(status)
+            for key, name in self.fields.items():
+                if key in status:
+                    self.values[name] = (status[key], now)
+            self.last_message = now
+            self.messages += 1
+
+    def on_error(self, ws, error):
+        """Websocket callback: count errors"""
+        self.errors += 1
+        if self.verbose:
+            print(f"Status websocket error: {error}")
+
+    def on_close(self, ws, close_status_code, close_msg):
+        """Websocket callback: connection closed"""
+        self.connected = False
+
+    def is_fresh(self):
+        """Return:
+            bool: True while connected and messages keep arriving
+        """
+        last = self.last_message
+        return self.connected and last is not None and time.time() - last <= self.stale_after
+
+    def get(self, name: str, since: float = None):
+        """Get the last pushed value of a field
+
+        Args:
+            name(str): Snapshot key of the field, e.g. 'cavity_tune'
+            since(float): time.time() the value must have arrived after, e.g. the last command
+
+        Return:
+            tuple: (value, time it arrived), None if the field is not fresh
+        """
+        if not self.is_fresh():
+            return None
+        with self._lock:
+            item = self.values.get(name)
+        if item is None or (since is not None and item[1] < since):
+            return None
+        return item
+
+    def get_web_status(self):
+        """Return:
+            dict: Every key pushed so far with its last value
+        """
+        with self._lock:
+            return dict(self.web_status)
+
+    def get_stats(self):
+        """Get the state of the subscription
+
+        Return:
+            dict: connected, messages, reconnects, errors and the age in seconds of the last message
+        """
+        last = self.last_message
+        return {"connected": self.connected,
+                "messages": self.messages,
+                "reconnects": self.reconnects,
+                "errors": self.errors,
+                "age": time.time() - last if last is not None else None}
+
+    def stop(self):
+        """Close the connection and catch the subscriber thread"""
+        self.is_running = False
+        self.stop_event.set()
+        if self.ws is not None:
+            self.ws.close()
+        if self.subscriber_thread:
+            self.subscriber_thread.join(timeout=5.)
+            self.subscriber_thread = None
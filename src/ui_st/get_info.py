@@ -13,7 +13,11 @@ control_loop = LaserControl("192.168.1.222", 39933, "LaserLab:wavenumber_1")
 # control_loop.get_conversion()
 # control_loop.update()
 
+time.sleep(10)  # let the reader see enough updates to estimate the rate
 control_loop.hack_reading_rate()
 
+#measure the delay from a cavity tune to the wavenumber PV; results are stored with the laser settings
+# control_loop.measure_actuation_latency(step=0.005, repeats=20, path="latency.json")
+
 # list = np.linspace(100, 0, 20, dtype = int)
 # print(list)
\ No newline at end of file
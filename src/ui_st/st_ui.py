@@ -8,6 +8,9 @@ import plotly.graph_objects as go
 
 sys.path.append('.\\src')
 from control.st_laser_control import LaserControl
+from control.sim_laser import SimulatedSolstis
+from control.scan_plan import ScanPlan
+from control.scan_queue import get_queue
 
 # Streamlit page configuration
 st.set_page_config(
@@ -20,9 +23,10 @@ st.header("Laser Control System")
 sidebar = st.sidebar
 
 # Select which laser to control
-laser_options = ["Laser 1", "Laser 2", "Laser 3", "Laser 4"]
+# "Simulated" runs the control loop against a SimulatedSolstis, without the lab network
+laser_options = ["Laser 1", "Laser 2", "Laser 3", "Laser 4", "Simulated"]
 selected_laser = sidebar.selectbox("Select Laser", laser_options, index=0)
-tag = f"wavenumber_{selected_laser.split(' ')[1]}"
+tag = "wavenumber_sim" if selected_laser == "Simulated" else f"wavenumber_{selected_laser.split(' ')[1]}"
 
 state = st.session_state
 
@@ -59,6 +63,10 @@ initialize_state("dialog_dir", None)
 initialize_state("backup_enable", False)
 initialize_state("backup_name", None)
 initialize_state("backup_dir", None)
+initialize_state("plot_window", "Latest")
+
+# Plot windows in seconds; "Latest" shows the raw points of the plot buffer
+plot_windows = {"Latest": None, "5 min": 300, "1 hour": 3600, "1 day": 86400}
 
 def error_page(description, error):
     """Error page UI when error occurs
@@ -81,6 +89,11 @@ def ins_laser(laser_tag):
     Arg:
         laser_tag(string): Specify which laser to talk to
     """
+    if laser_tag == "wavenumber_sim":
+        sim = SimulatedSolstis(pvname=f"Sim:{laser_tag}")
+        sim.start()
+        return LaserControl(None, None, sim.pv.pvname, verbose=True, acquisition_mode="monitor", source=sim.pv,
+                            laser=sim)
     return LaserControl("192.168.1.222", 39933, f"LaserLab:{laser_tag}", verbose=True)
 
 def patient_netconnect(tryouts=10):
@@ -93,7 +106,9 @@ def patient_netconnect(tryouts=10):
     while state.netcon_tries <= tryouts:
         try:
             if "control_loop" not in state:
-                control_loop = ins_laser(tag)
+                # A queue still scanning from before a reload keeps its controller
+                queue = get_queue(tag)
+                control_loop = queue.control if queue.is_running and queue.control is not None else ins_laser(tag)
             else:
                 control_loop = state.control_loop
             break
@@ -219,7 +234,10 @@ def start_scan():
         st.toast("👿 The start wavenumber is more than $$0.1 cm^{-1}$$ away from current wavenumber")
     else:                 
         if not state.freq_lock_clicked:
-            control_loop.start_scan(state.start_wnum, state.end_wnum, state.no_of_steps, state.time_per_scan, state.no_of_passes)
+            control_loop.start_scan(state.start_wnum, state.end_wnum, state.no_of_steps, state.time_per_scan, state.no_of_passes,
+                                    feed_forward=state.feed_forward, wait_for_settle=state.wait_for_settle,
+                                    settle_tolerance=state.settle_tolerance, settle_hold=state.settle_hold,
+                                    settle_timeout=state.settle_timeout)
             state.scan_button = True
             state.scan_status = ":red[_Scan in Progress_]"
             state.scan = 1
@@ -227,6 +245,25 @@ def start_scan():
         else:
             st.toast("👿 Unlock the wavelength first before starting a scan!")
 
+def start_scan_plan():
+    """Start the uploaded scan plan if the laser frequency is not locked and the plan passes the step guard"""
+    if state.freq_lock_clicked:
+        st.toast("👿 Unlock the wavelength first before starting a scan!")
+        return
+    try:
+        plan = get_uploaded_plan()
+        if plan is None:
+            st.toast("👿 Upload a scan plan first!")
+            return
+        eta = control_loop.start_scan_plan(plan, feed_forward=state.feed_forward)
+    except ValueError as e:
+        st.toast(f"👿 {e}")
+        return
+    state.scan_button = True
+    state.scan_status = ":red[_Scan in Progress_]"
+    state.scan = 1
+    st.toast(f"👀 Scan plan {plan.name} started, about {eta:.0f} seconds")
+
 def stop_scan():
     """Stop the current scan"""
     control_loop.stop_scan()
@@ -252,10 +289,12 @@ def clear_plot():
     """Clear plot"""
     control_loop.clear_plot()
 
-@st.cache_data
 def get_rate():
-    """Get reading rate"""
-    return control_loop.rate
+    """Get the estimated publishing interval of the wavemeter server, or the reading rate until it is estimated"""
+    interval, jitter = control_loop.reader.get_publish_rate()
+    if interval is None:
+        return control_loop.rate, None
+    return round(interval, 3), round(jitter, 3)
 
 def get_cwnum():
     """Get current wavenumber"""
@@ -276,15 +315,18 @@ def open_directory_dialog():
     dialog.Destroy()
     return path
 
-def start_saving(name, path):
-    """Start saving data on teh background
+backup_formats = {"Arrow IPC": ".arrows", "Parquet": ".parquet", "CSV": ".csv"}
+
+def start_saving(name, path, fmt):
+    """Start saving data on the background
     
     Args:
         name(str): Filename
         path(str): Location to save file to
+        fmt(str): Key of backup_formats
     """
     if state.dialog_dir:
-        filename = f"{name}.csv"
+        filename = f"{name}{backup_formats[fmt]}"
         filepath = os.path.join(path, filename)
         control_loop.start_backup_saving(filepath)
         state.backup_enable = True
@@ -300,8 +342,7 @@ def get_reading_thread_status():
     Return:
         str: The status of the reading thread
     """
-    status = control_loop.reader.reading_thread
-    if status is None:
+    if not control_loop.reader.is_reading:
         return ":blue[Reading thread is not on]"
     else: return ":red[Reading thread is on duty]"
 
@@ -311,9 +352,10 @@ def get_saving_status():
     Return:
         str: The status of data saving"""
     directory = control_loop.reader.saving_dir
-    if directory is None:
+    stats = control_loop.reader.get_saving_stats()
+    if directory is None or stats is None:
         return ":blue[Data is not being saved]"
-    else: return f":red[Data is being saved to {directory}]"
+    else: return f":red[Data is being saved to {directory}] (queued: {stats['queue_depth']}, dropped: {stats['dropped']}, delayed: {stats['delayed']})"
 
 def get_tweaking_thread_status():
     """Get the status of the tweaking thread
@@ -326,6 +368,69 @@ def get_tweaking_thread_status():
         return ":blue[Tweaking thread is not on]"
     else: return f":red[Tweaking thread is on duty]"
 
+def get_loop_timing_status():
+    """Get the measured timing of the tweaking loop
+    
+    Returns:
+        str: Target and measured period, jitter and overruns of the tweaking loop
+    """
+    timing = control_loop.get_loop_timing()
+    if timing["period_mean"] is None:
+        return f"Target period {timing['period_target'] * 1000:.0f} ms, not measured yet"
+    return (f"Target period {timing['period_target'] * 1000:.0f} ms, measured {timing['period_mean'] * 1000:.1f} "
+            f"± {timing['period_std'] * 1000:.1f} ms, jitter {timing['jitter_mean'] * 1000:.1f} ms "
+            f"(max {timing['jitter_max'] * 1000:.1f} ms), overruns: {timing['overruns']}, "
+            f"steps without new data: {timing['stale_steps']}")
+
+def get_status_cache_info():
+    """Get the hit/miss counters of the laser status cache
+    
+    Returns:
+        str: Hits, misses and hit rate of the status cache
+    """
+    stats = control_loop.get_status_cache_stats()
+    hit_rate = f"{stats['hit_rate']:.0%}" if stats['hit_rate'] is not None else "-"
+    info = (f"{stats['hits']} hits, {stats['pushes']} pushed, {stats['misses']} round-trips to the laser "
+            f"({hit_rate} saved), last fetch {stats['fetch_time'] * 1000:.0f} ms, errors: {stats['errors']}")
+    subscription = control_loop.get_status_subscription_stats()
+    if subscription is None:
+        return info + ". :blue[No status subscription]"
+    if subscription["connected"]:
+        return info + f". :green[Subscribed] ({subscription['messages']} messages, {subscription['reconnects']} reconnects)"
+    return info + f". :red[Subscription disconnected] ({subscription['reconnects']} reconnects)"
+
+def get_command_info():
+    """Get the counters and latency of the laser command executor
+    
+    Returns:
+        str: Sent, failed and coalesced commands and the command latency
+    """
+    stats = control_loop.get_command_stats()
+    latency = stats["latency"]
+    latency_text = f"latency {latency['mean'] * 1000:.0f} ms (max {latency['max'] * 1000:.0f} ms)" if latency else "no latency yet"
+    return (f"{stats['completed']} done, {stats['failed']} failed, {stats['skipped']} tunes skipped by coalescing, "
+            f"{stats['queue_depth']} queued, {latency_text}")
+
+def start_calibration():
+    """Start the up/down sweep that calibrates the conversion of the reference cavity tuner"""
+    control_loop.get_conversion()
+
+def get_calibration_status():
+    """Get the progress of the cavity calibration and the stored result
+    
+    Returns:
+        str: Progress of a running calibration, or the conversion in use
+    """
+    progress = control_loop.get_calibration_progress()
+    if control_loop.state == 2 and progress is not None:
+        eta = f", {progress['eta']:.0f} s left" if progress['eta'] is not None else ""
+        return f":red[_Calibrating: point {progress['done']}/{progress['total']}{eta}_]"
+    calibration = control_loop.config.get("calibration")
+    if calibration is None:
+        return f":blue[_Not calibrated, conversion {control_loop.conversion:.1f} %/cm⁻¹_]"
+    return (f":green[_Calibrated: conversion {calibration['conversion']:.2f} %/cm⁻¹, "
+            f"hysteresis {calibration['hysteresis'] * 30000:.1f} MHz_]")
+
 def stop_reading_thread():
     """Catch the reading thread"""
     control_loop.stop_reading
@@ -355,7 +460,8 @@ def calculate_progress(progress, total_time):
     percent = round(progress / total_time, 4)
     if percent >= 1:
         percent = 1.
-    etc = round((1 - percent) * total_time, 1)
+    eta = control_loop.get_scan_eta()
+    etc = round(eta, 1) if eta is not None else round((1 - percent) * total_time, 1)
     current_pass = control_loop.current_pass
     current_pass += 1
     progress_text = f"*Pass {current_pass}*: {percent:.2%} % of scan have completed. :blue[_Estimated Time of Completion: {etc} seconds left_]"
@@ -384,21 +490,39 @@ def control_loop_update():
     state.control_loop = control_loop
     control_loop.update()
 
-def loop(plot, dataf_space):
+def draw_stats(stats_space):
+    """Show the rolling noise statistics of the wavenumber in MHz
+    
+    Arg:
+        stats_space(placeholder): Placeholder for the statistics
+    """
+    stats = control_loop.get_stats()
+    if stats is None:
+        return
+    to_mhz = 30000  # 1 cm^-1 is about 30 GHz
+    text = f"Last {stats['count']} samples: σ {stats['std'] * to_mhz:.2f} MHz | peak-to-peak {stats['p2p'] * to_mhz:.2f} MHz"
+    if stats['rms'] is not None:
+        text += f" | RMS from target {stats['rms'] * to_mhz:.2f} MHz"
+    estimate = control_loop.get_conversion_estimate()
+    text += f" | Conversion {estimate['conversion']:.1f} %/cm⁻¹ ({estimate['lower']:.1f} to {estimate['upper']:.1f}, {estimate['updates']} updates)"
+    stats_space.markdown(text)
+
+def loop(plot, dataf_space, stats_space):
     """Loop function that updates the current wavenumber and plot continuously in the while loop
     
     Args:
         plot(placeholder): Placeholder for the plot
         dataf_space(placeholder: Placeholder for the current wavenumber)
+        stats_space(placeholder): Placeholder for the statistics
     """
     try:
-        xtoPlot, ytoPlot = control_loop.get_df_to_plot()
+        xtoPlot, ytoPlot = control_loop.get_df_to_plot(plot_windows[state.plot_window])
         control_loop_update()
         state.c_wnum = get_cwnum()
     except Exception as e:
         error_page("Unable to update laser information.", e)
     # Time series plot
-    if xtoPlot and ytoPlot:
+    if len(xtoPlot) > 0 and len(ytoPlot) > 0:
         fig = go.Figure(data=go.Scatter(x=xtoPlot, y=ytoPlot, mode='lines+markers', marker=dict(size = 8, color='rgba(255,77,1, 1)')), layout=go.Layout(
             xaxis=dict(title="Time(s)"), yaxis=dict(title="Wavenumber (cm^-1)", exponentformat="none")
             ))
@@ -414,6 +538,7 @@ def loop(plot, dataf_space):
         # fig.update_yaxes(exponentformat="none")
         plot.plotly_chart(fig, theme='streamlit', use_container_width=True)
     dataf_space.metric(label="Current Wavenumber", value=state.c_wnum)
+    draw_stats(stats_space)
 
 def scan_settings():
     """Draw UI components for scan settings and expander to show info about scanning"""
@@ -426,6 +551,13 @@ def scan_settings():
     no_of_steps = c1.number_input("No. of Steps", value=5, max_value=500, key="no_of_steps")
     time_per_scan = c2.number_input("Time per Step (sec)", value=2.0, step=1., key="time_per_scan")
     no_of_passes = c1.number_input("No. of Passes", value=1, max_value=10, key="no_of_passes")
+    c2.checkbox("Feed-forward Trajectory", value=True, key="feed_forward",
+                help="Start every step from the tuner value predicted by the calibration, PID only trims the rest")
+    c1.checkbox("Wait for Settling", value=False, key="wait_for_settle",
+                help="Count the time per step only once the wavenumber has stayed within the tolerance for the hold time")
+    c2.number_input("Settle Tolerance (cm^-1)", value=0.00002, step=0.00001, format="%0.5f", key="settle_tolerance")
+    c1.number_input("Settle Hold (sec)", value=0.5, step=0.1, key="settle_hold")
+    c2.number_input("Settle Timeout (sec)", value=30., step=1., key="settle_timeout")
     scan_range = end_wnum - start_wnum
     state.wnum_per_scan = scan_range / no_of_steps
     wnum_to_freq = 30
@@ -456,6 +588,97 @@ def scan_settings():
         if abs(start_wnum - state.c_wnum) >= 0.1:
             st.markdown("👿 :red[_The start wavenumber is more than $$0.1 cm^{-1}$$ away from current wavenumber_]")
 
+def scan_plan_settings():
+    """Draw UI components to upload a scan plan and show its targets and estimated duration"""
+    with st.expander("Scan Plan"):
+        st.markdown("JSON with segments of targets and dwell times, or CSV rows of target[,dwell]; see scan_plan.py")
+        st.file_uploader("Plan File", type=["json", "csv"], key="scan_plan_file")
+        try:
+            plan = get_uploaded_plan()
+            if plan is None:
+                return
+            duration = plan.get_step_times(control_loop.settle_model, current=state.c_wnum).sum()
+            st.markdown(f"{len(plan.targets)} targets from {plan.targets.min():.5f} to {plan.targets.max():.5f} "
+                        f"cm^-1, {plan.passes} pass(es), about :orange-background[{duration:.0f} s]")
+            plan.validate(state.c_wnum)
+        except ValueError as e:
+            st.markdown(f"👿 :red[_{e}_]")
+            return
+        st.button("Start Plan", on_click=start_scan_plan, disabled=state.scan_button)
+
+def get_uploaded_plan():
+    """Return:
+        ScanPlan: Plan of the uploaded plan file, None without one
+    """
+    upload = state.get("scan_plan_file")
+    if upload is None:
+        return None
+    name, ext = os.path.splitext(upload.name)
+    return ScanPlan.parse(upload.getvalue().decode(), ext.lstrip("."), dwell=state.time_per_scan, name=name)
+
+def add_to_queue(kind):
+    """Add the scan of the scan settings or the uploaded plan to the scan queue of this laser
+    
+    Arg:
+        kind(str): "scan" or "plan"
+    """
+    try:
+        if kind == "plan":
+            plan = get_uploaded_plan()
+            if plan is None:
+                st.toast("👿 Upload a scan plan first!")
+                return
+        else:
+            plan = ScanPlan.linear(state.start_wnum, state.end_wnum, state.no_of_steps, state.time_per_scan, state.no_of_passes)
+    except ValueError as e:
+        st.toast(f"👿 {e}")
+        return
+    get_queue(tag).add(plan, name=state.queue_job_name or None, relock=state.queue_relock,
+                       calibrate=state.queue_calibrate, feed_forward=state.feed_forward,
+                       wait_for_settle=state.wait_for_settle, settle_tolerance=state.settle_tolerance,
+                       settle_hold=state.settle_hold, settle_timeout=state.settle_timeout)
+    st.toast("👀 Scan job queued!")
+
+def start_queue():
+    """Run the queued scan jobs of this laser, saving to the selected directory if there is one"""
+    if state.freq_lock_clicked or state.scan_button:
+        st.toast("👿 Unlock the wavelength and stop the scan first!")
+        return
+    queue = get_queue(tag)
+    if state.dialog_dir:
+        queue.directory = state.dialog_dir
+    queue.start(control_loop)
+    st.toast("👀 Scan queue started!")
+
+def scan_queue_settings():
+    """Draw UI components of the scan queue: adding jobs, the jobs with their status, and queue progress"""
+    queue = get_queue(tag)
+    with st.expander("Scan Queue"):
+        c1, c2 = st.columns(2)
+        c1.text_input("Job Name", key="queue_job_name")
+        c2.checkbox("Re-lock Before Scan", value=True, key="queue_relock")
+        c2.checkbox("Calibrate Before Scan", value=False, key="queue_calibrate")
+        c1.button("Add Scan to Queue", on_click=add_to_queue, args=("scan",))
+        c2.button("Add Plan to Queue", on_click=add_to_queue, args=("plan",))
+        for job in queue.get_jobs():
+            j1, j2, j3 = st.columns([4, 1, 1], vertical_alignment="center")
+            error = f" :red[_{job['error']}_]" if job["error"] else ""
+            j1.markdown(f"**{job['name']}** `{job['id']}`: {job['status']}{error}")
+            if job["status"] != "running":
+                j2.button("Remove", key=f"remove_{job['id']}", on_click=queue.remove, args=(job["id"],))
+            if job["status"] in ("failed", "cancelled", "interrupted"):
+                j3.button("Retry", key=f"retry_{job['id']}", on_click=queue.retry, args=(job["id"],))
+        progress = queue.get_progress()
+        current = f", running {progress['current']}" if progress["current"] else ""
+        st.markdown(f"{progress['done']} of {progress['total']} jobs done, {progress['failed']} failed, "
+                    f"{progress['pending']} pending{current}. :blue[_About {progress['eta']:.0f} seconds left_]")
+        q1, q2, q3 = st.columns(3)
+        q1.button("Start Queue", on_click=start_queue, disabled=progress["running"])
+        q2.button("Stop After Job", on_click=queue.stop, disabled=not progress["running"])
+        q3.button("Cancel Queue", on_click=queue.stop, kwargs={"cancel_current": True}, type="primary",
+                  disabled=not progress["running"])
+        q1.button("Clear Done", on_click=queue.clear_finished)
+
 def draw_scanning(placeholder, key):
     """Draws the UI components for scanning buttons and widgets
     
@@ -469,11 +692,40 @@ def draw_scanning(placeholder, key):
     button1.markdown(state.scan_status)
     button2.button("Update Time per Step", on_click=scan_update, disabled=not state.scan_button, key=f"update_tps_{key}")
 
+def resume_control():
+    """Resume the lock or scan the control journal ended with"""
+    try:
+        mode = control_loop.resume()
+    except Exception as e:
+        st.toast(f"👿 Unable to resume: {e}")
+        return
+    if mode == "scanning":
+        state.scan_button = True
+        state.scan_status = ":red[_Scan in Progress_]"
+        state.scan = 1
+    elif mode == "locked":
+        state.freq_lock_clicked = True
+    st.toast(f"👀 Resumed {mode}!")
+
+def draw_resume():
+    """Offer to resume when the control journal ends locked or scanning but the laser is not being tweaked"""
+    if not control_loop.needs_resume():
+        return
+    journal_state = control_loop.journal.get_state()
+    if journal_state["mode"] == "scanning":
+        scan = journal_state["scan"]
+        step = scan["step"] if scan["step"] is not None else 0
+        text = f"Scan {scan['scan_id']} was interrupted at pass {scan['pass'] + 1}, step {step + 1}"
+    else:
+        text = f"Lock to {journal_state['target']} cm^-1 was interrupted"
+    sidebar.warning(text, icon="⚠️")
+    sidebar.button("Resume", on_click=resume_control, type="primary")
+
 def main():
     """Main function that draws UI"""
     patient_netconnect()
     state.netcon_tries = 0
-    sleep_time = get_rate()
+    draw_resume()
 
     tab1, tab2, tab3, tab4 = sidebar.tabs(["Control", "Scan", "Save to", "Thread(s) Info"])
 
@@ -502,6 +754,10 @@ def main():
         ll1.write("**Cavity**")
         ll2.button(label=str(state.cavity_lock), on_click=lock_cavity, key="cavity_lock_button")
         ll3.number_input("a", key="cavity_tuner", label_visibility="collapsed", value=state.cavity_tuner_value, step=0.0001, format="%0.4f", on_change=tune_ref_cav)
+        cal1, cal2 = st.columns([3.7, 1], vertical_alignment="center")
+        cal1.markdown(get_calibration_status())
+        cal2.button("Calibrate", on_click=start_calibration, disabled=state.freq_lock_clicked or control_loop.state == 2,
+                    help="Sweep the cavity tuner up and down to fit the conversion; stored for this laser")
 
         st.header("Wavelength Locker")
         with st.form("Lock Wavenumber", border=False):
@@ -538,12 +794,16 @@ def main():
 
     with tab2:
         scan_settings()
+        scan_plan_settings()
+        scan_queue_settings()
         scan_placeholder = st.empty()
         draw_scanning(scan_placeholder, "create")
         scan_bar = st.progress(0., text="Scan Progress")
     
     with tab3: 
         backup_name = st.text_input("File Name:", placeholder="Enter the file name...")
+        backup_format = st.selectbox("Format", list(backup_formats), index=0, disabled=state.backup_enable,
+                                     help="Arrow IPC and Parquet files are rotated and keep the session settings; CSV is one growing text file")
         #backup_dir = st.text_input("File path:", placeholder="Enter the full path...")
         col1, col2 = st.columns([1.5, 4], vertical_alignment="bottom")
         status_msg = col2.empty()
@@ -556,7 +816,7 @@ def main():
 
             else:
                 status_msg.markdown(":red[_No directory selected._]")
-        if col1.button("Start Saving Data", disabled = state.backup_enable, on_click=start_saving, args=(backup_name, state.dialog_dir,)):
+        if col1.button("Start Saving Data", disabled = state.backup_enable, on_click=start_saving, args=(backup_name, state.dialog_dir, backup_format,)):
             if state.dialog_dir:
                 status_msg.markdown(f":green[_Data automatically being saved to {state.dialog_dir}_]")
             else: status_msg.markdown(f":red[_No filename/directory specified._]")
@@ -580,8 +840,16 @@ def main():
         c21, c22 = st.columns([3, 1], vertical_alignment="bottom")
         c21.markdown(f"Laser Tweaking: {tweaking_status}")
         c22.button("Stop Tweaking", on_click=stop_tweaking_thread)
+        st.markdown(f"Loop timing: {get_loop_timing_status()}")
+        st.markdown(f"Laser status cache: {get_status_cache_info()}")
+        st.markdown(f"Laser commands: {get_command_info()}")
+        period_counts, period_edges = control_loop.get_loop_timing()["period_hist"]
+        if period_counts.sum() > 0:
+            centers = (period_edges[:-1] + period_edges[1:]) / 2 * 1000
+            st.bar_chart({"Period (ms)": centers.round(1), "Steps": period_counts}, x="Period (ms)", y="Steps", height=150)
 
     plot = st.empty()
+    stats_space = st.empty()
     place1, place2, place3, place4, place5, place6 = st.columns([4, 3, 1, 1, 1, 1], vertical_alignment="center")
     dataf_space = place1.empty()
     reading_rate = place2.empty()
@@ -590,13 +858,15 @@ def main():
     place4.button("Clear Plot", on_click=clear_plot)
     if place5.button("Rerun", type="primary"):
         st.rerun()
+    place6.selectbox("Plot Window", list(plot_windows), key="plot_window", label_visibility="collapsed")
 
     while True:
-        reading_rate.metric(label="Reading Rate (s)", value=sleep_time)
+        interval, jitter = get_rate()
+        reading_rate.metric(label="Publishing Interval (s)", value=interval, delta=f"± {jitter} s" if jitter is not None else None, delta_color="off")
         if state.scan == 1:
             total_time = control_loop.total_time
             draw_progress_bar(total_time, scan_bar, scan_placeholder)
-        loop(plot, dataf_space)
+        loop(plot, dataf_space, stats_space)
         time.sleep(0.1)
 
 
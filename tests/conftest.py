@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+
+@pytest.fixture(autouse=True)
+def config_dir(tmp_path, monkeypatch):
+    """Keep per-laser settings, queues and journals of every test in its own directory"""
+    directory = tmp_path / "config"
+    monkeypatch.setenv("EMA_LASER_CONFIG_DIR", str(directory))
+    return directory
+
+
+@pytest.fixture
+def make_control(monkeypatch):
+    """Make LaserControl instances on a simulated Solstis that is stepped by hand; the tweaking thread is not
+    started, so tests drive the control methods themselves"""
+    from control.sim_laser import SimulatedSolstis
+    from control.server_reader import EMAServerReader
+    from control.st_laser_control import LaserControl
+
+    made = []
+
+    def make(**sim_settings):
+        sim = SimulatedSolstis(**sim_settings)
+        sim.advance(0.2)
+        reader = EMAServerReader(sim.pv.pvname, acquisition_mode="monitor", source=sim.pv, time_source="local")
+        control = LaserControl(None, None, sim.pv.pvname, verbose=False, reader=reader, laser=sim)
+        monkeypatch.setattr(control, "start_tweaking", lambda: None)
+        made.append(control)
+        return control
+
+    yield make
+    for control in made:
+        control.stop_reading()
+        control.commands.stop()
+        control.journal.close()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from control.backup_writer import BackupWriter, CsvSink, read_csv_header
+
+
+class FlakySink:
+    def __init__(self):
+        self.failing = True
+        self.attempts = 0
+        self.rows = 0
+
+    def write(self, data):
+        self.attempts += 1
+        if self.failing:
+            raise OSError("disk full")
+        self.rows += len(data["Time"])
+        return 0
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_failing_sink_keeps_a_bounded_backlog_and_retries_by_time():
+    sink = FlakySink()
+    writer = BackupWriter(sink, batch_size=5, flush_interval=0.2, max_retained=10, fsync_policy="never")
+    writer.start()
+    for i in range(50):
+        writer.put(float(i), 1.)
+    time.sleep(0.5)
+
+    assert len(writer.rows) == 10
+    assert writer.dropped == 40
+    assert sink.attempts <= 4  # once per flush interval, not once per sample
+
+    sink.failing = False
+    writer.stop()
+    assert sink.rows == 10
+    assert writer.get_stats()["written"] == 10
+    assert writer.get_stats()["dropped"] == 40
+
+
+def test_csv_sink_appends_only_under_the_same_header(tmp_path):
+    path = str(tmp_path / "data.csv")
+    with open(path, "w") as f:
+        f.write("Time,Wavenumber\n0.0,1.0\n")
+    columns = ["Time", "Wavenumber", "Count"]
+
+    sink = CsvSink(path, columns)
+    sink.write({"Time": [1.], "Wavenumber": [2.], "Count": [1]})
+    sink.close()
+    assert sink.path == str(tmp_path / "data_1.csv")
+    assert read_csv_header(path) == ["Time", "Wavenumber"]
+
+    again = CsvSink(path, columns)
+    again.write({"Time": [2.], "Wavenumber": [3.], "Count": [2]})
+    again.close()
+    assert again.path == sink.path
+    with open(sink.path) as f:
+        assert len(f.read().splitlines()) == 3  # one header
+
+
+def test_every_sample_is_written_or_counted_as_dropped_with_concurrent_producers():
+    sink = FlakySink()
+    writer = BackupWriter(sink, max_queue=20, batch_size=5, flush_interval=0.01, max_retained=30,
+                          fsync_policy="never")
+    writer.start()
+    producers = [threading.Thread(target=lambda: [writer.put(float(i), 1.) for i in range(5000)]) for _ in range(4)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    sink.failing = False
+    writer.stop()
+
+    stats = writer.get_stats()
+    assert stats["dropped"] > 0
+    assert stats["written"] + stats["dropped"] == 20000
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from control.calibration import CavityCalibration, fit_calibration, sweep_points
+from control.server_reader import EMAServerReader
+from control.sim_laser import SimulatedSolstis
+
+
+def test_fit_separates_gain_offset_and_hysteresis():
+    tuners, directions = sweep_points(50., 1., 6, cycles=2)
+    rng = np.random.default_rng(1)
+    wnums = 12500. - (tuners - 50.) / 60. + directions * 2e-4 / 2 + rng.normal(0., 1e-6, len(tuners))
+    result = fit_calibration(tuners, wnums, directions)
+
+    assert result["conversion"] == pytest.approx(60., rel=1e-3)
+    assert result["offset"] == pytest.approx(12500., abs=1e-5)
+    assert result["hysteresis"] == pytest.approx(2e-4, abs=3 * result["hysteresis_error"])
+    assert result["points"] == 24
+
+
+def test_fit_needs_both_directions():
+    tuners = np.linspace(49.5, 50.5, 5)
+    with pytest.raises(ValueError):
+        fit_calibration(tuners, 12500. - tuners / 60., np.ones(5))
+
+
+def test_sweep_waits_for_updates_of_a_source_slower_than_the_polls():
+    sim = SimulatedSolstis(publish_interval=0.15, latency=0.05, latency_jitter=0., response_time=0.03,
+                           command_time=0., hysteresis=2e-4, drift=0.)
+    reader = EMAServerReader(sim.pv.pvname, reading_frequency=0.02, source=sim.pv, time_source="local")
+    sim.start()
+    reader.start_reading()
+    try:
+        calibration = CavityCalibration(sim.tune_reference_cavity, reader, 50., span=1., points=3, discard=1,
+                                        average=2)
+        result = calibration.run()
+    finally:
+        reader.stop_reading()
+        sim.stop()
+
+    assert result["points"] == 6
+    assert result["conversion"] == pytest.approx(60., rel=0.02)
+    assert result["hysteresis"] == pytest.approx(2e-4, abs=5e-5)
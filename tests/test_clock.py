@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from control.clock import ClockService, LocalOffsetSource, PVOffsetSource, make_offset_source
+
+
+class FailingSource:
+    def get_offset(self):
+        raise OSError("no server")
+
+
+class StampedPV:
+    def __init__(self, offset):
+        self.offset = offset
+        self.timestamp = None
+
+    def get(self):
+        self.timestamp = time.time() + self.offset
+
+
+def test_first_sync_steps_to_the_offset():
+    clock = ClockService(LocalOffsetSource(5.))
+    assert clock.sync()
+    assert clock.get_offset() == pytest.approx(5., abs=1e-3)
+    assert clock.now() - time.time() == pytest.approx(5., abs=1e-3)
+
+
+def test_later_offsets_are_smoothed_and_slewed():
+    source = LocalOffsetSource(1.)
+    clock = ClockService(source, smoothing=0.5, max_slew=0.001)
+    clock.sync()
+    source.offset = 3.
+    clock.sync()
+    anchor_offset, anchor_mono, target = clock.state
+    assert target == pytest.approx(2., abs=1e-3)
+    # At most max_slew seconds per second towards the target, and never past it
+    assert clock._applied_offset(anchor_mono + 10.) == pytest.approx(anchor_offset + 0.01)
+    assert clock._applied_offset(anchor_mono + 1e4) == target
+
+
+def test_now_never_runs_backwards_when_the_offset_drops():
+    source = LocalOffsetSource(1.)
+    clock = ClockService(source)
+    clock.sync()
+    source.offset = -10.
+    stamps = []
+    for _ in range(100):
+        clock.sync()
+        stamps.append(clock.now())
+    assert all(later >= earlier for earlier, later in zip(stamps, stamps[1:]))
+
+
+def test_failed_sync_keeps_the_offset_and_counts_the_error():
+    clock = ClockService(FailingSource())
+    assert not clock.sync()
+    assert clock.sync_errors == 1
+    assert not clock.synced
+    assert clock.get_offset() == 0.
+
+
+def test_offset_sources():
+    assert PVOffsetSource(StampedPV(2.)).get_offset() == pytest.approx(2., abs=1e-3)
+    assert make_offset_source("local").get_offset() == 0.
+    with pytest.raises(ValueError):
+        make_offset_source("gps")
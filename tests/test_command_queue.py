@@ -0,0 +1,76 @@
+import threading
+
+from control.command_queue import LaserCommandExecutor
+
+
+class BlockingLaser:
+    """Laser whose first tune blocks until released"""
+    def __init__(self):
+        self.release = threading.Event()
+        self.tunes = []
+
+    def tune_reference_cavity(self, value):
+        if not self.tunes:
+            self.tunes.append(value)
+            self.release.wait(5.)
+            return value
+        self.tunes.append(value)
+        return value
+
+
+def started_executor():
+    laser = BlockingLaser()
+    executor = LaserCommandExecutor(laser)
+    executor.start()
+    first = executor.submit("tune_reference_cavity", 1.)
+    while first.status != "sent":
+        pass
+    return laser, executor
+
+
+def test_queued_tunes_are_coalesced_to_the_newest():
+    laser, executor = started_executor()
+    replaced = executor.submit("tune_reference_cavity", 2.)
+    newest = executor.submit("tune_reference_cavity", 3.)
+    assert replaced.status == "superseded" and replaced.superseded_by is newest
+
+    laser.release.set()
+    assert newest.wait(5.)
+    executor.stop()
+    assert laser.tunes == [1., 3.]
+    assert executor.get_stats()["skipped"] == 1
+
+
+def test_call_raises_when_the_superseding_tune_times_out():
+    laser, executor = started_executor()
+    errors = []
+
+    def call():
+        try:
+            executor.call("tune_reference_cavity", 2., timeout=0.2)
+        except TimeoutError as e:
+            errors.append(e)
+
+    caller = threading.Thread(target=call)
+    caller.start()
+    while executor.get_stats()["queue_depth"] == 0:
+        pass
+    executor.submit("tune_reference_cavity", 3.)
+    caller.join()
+    laser.release.set()
+    executor.stop()
+    assert len(errors) == 1
+
+
+def test_call_returns_the_result_of_the_superseding_tune():
+    laser, executor = started_executor()
+    result = []
+    caller = threading.Thread(target=lambda: result.append(executor.call("tune_reference_cavity", 2., timeout=5.)))
+    caller.start()
+    while executor.get_stats()["queue_depth"] == 0:
+        pass
+    executor.submit("tune_reference_cavity", 3.)
+    laser.release.set()
+    caller.join()
+    executor.stop()
+    assert result == [3.]
@@ -0,0 +1,96 @@
+import json
+
+from control.control_journal import ControlJournal, journal_path
+
+
+def gains_of(state):
+    return {name: state["gains"][name] for name in ("kp", "ki", "kd")}
+
+
+def scan_journal(path):
+    journal = ControlJournal(path)
+    journal.record("gains", kp=10., ki=0.5, kd=0.)
+    journal.record("scan_start", plan={"segments": []}, settle={"wait_for_settle": True}, feed_forward=True,
+                   scan_id=7)
+    journal.record("step", **{"pass": 0, "step": 4, "target": 1.5, "tuner": 50.2})
+    journal.record("pass", **{"pass": 1})
+    journal.record("step", **{"pass": 1, "step": 0, "target": 1.5, "tuner": 50.3})
+    journal.close()
+    return journal
+
+
+def test_replay_restores_the_last_scan_step():
+    path = journal_path("test")
+    scan_journal(path)
+
+    state = ControlJournal(path).get_state()
+    assert state["mode"] == "scanning"
+    assert gains_of(state) == {"kp": 10., "ki": 0.5, "kd": 0.}
+    assert state["target"] == 1.5
+    assert state["scan"]["scan_id"] == 7
+    assert (state["scan"]["pass"], state["scan"]["step"], state["scan"]["tuner"]) == (1, 0, 50.3)
+    assert state["scan"]["settle"] == {"wait_for_settle": True}
+
+
+def test_pass_flip_without_step_resumes_at_the_start_of_the_pass():
+    path = journal_path("test")
+    journal = ControlJournal(path)
+    journal.record("scan_start", plan={}, scan_id=1)
+    journal.record("step", **{"pass": 0, "step": 2, "target": 1., "tuner": 50.})
+    journal.record("pass", **{"pass": 1})
+    journal.close()
+
+    scan = ControlJournal(path).get_state()["scan"]
+    assert (scan["pass"], scan["step"]) == (1, None)
+
+
+def test_torn_last_line_is_skipped():
+    path = journal_path("test")
+    scan_journal(path)
+    with open(path, "a") as f:
+        f.write('{"event": "step", "pass": 1, "st')
+
+    journal = ControlJournal(path)
+    assert journal.torn == 1
+    assert journal.get_state()["scan"]["tuner"] == 50.3
+
+
+def test_end_of_scan_and_unlock_go_idle():
+    path = journal_path("test")
+    journal = ControlJournal(path)
+    journal.record("lock", target=2.)
+    assert journal.get_state()["mode"] == "locked"
+    journal.record("scan_start", plan={}, scan_id=1)
+    journal.record("scan_end")
+    assert journal.get_state()["mode"] == "idle"
+    assert journal.get_state()["scan"] is None
+    journal.close()
+
+
+def test_opening_compacts_to_one_snapshot():
+    path = journal_path("test")
+    scan_journal(path)
+
+    before = ControlJournal(path).get_state()
+    with open(path) as f:
+        lines = f.readlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["event"] == "snapshot"
+    assert ControlJournal(path).get_state() == before
+
+
+def test_growing_journal_is_compacted_when_idle():
+    path = journal_path("test")
+    journal = ControlJournal(path, max_bytes=200)
+    journal.record("scan_start", plan={"segments": [{"targets": list(range(20)), "dwell": 1.}]}, scan_id=1)
+    for step in range(5):
+        journal.record("step", **{"pass": 0, "step": step, "target": float(step), "tuner": 50.})
+    with open(path) as f:
+        assert len(f.readlines()) > 1  # not while scanning
+    journal.record("scan_end")
+    journal.record("gains", kp=1., ki=0., kd=0.)
+    journal.close()
+    with open(path) as f:
+        lines = f.readlines()
+    assert len(lines) <= 2
+    assert gains_of(ControlJournal(path).get_state()) == {"kp": 1., "ki": 0., "kd": 0.}
@@ -0,0 +1,50 @@
+import time
+
+import numpy as np
+import pytest
+
+from control.command_queue import CommandTicket
+from control.conversion_estimator import ConversionEstimator
+
+
+def test_rls_follows_the_slope_of_settled_moves():
+    estimator = ConversionEstimator(initial=60., settle_samples=3)
+    rng = np.random.default_rng(0)
+    tuner = 50.
+    for i in range(40):
+        tuner += 0.01 if i % 2 == 0 else -0.007
+        wnum = 1. - tuner / 80.
+        updated = [estimator.observe(tuner, wnum + rng.normal(0., 1e-6)) for _ in range(4)]
+        assert updated[:2] == [False, False]
+    result = estimator.get()
+    assert result["conversion"] == pytest.approx(80., rel=0.01)
+    assert result["lower"] < result["conversion"] < result["upper"]
+
+
+def test_out_of_range_estimates_keep_the_last_valid_conversion():
+    estimator = ConversionEstimator(initial=60., valid_range=(10., 200.))
+    for _ in range(20):
+        estimator.add_pair(0.01, 1e-6)  # almost flat: conversion far above the range
+    assert estimator.get()["estimate"] > 200.
+    assert estimator.get_conversion() == 60.
+
+
+def test_conversion_is_observed_on_the_acknowledged_tune_after_the_latency(make_control):
+    control = make_control()
+    control.config["latency"] = {"p50": 0.2, "p95": 10.}
+    ticket = CommandTicket("tune_reference_cavity", (50.1,), {})
+    control.reply = ticket
+
+    control.update_conversion()
+    assert control.conversion_estimator.last_tuner is None  # pending
+
+    ticket.sent = time.monotonic()
+    ticket._finish("done")
+    control.update_conversion()
+    assert control.conversion_estimator.last_tuner is None  # within the latency
+
+    ticket.sent -= 10.
+    control.reference_cavity_tuner_value = 49.  # the commanded value has not been read back
+    control.update_conversion()
+    assert control.conversion_estimator.last_tuner == 50.1
+    assert control.observed_tuner == 50.1
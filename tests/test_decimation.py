@@ -0,0 +1,37 @@
+import numpy as np
+
+from control.decimation import DecimationPyramid
+
+
+def filled_pyramid(n=2345):
+    rng = np.random.default_rng(0)
+    t = np.arange(n) * 0.1
+    y = np.cumsum(rng.normal(size=n))
+    pyramid = DecimationPyramid(factors=(1, 10, 100), capacity=10000)
+    for ti, yi in zip(t, y):
+        pyramid.append(ti, yi)
+    return pyramid, t, y
+
+
+def test_buckets_match_brute_force_including_the_partial_one():
+    pyramid, t, y = filled_pyramid()
+    factor, (times, low, high, mean) = pyramid.query_buckets(t[0], t[-1], 300)
+
+    assert factor == 10
+    edges = np.arange(0, len(y), factor)
+    np.testing.assert_allclose(times, t[edges])
+    np.testing.assert_allclose(low, np.minimum.reduceat(y, edges))
+    np.testing.assert_allclose(high, np.maximum.reduceat(y, edges))
+    np.testing.assert_allclose(mean, np.add.reduceat(y, edges) / np.diff(np.append(edges, len(y))))
+
+
+def test_query_keeps_the_extremes_and_stays_within_the_budget():
+    pyramid, t, y = filled_pyramid()
+    x, values = pyramid.query(t[0], t[-1], 100)
+    assert len(x) <= 100
+    assert values.min() == y.min()
+    assert values.max() == y.max()
+
+    # A short range is served raw
+    x, values = pyramid.query(t[100], t[150], 100)
+    np.testing.assert_allclose(values, y[100:151])
@@ -0,0 +1,41 @@
+import pytest
+
+from control.latency_probe import LatencyProbe, summarize_latencies
+from control.server_reader import EMAServerReader
+from control.sim_laser import SimulatedSolstis
+
+
+def test_summary_skips_steps_without_response():
+    summary = summarize_latencies([0.1, float("nan"), 0.3, 0.2], [0.01, 0.03])
+    assert (summary["count"], summary["missed"]) == (3, 1)
+    assert summary["p50"] == pytest.approx(0.2)
+    assert summary["dead_time"] == pytest.approx(0.1)
+    assert summary["command_p50"] == pytest.approx(0.02)
+
+
+def test_updates_are_timed_by_their_source_time_stamps():
+    probe = LatencyProbe(None, None, 50.)
+    # Polls 0.01 s and 0.08 s after the publishes, on a source clock 100 s behind the reader's
+    assert probe._update_time(200.01, 100.) == pytest.approx(200.01)
+    assert probe._update_time(200.33, 100.25) == pytest.approx(200.26)
+    assert probe._update_time(200.4, None) == 200.4
+
+
+def test_probe_measures_the_simulated_latency_to_the_first_changed_update():
+    # The source publishes slower than the reader polls; a poll sees an update up to 0.1 s late
+    sim = SimulatedSolstis(publish_interval=0.15, latency=0.2, latency_jitter=0., response_time=0.005,
+                           command_time=0., drift=0.)
+    reader = EMAServerReader(sim.pv.pvname, reading_frequency=0.1, source=sim.pv, time_source="local")
+    sim.start()
+    reader.start_reading()
+    try:
+        probe = LatencyProbe(sim.tune_reference_cavity, reader, 50., step=0.05, repeats=6, baseline=3, settle=2)
+        result = probe.run()
+    finally:
+        reader.stop_reading()
+        sim.stop()
+
+    assert result["missed"] == 0
+    # The response is the first update published after the latency, at most one publish interval later
+    assert result["dead_time"] >= 0.19
+    assert result["max"] <= 0.2 + 0.15 + 0.02
@@ -0,0 +1,65 @@
+import pytest
+
+from control.pid_controller import PIDController
+
+
+def test_clamping_stops_the_integral_while_saturated():
+    pid = PIDController(1., 1., 0., 0., output_limits=(-2., 2.))
+    pid.step(0., -1., None)
+    outputs = [pid.step(0., -1., 0.5) for _ in range(20)]
+    assert outputs[1:] == [2.] * 19
+    assert pid.integral == pytest.approx(1.)
+    # Out of saturation as soon as the error turns
+    assert pid.step(0., 1., 0.5) < 0.
+
+
+def test_back_calculation_winds_the_integral_back():
+    pid = PIDController(1., 1., 0., 0., output_limits=(-2., 2.), back_calculation=1.)
+    pid.step(0., -5., None)
+    for _ in range(50):
+        pid.step(0., -5., 0.1)
+    assert pid.integral < 5.
+
+
+def test_derivative_acts_on_the_measurement_through_the_filter():
+    pid = PIDController(0., 0., 1., 0., derivative_filter=1.)
+    pid.step(0., 0., None)
+    assert pid.step(10., 0., 1.) == 0.  # no kick when the setpoint jumps
+    assert pid.step(10., -1., 1.) == pytest.approx(0.5)  # half of the raw derivative for tf = dt
+
+
+def test_slew_rate_bounds_the_change_of_the_output():
+    pid = PIDController(1., 0., 0., 0., slew_rate=1.)
+    assert pid.step(0., -1., None) == 1.
+    assert pid.step(0., -10., 0.5) == 1.5
+
+
+def test_gain_change_is_bumpless_for_an_absolute_output():
+    pid = PIDController(2., 1., 0., 0.)
+    pid.update(-1.)
+    _, before = pid.update(-1.)
+    pid.update_kp(5.)
+    assert pid.step(0., -1., 0.) == pytest.approx(before)
+
+
+def test_gain_change_leaves_the_integral_of_an_incremental_output():
+    pid = PIDController(2., 1., 0., 0., incremental=True)
+    pid.update(-1.)
+    pid.update(-1.)
+    integral = pid.integral
+    pid.update_kp(5.)
+    assert pid.integral == integral
+    # The increment follows the new gain right away instead of carrying an offset into every later step
+    assert pid.step(0., 0., 0.) == pytest.approx(integral)
+
+
+def test_step_limit_bounds_the_scaled_tuner_step(make_control):
+    control = make_control()
+    control.conversion = 4 * control.NOMINAL_CONVERSION
+    control.target = control.wnum + 1.
+    control.pid.update_setpoint(control.target)
+    control.pid.new_loop()
+    tuner = control.reference_cavity_tuner_value
+    control._pid_control()
+    assert abs(control.reference_cavity_tuner_value - tuner) == pytest.approx(control.MAX_PID_STEP)
+    assert control.pid.upper == pytest.approx(control.MAX_PID_STEP / 4)
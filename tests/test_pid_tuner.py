@@ -0,0 +1,61 @@
+import math
+
+import pytest
+
+from control.config import load_laser_config
+from control.pid_tuner import CavityModel, choose, pareto_front, save_gains, search, simulate
+
+
+def scores(name, settling_time, overshoot, rms, in_window):
+    return {"kp": name, "ki": 0., "kd": 0., "settling_time": settling_time, "overshoot": overshoot, "rms": rms,
+            "in_window": in_window}
+
+
+def hand_made_results():
+    return [scores("fast", 1., 0.1, 1., 0.9),
+            scores("gentle", 2., 0., 1., 0.9),
+            scores("worse", 2., 0.1, 2., 0.8),  # beaten by fast on every score
+            scores("tight", math.inf, 0., 0.5, 0.5),
+            scores("tied", 2., 0., 1., 0.8)]  # beaten by gentle on in_window only
+
+
+def test_pareto_front_keeps_the_non_dominated_sets_by_settling_time():
+    front = pareto_front(hand_made_results())
+    assert [r["kp"] for r in front] == ["fast", "gentle", "tight"]
+    assert pareto_front([]) == []
+    # Fewer objectives leave fewer trade-offs
+    assert [r["kp"] for r in pareto_front(hand_made_results(), {"settling_time": False})] == ["fast"]
+
+
+def test_choose_follows_the_weights():
+    front = pareto_front(hand_made_results())
+    assert choose(front, {"rms": 1.})["kp"] == "tight"
+    assert choose(front, {"settling_time": 1.})["kp"] == "fast"
+    assert choose(front, {"overshoot": 1., "settling_time": 0.1})["kp"] == "gentle"
+    assert choose([]) is None
+
+
+def test_simulated_lock_needs_feedback_for_a_wrong_conversion():
+    model = CavityModel(conversion_error=0.2, noise=0., drift=0.)
+    assert simulate(0., 0., 0., model)["settling_time"] == math.inf
+    result = simulate(40., 0.8, 0., model, trace=True)
+    assert result["settling_time"] < 2.
+    assert abs(result["errors"][-1]) <= 2e-5
+    # With the right conversion the feed-forward jump alone settles
+    exact = CavityModel(conversion_error=0., noise=0., drift=0., resolution=0.)
+    assert simulate(0., 0., 0., exact)["settling_time"] < 1.
+
+
+def test_search_scores_every_combination_in_process():
+    results = search(CavityModel(), [10., 40.], [0.8], [0.], steps=(0.01,), seeds=1, duration=2., workers=1)
+    assert [(r["kp"], r["ki"], r["kd"]) for r in results] == [(10., 0.8, 0.), (40., 0.8, 0.)]
+
+
+def test_save_gains_stores_gains_scores_and_model():
+    model = CavityModel.from_config({"conversion": 70., "latency": {"p50": 0.2}})
+    assert (model.conversion, model.dead_time) == (70., 0.2)
+    save_gains("test", scores(30., 1., 0.001, 1e-5, 0.9), model)
+
+    pid = load_laser_config("test")["pid"]
+    assert (pid["kp"], pid["scores"]["rms"]) == (30., 1e-5)
+    assert pid["model"]["conversion"] == pytest.approx(70.)
@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+import pytest
+
+from control.replay_source import ReplaySource, get_run_interval
+from control.server_reader import EMAServerReader
+
+
+def write_recording(tmp_path, times, wnums):
+    path = str(tmp_path / "recording.csv")
+    with open(path, "w") as f:
+        f.write("Time,Wavenumber\n")
+        for t, wnum in zip(times, wnums):
+            f.write(f"{t},{wnum}\n")
+    return path
+
+
+def test_replay_puts_every_sample_with_its_recorded_time_stamp(tmp_path):
+    times = 1000. + np.arange(20) * 0.05
+    wnums = 12500. + np.arange(20) * 1e-5
+    source = ReplaySource(write_recording(tmp_path, times, wnums), speed=None)
+    received = []
+    source.add_callback(lambda pvname, value, timestamp: received.append((timestamp, value)))
+    source.start()
+    assert source.wait_done(5.)
+
+    np.testing.assert_allclose([t for t, _ in received], times)
+    np.testing.assert_allclose([value for _, value in received], wnums)
+    assert source.get_progress() == 1.
+
+
+def test_replay_runs_at_the_given_speed_and_loops_forward_in_time(tmp_path):
+    times = np.arange(11) * 0.1
+    source = ReplaySource(write_recording(tmp_path, times, np.ones(11)), speed=10., loop=True)
+    received = []
+    source.add_callback(lambda pvname, value, timestamp: received.append(timestamp))
+    start = time.monotonic()
+    source.start()
+    while len(received) < 22:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+    source.stop()
+
+    assert 0.15 <= elapsed < 1.
+    # The second loop continues one sample interval after the end of the first
+    np.testing.assert_allclose(received[11:22], times + 1.1)
+
+
+def test_replayed_session_feeds_the_reader_with_the_recorded_time_stamps(tmp_path):
+    times = 1000. + np.arange(10) * 0.1
+    wnums = 12500. + np.arange(10) * 1e-5
+    source = ReplaySource(write_recording(tmp_path, times, wnums), speed=None)
+    reader = EMAServerReader(source.pvname, acquisition_mode="monitor", source=source, time_source="local",
+                             timestamps="source")
+    reader.start_reading()
+    source.start()
+    assert source.wait_done(5.)
+    reader.stop_reading()
+
+    assert reader.update_count == 10
+    assert reader.get_latest_update()[:2] == (times[-1], wnums[-1])
+
+
+def test_run_interval_is_the_median_time_per_sample():
+    times = np.array([0., 0.3, 0.5, 0.6])
+    counts = np.array([3, 2, 1, 4])
+    assert get_run_interval("runs.csv", times, counts) == pytest.approx(0.1)
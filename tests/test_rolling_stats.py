@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from control.rolling_stats import RollingStats, RollingWindow
+
+
+def test_windows_match_numpy_at_every_sample():
+    rng = np.random.default_rng(0)
+    # Wavemeter-like values: large offset, small changes at the resolution
+    x = np.round(12500. + np.cumsum(rng.normal(0., 1e-4, 700)), 5)
+    stats = RollingStats(windows=(10, 100))
+    target = 12500.
+    for i, value in enumerate(x):
+        stats.add(value)
+        for size, result in stats.get_all(target).items():
+            window = x[max(0, i + 1 - size):i + 1]
+            assert result["count"] == len(window)
+            assert result["mean"] == pytest.approx(window.mean(), abs=1e-9)
+            assert result["std"] == pytest.approx(window.std(), abs=1e-8)
+            assert (result["min"], result["max"]) == (window.min(), window.max())
+            assert result["rms"] == pytest.approx(np.sqrt(np.mean((window - target) ** 2)), abs=1e-8)
+
+
+def test_empty_and_cleared_windows():
+    stats = RollingStats(windows=(5,))
+    assert stats.get() is None
+    stats.add(1.)
+    assert stats.get()["rms"] is None
+    stats.clear()
+    assert stats.get() is None
+    with pytest.raises(ValueError):
+        RollingWindow(0)
@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pytest
+
+from control.scan_plan import ScanPlan, SettleModel
+
+
+def test_segments_are_joined_without_repeating_the_shared_target():
+    plan = ScanPlan.from_dict({"segments": [{"start": 1., "end": 1.002, "steps": 3, "dwell": 2.},
+                                            {"start": 1.002, "end": 1.005, "step": 0.0015, "dwell": [1., 3., 4.]},
+                                            {"center": 1.01, "span": 0.002, "steps": 3, "dwell": 5.}],
+                               "passes": 2, "name": "resonance"})
+    np.testing.assert_allclose(plan.targets, [1., 1.001, 1.002, 1.0035, 1.005, 1.009, 1.01, 1.011])
+    np.testing.assert_allclose(plan.dwells, [2., 2., 2., 3., 4., 5., 5., 5.])
+    assert (plan.passes, plan.name) == (2, "resonance")
+    restored = ScanPlan.from_dict(plan.to_dict())
+    np.testing.assert_array_equal(restored.targets, plan.targets)
+    np.testing.assert_array_equal(restored.get_pass(1)[1], plan.dwells[::-1])
+
+
+def test_csv_rows_take_the_default_dwell():
+    plan = ScanPlan.parse("target,dwell\n# comment\n1.0,2\n1.001,\n", "csv", dwell=5.)
+    np.testing.assert_allclose(plan.targets, [1., 1.001])
+    np.testing.assert_allclose(plan.dwells, [2., 5.])
+    with pytest.raises(ValueError):
+        ScanPlan.parse("1.0\n", "csv")
+
+
+def test_load_names_json_plans_after_the_file(tmp_path):
+    path = tmp_path / "night.json"
+    path.write_text(json.dumps({"segments": [{"targets": [1., 1.001], "dwell": 1.}]}))
+    assert ScanPlan.load(str(path)).name == "night"
+
+
+def test_validate_rejects_large_steps():
+    plan = ScanPlan.linear(1., 1.002, 3, 1.)
+    plan.validate(current=1.)
+    with pytest.raises(ValueError, match="First target"):
+        plan.validate(current=2.)
+    with pytest.raises(ValueError, match="Step 1"):
+        ScanPlan([1., 1.5], [1., 1.]).validate()
+    with pytest.raises(ValueError):
+        ScanPlan([1., 1.001], [1., 0.]).validate()
+
+
+def test_step_times_add_the_settle_time_and_give_up_at_the_timeout():
+    model = SettleModel(base=1., per_wnum=1000.)
+    plan = ScanPlan([1., 1.001, 1.004], [2., 2., 2.], passes=2, settle={"settle_timeout": 4.})
+    times = plan.get_step_times(model, wait_for_settle=True, current=1.)
+    # Steps of 0, 1e-3 and 3e-3 cm^-1 settle in 1, 2 and 4 s; the last one reaches the timeout
+    np.testing.assert_allclose(times, [[3., 4., 4.], [3., 4., 4.]])
+    assert plan.estimate(model, True, 1., pass_index=1, step=1, elapsed_in_step=1.) == pytest.approx(7.)
+    np.testing.assert_allclose(plan.get_step_times(model, wait_for_settle=False), 2.)
+
+
+def test_settle_model_fits_the_observed_steps():
+    model = SettleModel(min_points=3)
+    for step in (0.001, 0.002, 0.004):
+        model.observe(-step, 0.5 + 200. * step)
+    base, per_wnum = model.get()
+    assert (base, per_wnum) == (pytest.approx(0.5), pytest.approx(200.))
+    assert SettleModel.from_dict(model.to_dict()).get() == (pytest.approx(0.5), pytest.approx(200.))
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from control.scan_plan import ScanPlan
+from control.scan_queue import ScanJobQueue, CANCELLED
+
+
+class FakeCalibration:
+    """Calibration that runs until it is stopped"""
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class FakeControl:
+    """Controller whose scans run until they are stopped"""
+    def __init__(self):
+        self.scan = 0
+        self.is_tweaking = False
+        self.tweaking_thread = None
+        self.unlocks = 0
+        self.saving = False
+        self.calibration = None
+
+    def calibrate(self):
+        self.calibration = FakeCalibration()
+        self.calibration.stopped.wait()
+        return None
+
+    def start_backup_saving(self, path, fmt):
+        self.saving = True
+
+    def stop_backup_saving(self):
+        self.saving = False
+
+    def start_scan_plan(self, plan, **settings):
+        self.scan = 1
+
+    def stop_scan(self):
+        self.scan = 0
+
+    def stop_tweaking(self):
+        pass
+
+    def unlock(self):
+        self.unlocks += 1
+
+
+def wait_until(condition, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_cancelled_scan_releases_the_laser(tmp_path):
+    queue = ScanJobQueue("test", directory=str(tmp_path))
+    job_id = queue.add(ScanPlan.linear(1., 1.001, 3, 1.), relock=False)
+    control = FakeControl()
+    queue.start(control)
+    wait_until(lambda: control.scan == 1)
+
+    queue.stop(cancel_current=True)
+    job = queue.get_jobs()[0]
+    assert (job["id"], job["status"]) == (job_id, CANCELLED)
+    assert control.unlocks == 1
+    assert not control.saving
+
+
+def test_start_rejects_another_controller_while_running(tmp_path):
+    queue = ScanJobQueue("test", directory=str(tmp_path))
+    queue.add(ScanPlan.linear(1., 1.001, 3, 1.), relock=False)
+    control = FakeControl()
+    queue.start(control)
+    wait_until(lambda: control.scan == 1)
+
+    queue.stop()
+    with pytest.raises(RuntimeError):
+        queue.start(FakeControl())
+    queue.start(control)
+    assert queue.is_running
+    queue.stop(cancel_current=True)
+
+
+def test_cancel_stops_a_running_calibration(tmp_path):
+    queue = ScanJobQueue("test", directory=str(tmp_path))
+    queue.add(ScanPlan.linear(1., 1.001, 3, 1.), relock=False, calibrate=True)
+    control = FakeControl()
+    queue.start(control)
+    wait_until(lambda: control.calibration is not None)
+
+    stopper = threading.Thread(target=queue.stop, kwargs={"cancel_current": True}, daemon=True)
+    stopper.start()
+    stopper.join(5.)
+    assert not stopper.is_alive()
+    assert queue.get_jobs()[0]["status"] == CANCELLED
+    assert control.unlocks == 2  # before calibrating and on release
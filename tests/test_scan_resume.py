@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from control.pid_tuner import save_gains
+from control.scan_plan import ScanPlan
+
+
+def model_wnum(trajectory, tuner, direction):
+    """Wavenumber the tuner model of a trajectory gives for a tuner value on a hysteresis branch"""
+    return (trajectory.offset + trajectory.gain * (tuner - trajectory.center)
+            + direction * trajectory.hysteresis / 2)
+
+
+def test_resume_in_odd_pass_plans_the_targets_of_that_pass(make_control):
+    control = make_control()
+    start = control.wnum
+    plan = ScanPlan.linear(start, start + 0.004, 5, 1., passes=3)
+    control.start_scan_plan(plan, validate=False, scan_id=1, start_pass=1, start_step=2)
+
+    assert control.current_pass == 1
+    assert control.j == 2
+    np.testing.assert_allclose(control.scan_targets, plan.targets[::-1])
+    trajectory = control.scan_trajectory
+    for j, target in enumerate(control.scan_targets):
+        tuner = trajectory.get_tuner(1, j)
+        assert model_wnum(trajectory, tuner, trajectory.directions[1, j]) == pytest.approx(target, abs=1e-9)
+
+
+def test_resume_continues_the_journaled_scan(make_control):
+    control = make_control()
+    start = control.wnum
+    plan = ScanPlan.linear(start, start + 0.004, 5, 1., passes=2)
+    control.start_scan_plan(plan)
+    scan_id = control.scan_id
+    control.journal.record("pass", **{"pass": 1})
+    control.journal.record("step", **{"pass": 1, "step": 3, "target": float(plan.targets[1]), "tuner": 50.01})
+
+    assert control.resume() == "scanning"
+    assert control.scan_id == scan_id
+    assert (control.current_pass, control.j) == (1, 3)
+    assert control.reference_cavity_tuner_value == 50.01
+    assert control.scan_targets[control.j] == plan.targets[1]
+
+
+def test_resume_anchors_the_trajectory_after_the_journaled_tune(make_control):
+    control = make_control()
+    start = control.wnum
+    plan = ScanPlan.linear(start, start + 0.004, 5, 1.)
+    control.start_scan_plan(plan)
+    tuner = control.scan_trajectory.get_tuner(0, 2)
+    control.journal.record("step", **{"pass": 0, "step": 2, "target": float(plan.targets[2]), "tuner": tuner})
+    control.journal.close()
+
+    # Restart with the laser moved away from the journaled tuner value
+    restarted = make_control()
+    sim = restarted.laser.laser
+    sim.tune_reference_cavity(50.5, sync=False)
+    sim.advance(1.)
+    restarted.update()
+    restarted.reference_cavity_tuner_value = 50.5
+    restarted.config["latency"] = {"p95": 0.4}
+    sim.start()
+    try:
+        assert restarted.resume() == "scanning"
+    finally:
+        sim.stop()
+
+    assert restarted.wnum == pytest.approx(plan.targets[2], abs=5e-5)
+    trajectory = restarted.scan_trajectory
+    np.testing.assert_allclose(trajectory.tuners[0], control.scan_trajectory.tuners[0], atol=3e-3)
+
+
+def test_startup_takes_the_newer_of_journaled_and_optimized_gains(make_control):
+    control = make_control()
+    control.pid.update_kp(12.)
+    control.record_gains()
+    control.journal.close()
+    assert make_control().pid.kp == 12.
+
+    save_gains(control.tag, {"kp": 30., "ki": 1., "kd": 0.})
+    restarted = make_control()
+    assert (restarted.pid.kp, restarted.pid.ki) == (30., 1.)
+    restarted.pid.update_kp(20.)
+    restarted.record_gains()
+    assert make_control().pid.kp == 20.
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from control.scan_trajectory import ScanTrajectory
+
+
+def test_plan_hits_every_target_on_the_branch_of_its_move():
+    targets = np.linspace(1., 1.004, 5)
+    trajectory = ScanTrajectory(targets, 2, gain=-1. / 60., hysteresis=2e-4, center=50.)
+    tuners = trajectory.plan(50., 0.999)
+
+    assert tuners.shape == (2, 5)
+    # Wavenumbers rise in the first pass, so the tuner moves down, and fall in the second; the turn repeats the last
+    # target and stays on its branch
+    np.testing.assert_array_equal(trajectory.directions, [[-1.] * 5, [-1.] + [1.] * 4])
+    for p in range(2):
+        wnums = (trajectory.offset + trajectory.gain * (tuners[p] - trajectory.center)
+                 + trajectory.directions[p] * trajectory.hysteresis / 2)
+        np.testing.assert_allclose(wnums, trajectory.get_pass_targets(p), rtol=0., atol=1e-12)
+    np.testing.assert_allclose(trajectory.get_pass_targets(1), targets[::-1])
+
+
+def test_plan_is_anchored_to_the_current_tuner_and_wavenumber():
+    trajectory = ScanTrajectory([1.001], 1, gain=-1. / 60.)
+    trajectory.plan(40., 1.)
+    assert trajectory.get_tuner(0, 0) == pytest.approx(40. - 0.001 * 60.)
+
+
+def test_trim_carries_over_to_the_next_steps():
+    trajectory = ScanTrajectory.from_conversion(np.linspace(1., 1.003, 4), 1, 60.)
+    tuners = trajectory.plan(50., 1.).copy()
+
+    assert trajectory.trim(0, 0, tuners[0, 0] + 0.01) == pytest.approx(0.01)
+    assert trajectory.get_tuner(0, 1) == pytest.approx(tuners[0, 1] + 0.01)
+    # The trim of a later step is what PID added on top of the carried bias
+    assert trajectory.trim(0, 1, tuners[0, 1] + 0.015) == pytest.approx(0.005)
+    assert trajectory.get()["bias"] == pytest.approx(0.015)
+
+
+def test_model_needs_a_gain():
+    with pytest.raises(ValueError):
+        ScanTrajectory([1.], 1, gain=0.)
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from control.scheduler import FixedRateScheduler
+
+
+def test_deadlines_do_not_drift_with_the_time_spent_in_the_loop():
+    period = 0.02
+    scheduler = FixedRateScheduler(period)
+    scheduler.start()
+    start = scheduler.next_deadline - period
+    for _ in range(25):
+        time.sleep(0.6 * period)  # loop body
+        assert scheduler.wait()
+    # A plain sleep(period) would have taken 1.6 periods per tick
+    assert time.monotonic() - start == pytest.approx(25 * period, abs=period)
+
+    timing = scheduler.get_timing()
+    assert (timing["ticks"], timing["overruns"], timing["missed"]) == (25, 0, 0)
+    assert timing["period_mean"] == pytest.approx(period, abs=0.2 * period)
+    assert timing["period_hist"][0].sum() == 24
+    assert timing["jitter_hist"][0].sum() == 25
+
+
+def test_overrun_skips_the_missed_deadlines_and_keeps_the_grid():
+    period = 0.05
+    scheduler = FixedRateScheduler(period)
+    scheduler.start()
+    start = scheduler.next_deadline - period
+    time.sleep(3.5 * period)
+    assert not scheduler.wait()
+
+    timing = scheduler.get_timing()
+    assert (timing["overruns"], timing["missed"]) == (1, 2)
+    # The next deadline is still on start + k * period
+    assert (scheduler.next_deadline - start) / period == pytest.approx(4., abs=1e-6)
+    assert scheduler.wait()
+
+
+def test_set_period_clears_the_statistics():
+    scheduler = FixedRateScheduler(0.01)
+    scheduler.wait()
+    scheduler.set_period(0.02)
+    assert scheduler.get_timing()["ticks"] == 0
+    assert scheduler.get_timing()["period_hist"][1][-1] == pytest.approx(0.06)
+    with pytest.raises(ValueError):
+        scheduler.set_period(0.)
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from control.change_filter import ChangeFilter, expand_runs
+from control.replay_source import ReplaySource
+from control.server_reader import EMAServerReader
+
+
+class ListSink:
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+        return 0
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get(self, column):
+        return np.concatenate([data[column] for data in self.data])
+
+
+def external_reader():
+    reader = EMAServerReader("test", acquisition_mode="external", time_source="local", change_only=True)
+    reader.start_reading()
+    return reader
+
+
+def test_run_length_records_rebuild_the_polled_timeline():
+    times = np.arange(8) * 0.1
+    values = np.array([1., 1., 1., 2., 2., 1., 1., 1.])
+    change_filter = ChangeFilter()
+    runs = [closed for closed in (change_filter.add(t, v)[1] for t, v in zip(times, values)) if closed is not None]
+    runs.append(change_filter.current())
+    run_times, run_values, counts = map(np.array, zip(*runs))
+
+    assert counts.tolist() == [3, 2, 3]
+    rebuilt_times, rebuilt_values = expand_runs(run_times, run_values, counts, 0.1)
+    np.testing.assert_allclose(rebuilt_times, times)
+    np.testing.assert_array_equal(rebuilt_values, values)
+
+
+def test_split_closes_the_run_and_the_next_repeat_starts_a_new_one():
+    change_filter = ChangeFilter()
+    change_filter.add(0., 1.)
+    change_filter.add(0.1, 1.)
+    assert change_filter.split() == (0., 1., 2)
+    assert change_filter.split() is None
+    assert change_filter.add(0.2, 1.) == (False, None)
+    assert change_filter.current() == (0.2, 1., 1)
+    assert change_filter.add(0.3, 2.) == (True, (0.2, 1., 1))
+
+
+def test_a_saved_run_never_spans_two_tags():
+    reader = external_reader()
+    reader.set_tag_columns(("Step",))
+    sink = ListSink()
+    reader.start_saving(None, sink=sink)
+    reader.record(0., 1.)
+    reader.record(0.1, 1.)
+    reader.set_tags(1)
+    reader.set_tags(1)  # unchanged tags do not split the run
+    reader.record(0.2, 1.)
+    reader.record(0.3, 1.)
+    reader.record(0.4, 2.)
+    reader.set_tags(2)
+    reader.stop_saving()
+
+    assert sink.get("Time").tolist() == [0., 0.2, 0.4]
+    assert sink.get("Count").tolist() == [2, 2, 1]
+    assert sink.get("Step").tolist() == [0, 1, 1]
+    assert reader.update_count == 2
+    with pytest.raises(ValueError):
+        reader.set_tags(1, 2)
+
+
+def test_repeats_are_saved_as_counts_and_kept_out_of_memory():
+    reader = external_reader()
+    sink = ListSink()
+    reader.start_saving(None, sink=sink)
+    for i, wnum in enumerate([1., 1., 1., 2.]):
+        reader.record(i * 0.1, wnum)
+
+    assert reader.sample_count == 4
+    assert reader.update_count == 2
+    assert reader.wait_for_new_value(1, timeout=0.) == 2
+    assert reader.get_latest_update()[1:] == (2., None)
+    assert reader.get_stats()["count"] == 2
+    assert reader.get_stats()["mean"] == 1.5
+    assert len(reader.get_plot_data()[0]) == 2
+    reader.stop_saving()
+    assert sink.get("Count").tolist() == [3, 1]
+    assert sink.get("Wavenumber").tolist() == [1., 2.]
+
+
+def test_polls_faster_than_the_source_count_only_its_updates():
+    reader = external_reader()
+    # Polled every 0.1 s from a source publishing every second, the second time with the same value
+    for i in range(20):
+        reader.record(i * 0.1, 1., source_time=float(i // 10))
+
+    assert reader.sample_count == 20
+    assert reader.update_count == 2
+    assert reader.wait_for_new_value(2, timeout=0.) is None
+    assert reader.get_latest_update()[2] == 1.
+
+
+def test_publish_rate_follows_source_time_stamps_not_polls():
+    reader = external_reader()
+    # Polled every 0.1 s from a source publishing every 0.3 s, once with an unchanged value
+    for i in range(60):
+        published = (i // 3) * 0.3
+        reader.record(i * 0.1, 1. if i < 30 else 1. + (i // 3) % 2, source_time=published)
+
+    mean, _ = reader.get_publish_rate()
+    assert abs(mean - 0.3) < 1e-9
+
+
+def test_replay_expands_saved_runs(tmp_path):
+    path = str(tmp_path / "runs.csv")
+    with open(path, "w") as f:
+        f.write("Time,Wavenumber,Count\n0.0,1.0,3\n0.3,2.0,2\n0.5,1.0,1\n")
+
+    source = ReplaySource(path, speed=None)
+    np.testing.assert_allclose(source.times, [0., 0.1, 0.2, 0.3, 0.4, 0.5])
+    np.testing.assert_array_equal(source.wnums, [1., 1., 1., 2., 2., 1.])
+    assert len(ReplaySource(path, interval=0.05)) == 6
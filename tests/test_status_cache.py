@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from control.status_cache import LaserStatusCache
+
+
+class CountingLaser:
+    """Laser whose status fetches take fetch_time and are counted"""
+    def __init__(self, fetch_time=0.):
+        self.fetch_time = fetch_time
+        self.fetches = 0
+        self.cavity_tune = 50.
+        self.failing = False
+
+    def get_full_web_status(self):
+        self.fetches += 1
+        time.sleep(self.fetch_time)
+        if self.failing:
+            raise ConnectionError("laser not reachable")
+        return {"cavity_tune": self.cavity_tune, "etalon_tune": 40.}
+
+    def get_etalon_lock_status(self):
+        return "on"
+
+    def get_reference_cavity_lock_status(self):
+        return "on"
+
+    def tune_reference_cavity(self, value, sync=True):
+        self.cavity_tune = value
+
+
+def test_snapshot_is_served_for_the_ttl():
+    laser = CountingLaser()
+    cache = LaserStatusCache(laser, ttl=0.2)
+    for _ in range(5):
+        assert cache.get_status()["cavity_tune"] == 50.
+    assert cache.get_status(max_age=0)["cavity_lock"] == "on"  # forced
+    time.sleep(0.25)
+    cache.get_status()
+
+    stats = cache.get_stats()
+    assert laser.fetches == 3
+    assert (stats["hits"], stats["misses"]) == (4, 3)
+    assert stats["hit_rate"] == pytest.approx(4 / 7)
+
+
+def test_concurrent_callers_share_one_fetch():
+    laser = CountingLaser(fetch_time=0.1)
+    cache = LaserStatusCache(laser, ttl=1.)
+    threads = [threading.Thread(target=cache.get_status) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert laser.fetches == 1
+    assert cache.get_stats()["hits"] == 7
+
+
+def test_commands_invalidate_the_snapshot():
+    laser = CountingLaser()
+    cache = LaserStatusCache(laser, ttl=10.)
+    cache.get_status()
+    cache.tune_reference_cavity(51.)
+    assert cache.get_status()["cavity_tune"] == 51.
+    assert laser.fetches == 2
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_snapshot_fetched_during_a_command_is_not_kept():
+    laser = CountingLaser(fetch_time=0.1)
+    cache = LaserStatusCache(laser, ttl=10.)
+    fetching = threading.Thread(target=cache.get_status)
+    fetching.start()
+    time.sleep(0.05)
+    cache.tune_reference_cavity(51.)
+    fetching.join()
+    assert cache.snapshot is None
+
+
+def test_failed_fetch_is_counted_and_raised():
+    laser = CountingLaser()
+    laser.failing = True
+    cache = LaserStatusCache(laser)
+    with pytest.raises(ConnectionError):
+        cache.get_status()
+    assert cache.get_stats()["errors"] == 1
+    assert cache.snapshot is None
@@ -0,0 +1,66 @@
+import json
+import time
+
+import pytest
+
+from control.status_cache import LaserStatusCache
+
+pytest.importorskip("websocket")
+from control.status_subscriber import LaserStatusSubscriber  # noqa: E402
+
+
+class NoFetchLaser:
+    def get_full_web_status(self):
+        raise AssertionError("status fetched although it was pushed")
+
+
+def connected_subscriber(**settings):
+    subscriber = LaserStatusSubscriber("127.0.0.1", **settings)
+    subscriber.on_open(None)
+    return subscriber
+
+
+def push(subscriber, **status):
+    subscriber.on_message(None, json.dumps(status))
+
+
+def test_pushed_fields_are_kept_with_their_arrival_time():
+    subscriber = connected_subscriber()
+    push(subscriber, cavity_tune=50.5, wavelength=800.)
+    subscriber.on_message(None, "not json")
+
+    value, arrived = subscriber.get("cavity_tune")
+    assert value == 50.5
+    assert arrived <= time.time()
+    assert subscriber.get("etalon_tune") is None
+    assert subscriber.get("cavity_tune", since=arrived + 1.) is None
+    assert subscriber.get_web_status() == {"cavity_tune": 50.5, "wavelength": 800.}
+    assert (subscriber.get_stats()["messages"], subscriber.get_stats()["errors"]) == (1, 1)
+
+
+def test_values_go_stale_without_messages_or_connection():
+    subscriber = connected_subscriber(stale_after=0.1)
+    push(subscriber, cavity_tune=50.5)
+    assert subscriber.is_fresh()
+    time.sleep(0.15)
+    assert subscriber.get("cavity_tune") is None
+
+    push(subscriber, cavity_tune=50.6)
+    subscriber.on_close(None, None, None)
+    assert not subscriber.is_fresh()
+
+
+def test_cache_serves_pushed_values_until_a_command():
+    subscriber = connected_subscriber()
+    cache = LaserStatusCache(NoFetchLaser(), subscriber=subscriber)
+    push(subscriber, cavity_tune=50.5, etalon_tune=40., etalon_lock="on", cavity_lock="on")
+    assert cache.get_status()["cavity_tune"] == 50.5
+    assert cache.get_pushed("etalon_lock") == "on"
+    assert cache.get_stats()["pushes"] == 2
+
+    # Values pushed before a command do not show its effect yet
+    cache.invalidate()
+    assert cache.get_pushed("cavity_tune", default=None) is None
+    time.sleep(0.01)
+    push(subscriber, cavity_tune=51., etalon_tune=40., etalon_lock="on", cavity_lock="on")
+    assert cache.get_status()["cavity_tune"] == 51.